@@ -9,23 +9,145 @@ Copyright 2015, Michael Weinstein, Daniel Cohn laboratory and UCLA Collaboratory
 This program is free to use but if I don't know that you are using it, please e-mail me to let me know that you are.
 My e-mail address: michael (dot) weinstein (at) ucla (dot) edu
 '''
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import datetime
+import glob
+import gzip
+import hashlib
+import html
+import io
+import itertools
+import json
+import ntpath
+import os
+import queue
+import re
+import shlex
+import shutil
+import socket
+import sqlite3
+import struct
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+try:  #only needed for drawing images ourselves (--render), so everything else works without it
+    import numpy
+except ImportError:
+    numpy = None
+
+class IGVError(Exception):  #raised when IGV cannot be reached or will not do what it was told.  The commandline program reports it and stops, while another program using this one as a module (import autoIGV) can catch it and carry on with its next job
+    pass
+
+class IGVStopped(IGVError):  #raised when the user (or the error policy) chose to stop after a problem, so that it is never mistaken for something worth reconnecting and retrying
+    pass
+
+#patterns used on every line of the list or every answer from IGV, compiled once here rather than on every call
+humanchrpattern = re.compile(r'^chr(?=(\d+|X|Y|M|MT):)', re.IGNORECASE)  #a chr in front of a human chromosome
+chrpattern = re.compile(r'^chr', re.IGNORECASE)
+humanlocuspattern = re.compile(r'^(\d+|X|Y|M|MT):', re.IGNORECASE)  #a human chromosome, which IGV wants with chr in front
+locuspattern = re.compile(r'\S+(\:\d+)')  #a contig name and a position
+positionpattern = re.compile(r'\d+')
+rangepattern = re.compile(r'(\d+)(-(\d+))?')
+allelepattern = re.compile(r'[/|]')  #what separates the alleles in a VCF genotype
+bampattern = re.compile(r'.*\.bam$')
+unsafepattern = re.compile(r'[^\w.\-]')  #characters that do not belong in a file name
+genomeerrorpattern = re.compile(r'^ERROR\W*?Could not locate genome', re.IGNORECASE)
+directoryerrorpattern = re.compile(r'^ERROR\W*?directory.+?does not exist', re.IGNORECASE)
+errorpattern = re.compile(r'^ERROR\W*?(\w+?)', re.IGNORECASE)
+
 def checkargs():  #subroutine for validating commandline arguments
-    import argparse #loads the required library for reading the commandline
-    import os  #imports the library we will need to check if the file exists
     parser = argparse.ArgumentParser()
     parser.add_argument ("-f", "--file", help = "Specify the file containing the loci and bam file paths.")  #tells the parser to look for -f and stuff after it and call that the filename
     parser.add_argument ("-d", "--directory", help = "Specify the directory for output (a subdirectory will be created for this session)")
     parser.add_argument ("-p", "--prefsfile", help = "Specify an alternate default preferences file.")
     parser.add_argument ("-g", "--genome", help = "Specify the genome to use.")
-    parser.add_argument ("-o", "--host", help = "Specify a host.")
-    parser.add_argument ("-r", "--port", help = "Specify a port to use.")
+    parser.add_argument ("-o", "--host", help = "Specify a host.  May be repeated (along with -r) to drive a pool of IGV instances.", action = "append")
+    parser.add_argument ("-r", "--port", help = "Specify a port to use.  May be repeated (along with -o) to drive a pool of IGV instances.", action = "append")
     parser.add_argument ("-m", "--mode", help = "Specify imaging mode.")
     parser.add_argument ("-nc", "--nocollapse", help = "Do not collapse images.", action = "store_true")
+    parser.add_argument ("-c", "--compile", help = "Compile the run into an IGV batch script and either submit it to IGV in one shot (submit) or just write it for running with igv.sh -b (write).", choices = ["submit", "write"])
+    parser.add_argument ("-l", "--loadonce", help = "Load each BAM file only once for all of its single photos, visiting its loci in chromosome order.", action = "store_true")
+    parser.add_argument ("-t", "--reusetracks", help = "Keep the tracks IGV already has loaded for the next group photo and only load or remove the ones that differ.", action = "store_true")
+    parser.add_argument ("--groupbytracks", help = "Reorder group photos so that lines with the same BAM files are taken together (implies --reusetracks).", action = "store_true")
+    parser.add_argument ("--cluster", help = "Photograph loci with the same BAM files that start within this many bases of each other together, as split panels in one image.", type = int)
+    parser.add_argument ("--mergeclusters", help = "Show each cluster as one region covering all of its loci instead of split panels (use with --cluster).", action = "store_true")
+    parser.add_argument ("--lookahead", help = "Number of lines to check for multiple BAM files when deciding the imaging mode (default 1000, use 0 with -m to skip the check entirely).", type = int, default = 1000)
+    parser.add_argument ("--checkthreads", help = "Number of threads to use for checking every BAM file and its index before the run starts (default 16, use 0 to check each file when it first comes up instead).", type = int, default = 16)
+    parser.add_argument ("--pipeline", help = "Keep up to this many commands in flight on each IGV connection instead of waiting for each one to finish (default 0, off).", type = int, default = 0)
+    parser.add_argument ("--metrics", help = "Time every command sent to IGV and write the results next to the images as json or prometheus (text format).", choices = ["json", "prometheus"])
+    parser.add_argument ("--live", help = "Show how fast images are being taken and how busy IGV is on the progress line.", action = "store_true")
+    parser.add_argument ("--retries", help = "If IGV stops answering or the connection is lost, reconnect and try the unfinished photos again up to this many times before giving up (default 0).", type = int, default = 0)
+    parser.add_argument ("--igvcommand", help = "Command to start IGV again if it is not answering at all when reconnecting, with {port} standing in for its port (such as \"igv.sh --port {port}\").")
+    parser.add_argument ("--onerror", help = "What to do when a BAM file will not load: ask (the default), skip it without asking, or stop the run.", choices = ["ask", "skip", "stop"], default = "ask")
+    parser.add_argument ("--cache", help = "Directory for keeping images between runs, so that an image with the same locus, BAM files (unchanged since), and settings is copied from here instead of being taken again.")
+    parser.add_argument ("--cachesize", help = "Most the cache may hold, in gigabytes, before the images used least recently are thrown out (default 20).", type = float, default = 20)
+    parser.add_argument ("--format", help = "Format of the target file: our own list, vcf, or bed (default auto, which goes by the file name).  Any of them may be compressed with gzip or bgzip.", choices = ["auto", "list", "vcf", "bed"], default = "auto")
+    parser.add_argument ("--samples", help = "For a VCF file, a file matching each sample name to its BAM file (name, a tab, then the path, one sample per line).  Each variant is shown in the BAM files of the samples that carry it.")
+    parser.add_argument ("--bam", help = "A BAM file to show at every target in a VCF or BED file.  May be repeated.", action = "append")
+    parser.add_argument ("--contigs", help = "A FASTA index (.fai), chrom.sizes, or sequence dictionary (.dict) for the genome, so that targets on contigs it does not have are skipped.  With --genomecolumn, give GENOME=FILE for each of the other genomes in the list.  May be repeated.", action = "append")
+    parser.add_argument ("--genomecolumn", help = "The first column of the target list names the genome for each line (left blank for the one set with -g or in the preferences).  Lines are photographed one genome at a time, so that each is loaded only once, with their images in a subdirectory for each genome.", action = "store_true")
+    parser.add_argument ("--stage", help = "Directory on a fast local drive for small slices of each BAM file around its targets, made ahead of time so that IGV loads those instead of reading the originals over the network (needs samtools).")
+    parser.add_argument ("--flank", help = "Bases on either side of each target to keep in a staged slice (default 1000).", type = int, default = 1000)
+    parser.add_argument ("--stagethreads", help = "Number of slices to make at once ahead of the run (default 4).", type = int, default = 4)
+    parser.add_argument ("--stagesize", help = "Most the staging directory may hold between runs, in gigabytes, before the slices used least recently are thrown out (default 50).", type = float, default = 50)
+    parser.add_argument ("--samtools", help = "The samtools program to make slices with (default samtools, wherever it is on the path).", default = "samtools")
+    parser.add_argument ("--mindepth", help = "Before photographing, count the reads at each locus straight from the BAM file and its index, and leave out photos where no BAM file has at least this many reads there.", type = int)
+    parser.add_argument ("--minalt", help = "With --mindepth, also leave out photos where no BAM file has at least this many reads not showing the most common base at the position (default 0).", type = int, default = 0)
+    parser.add_argument ("--lowcoverage", help = "What to do with photos that fall short of --mindepth or --minalt: skip them (the default), or take them last, after everything else.", choices = ["skip", "last"], default = "skip")
+    parser.add_argument ("--render", help = "Draw the images ourselves, straight from the BAM files and their indexes, instead of asking IGV for them (needs numpy).  Much faster for big runs, and IGV need not be running, but the pictures are simpler than IGV's.", action = "store_true")
+    parser.add_argument ("--renderprocesses", help = "Number of processes to draw images on with --render (default: one for each CPU, or the CPUs --review does not get when both are used).", type = int)
+    parser.add_argument ("--reference", help = "With --render, an uncompressed FASTA file for the genome (with its .fai index next to it) to show mismatches against.  Without one, the most common base at each position is taken as the reference.")
+    parser.add_argument ("--review", help = "While the images are being taken, make a thumbnail of each one, a contact sheet for each locus, and an index of them all (HTML pages and JSON, by locus and by sample) in a review subdirectory of the run (needs numpy).  With --resume, images the earlier run took are reviewed too.", action = "store_true")
+    parser.add_argument ("--reviewprocesses", help = "Number of processes for --review to work on (default: one for every two CPUs, or every four when --render is drawing the images too).", type = int)
+    parser.add_argument ("--archive", help = "Pack the images into tar shards of at most this many megabytes as the run goes (recompressing each one without losing anything), with an index of where each image went, instead of leaving them loose.", type = float)
+    parser.add_argument ("--extract", help = "Copy images out of the archive of the run in RUNDIR, where KEY is the name of an image or a locus (for every image taken there), into the directory given with -d (or the current one), then exit.", nargs = 2, metavar = ("RUNDIR", "KEY"))
+    parser.add_argument ("--enqueue", help = "Coordinator mode: instead of taking any images, put the whole run into a task queue (a SQLite file on a drive every worker can reach) for workers on any number of machines.")
+    parser.add_argument ("--work", help = "Worker mode: take tasks from the queue made with --enqueue and photograph them with the IGV instance(s) on this machine until the queue is empty.")
+    parser.add_argument ("--lease", help = "Seconds a worker has to finish a task (extended while it is still working) before the task is given to another worker (default 600).", type = float, default = 600)
+    parser.add_argument ("--serve", help = "Daemon mode: keep the IGV instance(s) connected with the genome loaded and take snapshot jobs sent with --send to this port on this machine, until stopped with control-C.", type = int)
+    parser.add_argument ("--send", help = "Have the daemon started with --serve on this port photograph the target file, and print where each image went.", type = int)
+    parser.add_argument ("--plan", help = "Dry run: check the list and work out every command the run would send IGV, then print the totals and an estimate of how long it would take, without connecting to IGV or making anything.", action = "store_true")
+    parser.add_argument ("--timings", help = "Metrics file (or run directory) from an earlier run made with --metrics, for --plan to estimate times from.  May be repeated.  By default the most recent one in the output directory is used.", action = "append")
+    parser.add_argument ("--resume", help = "Continue an interrupted run in its existing output directory, skipping images it already finished.")
+    parser.add_argument ("--verifybatch", help = "Check that every image planned in a batch script written by this program was produced, then exit.")
     args = parser.parse_args()  #puts the arguments into the args object
+    if args.verifybatch:  #this is a quick check of an earlier run and needs nothing else from the commandline
+        if not os.path.isfile(args.verifybatch):
+            usage("Could not locate " + args.verifybatch + " on this system.")
+            quit()
+        return {'verifybatch' : args.verifybatch}
+    if args.extract:  #likewise for getting images back out of an archive
+        if not os.path.isfile(args.extract[0] + '/autoIGVarchive.txt'):
+            usage("Could not find an archive index in " + args.extract[0] + ".")
+            quit()
+        return {'verifybatch' : False, 'extract' : args.extract, 'directory' : args.directory or '.'}
+    if args.flank < 0 or args.stagethreads < 1:
+        usage("The flank must be zero or more bases, and at least one staging thread is needed.")
+        quit()
+    if args.render and (numpy is None or args.compile or args.enqueue or args.work or args.serve or args.send or args.cache or args.stage):
+        usage("--render needs numpy (pip install numpy), and draws the images itself, so it cannot be combined with -c, --enqueue, --work, --serve, --send, --cache, or --stage.")
+        quit()
+    args.renderprocesses, args.reviewprocesses = processcounts(os.cpu_count() or 1, args.render and args.review, args.renderprocesses, args.reviewprocesses)
+    if args.render and (args.renderprocesses < 1 or (args.reference and not os.path.isfile(args.reference + '.fai'))):
+        usage("--render needs at least one process, and the --reference FASTA file needs a .fai index next to it (samtools faidx makes one).")
+        quit()
+    if args.review and (numpy is None or args.compile == 'write' or args.enqueue or args.work or args.serve or args.send or args.plan or args.reviewprocesses < 1):
+        usage("--review needs numpy (pip install numpy) and at least one process, and only works on images taken (or drawn) here and now, so it cannot be combined with -c write, --enqueue, --work, --serve, --send, or --plan.")
+        quit()
+    if args.archive is not None and args.archive <= 0:
+        usage("The archive shard size must be more than zero megabytes.")
+        quit()
     directory = args.directory
     genome = args.genome
-    host = args.host
-    port = args.port
+    hosts = args.host  #a list of hosts (or None if none were given on the commandline)
+    ports = args.port  #a list of ports (or None if none were given on the commandline)
     mode = args.mode
     nocollapse = args.nocollapse
     if not directory:
@@ -35,10 +157,16 @@ def checkargs():  #subroutine for validating commandline arguments
         prefsfile = False    #Like above, not strictly needed
     if not genome:
         genome = False
-    if not host:
-        host = False
-    if not port:
-        port = False
+    if not hosts:
+        hosts = False
+    if not ports:
+        ports = False
+    else:
+        try:
+            ports = [int(port) for port in ports]  #every port given has to be a number
+        except ValueError:
+            usage("Specified port numbers must be integers.")
+            quit()
     if not mode:
         mode = False
     else:
@@ -50,34 +178,537 @@ def checkargs():  #subroutine for validating commandline arguments
         if ((mode != 1) and (mode != 2) and (mode != 3)):
             usage("Specified imaging mode must be either 1, 2, or 3.")
             quit()
-    if not args.file:  #if the args.file value is null, give an error message and quit the program
+    if args.cluster is not None and args.cluster < 0:
+        usage("The cluster window must be zero or more bases.")
+        quit()
+    if args.lookahead < 0:
+        usage("The lookahead must be zero or more lines.")
+        quit()
+    for optionfile in [args.samples] + [contigsfile if os.path.isfile(contigsfile) else contigsfile.rsplit('=', 1)[-1] for contigsfile in args.contigs or []]:  #files that come with the target file have to be there too (contig files may have a genome and = in front)
+        if optionfile and not os.path.isfile(optionfile):
+            usage("Could not locate " + optionfile + " on this system.")
+            quit()
+    resume = args.resume
+    if not resume:
+        resume = False
+    elif not os.path.isdir(resume):
+        usage("Could not find the run directory " + resume + " to resume.")
+        quit()
+    if args.work and not os.path.isfile(args.work):
+        usage("Could not find the queue " + args.work + ".")
+        quit()
+    if args.enqueue and os.path.exists(args.enqueue):
+        usage("The queue " + args.enqueue + " already exists.  Please give a new file for each run.")
+        quit()
+    if args.send and (resume or args.serve or args.compile or args.enqueue or args.work):
+        usage("--send hands a target file to a daemon and cannot be combined with --resume, --serve, -c, --enqueue, or --work.")
+        quit()
+    if not args.file and not resume and not args.work and not args.serve:  #if the args.file value is null, give an error message and quit the program (unless we are resuming a run, which remembers its file, working on a queue, or serving jobs)
         usage("No file specified.") 
         quit()
-    elif not os.path.isfile(args.file):  #if the file specified in the arguments doesn't exist, quit the program and give an error message
+    elif args.file and not os.path.isfile(args.file):  #if the file specified in the arguments doesn't exist, quit the program and give an error message
         usage("Could not locate " + args.file + "on this system.") 
         quit()
-    else:
-        return (args.file, directory, prefsfile, genome, host, port, mode, nocollapse)  #returns the validated filename and directory to the main program
+    else:  #returns the validated filename and other settings to the main program as a dictionary so that we can look them up by name instead of remembering their order
+        return {'file' : args.file or False,
+                'directory' : directory,
+                'prefsfile' : prefsfile,
+                'genome' : genome,
+                'hosts' : hosts,
+                'ports' : ports,
+                'mode' : mode,
+                'nocollapse' : nocollapse,
+                'compile' : args.compile,
+                'loadonce' : args.loadonce,
+                'reusetracks' : args.reusetracks or args.groupbytracks,
+                'groupbytracks' : args.groupbytracks,
+                'lookahead' : args.lookahead,
+                'cluster' : args.cluster,
+                'mergeclusters' : args.mergeclusters,
+                'resume' : resume,
+                'pipeline' : args.pipeline,
+                'checkthreads' : args.checkthreads,
+                'metrics' : args.metrics,
+                'live' : args.live,
+                'retries' : max(0, args.retries),
+                'igvcommand' : args.igvcommand,
+                'onerror' : args.onerror,
+                'cache' : args.cache,
+                'format' : args.format,
+                'samples' : args.samples,
+                'bams' : args.bam,
+                'contigs' : args.contigs,
+                'genomecolumn' : args.genomecolumn,
+                'archive' : args.archive,
+                'review' : args.review,
+                'reviewprocesses' : args.reviewprocesses,
+                'render' : args.render,
+                'renderprocesses' : args.renderprocesses,
+                'reference' : args.reference,
+                'mindepth' : args.mindepth,
+                'minalt' : args.minalt,
+                'lowcoverage' : args.lowcoverage,
+                'stage' : args.stage,
+                'enqueue' : args.enqueue,
+                'work' : args.work,
+                'lease' : args.lease,
+                'plan' : args.plan,
+                'serve' : args.serve,
+                'send' : args.send,
+                'timings' : args.timings,
+                'flank' : args.flank,
+                'stagethreads' : args.stagethreads,
+                'stagesize' : args.stagesize,
+                'samtools' : args.samtools,
+                'extract' : False,
+                'cachesize' : args.cachesize,
+                'verifybatch' : False}
     
 def filenamesfree(directory):  #this subroutine checks if the series of filenames we are likely to need is free
-    import os  #imports the library we will need to check filenames in the directory
     if os.path.isdir(directory):  #checks each potential output filename as the loop iterates
         return False  #if it finds that a file by the current name being tested exists, exits the subroutine returning a false value
     return True  #if it finds none of the files exist, it returns a true value
 
-def generatelist(file):
-    listfile = open(file, 'r')  #opens the file containing the list of loci and bam files for reading
-    line = listfile.readline()  #reads the first line of the locus file
-    list = []  #initializes an empty list to contain one line in each element
-    while line:  #this loop will iterate until the read is a null (end of file)
-        list.append(line)  #adds the most recently read line to the list as the last element
-        line = listfile.readline()  #reads the next line from the locus file (if it is a null due to reaching the end of file, it will cause the loop to end)
+def readlist(file, position = None, adapter = None):  #reads the file containing the list of loci and bam files one line at a time as it is needed, instead of holding the whole (possibly enormous) list in memory.  Gives back (line number, line) pairs.  If a position dictionary is passed in, it keeps track of how far through the file we are for progress reports.  With an adapter (see inputadapter), each line of a VCF or BED file is turned into a line of our own format as it is read
+    if position is not None:
+        position['bytesread'] = 0
+        position['totalbytes'] = os.path.getsize(file)
+    rawfile = open(file, 'rb')  #read as raw bytes so that we can count exactly how far into the file we are
+    compressed = rawfile.read(2) == b'\x1f\x8b'  #gzip and bgzip files (bgzip is just gzip in blocks) both start with these two bytes, whatever they are named
+    rawfile.seek(0)
+    listfile = rawfile
+    if compressed:
+        listfile = gzip.GzipFile(fileobj = rawfile)  #unpacked a bit at a time as we read, never all at once
+    state = {}  #anything the adapter needs to remember from one line to the next, such as the sample names in a VCF header
+    linecount = 0
+    for rawline in listfile:  #reads one line at a time until the end of file
+        linecount += 1
+        if position is not None:
+            if compressed:  #how far through the compressed file on disk we are, since we never find out how big it is unpacked
+                position['bytesread'] = rawfile.tell()
+            else:
+                position['bytesread'] += len(rawline)
+        line = cookbytes(rawline)
+        if adapter:
+            line = adaptline(line, adapter, state)
+            if line is None:  #a header, or a record with nothing to photograph
+                continue
+        yield (linecount, line)  #hands back this line and waits here until the next one is wanted
     listfile.close() #closes the locus file
-    return list  #sends back a list where each element is a line from the file starting with a genomic locus and containing bam file paths with everything separated by tabs
+    rawfile.close()
+
+def inputadapter(file, form = 'auto', samplesfile = None, bams = None, contigsfiles = None, genomecolumn = False):  #works out how to read the target file and sets up the dictionary readlist uses to turn each line into our own format.  The format is taken from the file name (ignoring any .gz or .bgz on the end) unless it is given.  contigsfiles is a list of contig files, each one either for the run's genome or given as GENOME=FILE for one named in the genome column.  Returns None if there is nothing to change about the lines at all.  Raises ValueError if the file cannot be read with what we were given
+    if form == 'auto':
+        name = re.sub(r'\.(gz|bgz)$', '', file.lower())
+        form = 'list'
+        if name.endswith('.vcf'):
+            form = 'vcf'
+        elif name.endswith('.bed'):
+            form = 'bed'
+    samples = {}
+    if samplesfile:
+        samples = readsamples(samplesfile)
+    bams = bams or []
+    if form == 'vcf' and not samples and not bams:
+        raise ValueError('A VCF file needs --samples (to match its samples to their BAM files) and/or --bam (to show the same BAM files at every variant).')
+    if form == 'bed' and not bams:
+        raise ValueError('A BED file only lists regions, so the BAM files to show in them must be given with --bam.')
+    if genomecolumn and form != 'list':
+        raise ValueError('--genomecolumn is for target lists in our own format.  VCF and BED files only ever use one genome.')
+    contigs = None
+    genomecontigs = {}
+    for contigsfile in contigsfiles or []:
+        if '=' in contigsfile and not os.path.isfile(contigsfile):  #for another genome, which only matters with a genome column
+            genomeid, contigsfile = contigsfile.rsplit('=', 1)
+            genomecontigs[genomeid] = readcontigs(contigsfile)
+        else:
+            contigs = readcontigs(contigsfile)
+    if form == 'list' and not contigs and not genomecolumn:
+        return None
+    return {'format' : form,
+            'samples' : samples,  #sample name -> bam file, for VCF files
+            'bams' : bams,  #bam files to show at every target
+            'contigs' : contigs,  #the contigs the genome has (without any chr in front), or None to accept anything
+            'genomecolumn' : genomecolumn,  #whether each line starts with the genome it is on
+            'genomecontigs' : genomecontigs,  #genome -> its contigs, for the genomes in the genome column other than the run's own
+            'genome' : None,  #the run's own genome, for lines that leave the genome column blank (filled in once the preferences are loaded)
+            'only' : None,  #a genome to pass along the lines of (leaving out the rest), or None for every line
+            'first' : None,  #the genome that also gets the lines with no genome at all
+            'unknown' : set()}  #contigs we have already warned about, so each one is only mentioned once
+
+def readsamples(samplesfile):  #reads a file matching VCF sample names to their BAM files: one sample per line, with its name, a tab, and the path to its BAM file
+    samples = {}
+    mapping = open(samplesfile, 'r')
+    for line in mapping:
+        fields = line.strip('\r\n').split('\t')
+        if line.startswith('#') or len(fields) < 2 or not fields[0]:
+            continue
+        samples[fields[0]] = fields[1].strip()
+    mapping.close()
+    return samples
+
+def readcontigs(contigsfile):  #reads the names of the contigs in a genome from a FASTA index (.fai), a chrom.sizes file, or a sequence dictionary (.dict), any of which can usually be found next to the genome's FASTA file
+    contigs = set()
+    names = open(contigsfile, 'r')
+    for line in names:
+        fields = line.strip('\r\n').split('\t')
+        if fields[0] == '@SQ':  #sequence dictionary, with the name in an SN: field
+            for field in fields:
+                if field.startswith('SN:'):
+                    contigs.add(contigname(field[3:]))
+        elif fields[0] and not fields[0].startswith('@') and not fields[0].startswith('#'):
+            contigs.add(contigname(fields[0]))
+    names.close()
+    return contigs
+
+def contigname(contig):  #gives the name we compare contigs by, so that chr1 and 1 are seen as the same
+    return chrpattern.sub('', contig)
+
+def adaptline(line, adapter, state):  #turns one line of a VCF or BED file into a line of our own format (locus, a tab, then the bam files separated by tabs).  Returns None for headers, records with no BAM files to show, and loci on contigs the genome does not have
+    fields = line.rstrip('\r\n').split('\t')
+    contigs = adapter['contigs']  #the run's own genome, unless a genome column says otherwise
+    if adapter['format'] == 'vcf':
+        if line.startswith('#CHROM'):  #the header line, which names the samples
+            state['samples'] = fields[9:]
+            return None
+        if line.startswith('#') or len(fields) < 2:
+            return None
+        locus = fields[0] + ':' + fields[1]
+        bams = adapter['bams'] + vcfbams(fields, state.get('samples', []), adapter['samples'])
+    elif adapter['format'] == 'bed':
+        if not line.strip() or line.startswith('#') or line.startswith('track') or line.startswith('browser'):
+            return None
+        try:
+            start = int(fields[1]) + 1  #BED counts from 0 and does not include the end, while IGV counts from 1 and does
+            end = int(fields[2])
+        except (IndexError, ValueError):
+            return line  #handed along as it is, so that it is reported as not having a valid locus just like any other bad line
+        locus = fields[0] + ':' + str(start)
+        if end > start:
+            locus += '-' + str(end)
+        bams = adapter['bams']
+    else:  #our own format, which only needs its contig checked (and its genome taken off the front, if it has one)
+        if adapter['genomecolumn']:
+            genomeid = linegenome(line, adapter['genome'])
+            if genomeid is None:  #a blank line or a comment, which only needs to be seen (and reported) once
+                if adapter['only'] is None or adapter['only'] == adapter['first']:
+                    return line
+                return None
+            if adapter['only'] is not None and genomeid != adapter['only']:  #some other genome's turn
+                return None
+            if genomeid != adapter['genome']:
+                contigs = adapter['genomecontigs'].get(genomeid)
+            fields = fields[1:]
+            line = '\t'.join(fields) + '\n'
+        locus = fields[0].strip()
+        bams = None
+    if contigs is not None and ':' in locus:
+        contig = contigname(locus.rsplit(':', 1)[0])
+        if contig not in contigs:
+            if contig not in adapter['unknown']:
+                adapter['unknown'].add(contig)
+                print ('Skipping any targets on ' + locus.rsplit(':', 1)[0] + ', as it is not one of the contigs in the genome.')
+            return None
+    if bams is None:
+        return line
+    if not bams:
+        return None
+    return locus + '\t' + '\t'.join(bams)
+
+def linegenome(line, default):  #gives the genome in the genome column of a line in our own format, or default if it was left blank.  Returns None for a blank line or a comment
+    if not line.strip() or line.startswith('#'):
+        return None
+    return line.split('\t', 1)[0].strip() or default
+
+def listgenomes(file, default):  #reads through a target list with a genome column to find which genomes it uses.  Returns them in the order they should be photographed in: the run's own genome first if it is used at all (since IGV already has it loaded), then the others in the order they first turn up
+    genomes = []
+    for linecount, line in readlist(file):
+        genomeid = linegenome(line, default)
+        if genomeid is not None and genomeid not in genomes:
+            genomes.append(genomeid)
+    if default in genomes:
+        genomes.remove(default)
+        genomes.insert(0, default)
+    return genomes
+
+def genomefolder(genomeid):  #gives the name of the subdirectory for a genome's images.  A genome can be given as a path to a .genome, .json, or FASTA file, so only the name of the file is used, without its extension
+    name = ntpath.basename(genomeid)
+    name = re.sub(r'(\.gz)?$', '', name)
+    name = re.sub(r'\.(genome|json|fa|fasta|fna)$', '', name)
+    return unsafepattern.sub('_', name) or 'genome'
+
+def vcfbams(fields, samplenames, samples):  #finds the BAM files for the samples that carry a VCF record's variant (have a genotype with at least one allele that is not the reference).  Without genotypes, every sample we have a BAM file for is shown
+    if not samples:
+        return []
+    if len(fields) < 10 or 'GT' not in fields[8].split(':'):  #no genotypes to go by
+        return [samples[name] for name in samplenames if name in samples]
+    gtindex = fields[8].split(':').index('GT')
+    bams = []
+    for name, value in zip(samplenames, fields[9:]):
+        if name not in samples:
+            continue
+        values = value.split(':')
+        if gtindex >= len(values):
+            continue
+        alleles = allelepattern.split(values[gtindex])
+        if [allele for allele in alleles if allele not in ('0', '.', '')]:
+            bams.append(samples[name])
+    return bams
+
+def progress(position):  #describes how far through the run we are, either by chunks (if the whole run was compiled before starting) or by how much of the list file has been read.  If we are keeping live metrics, how fast things are going is added on
+    if position.get('totalchunks'):
+        where = 'chunk ' + str(position['chunk']) + ' of ' + str(position['totalchunks'])
+    elif not position.get('totalbytes'):
+        where = '100% of the list'
+    else:
+        where = str(round(100 * position['bytesread'] / position['totalbytes'], 1)) + '% of the list'
+    if position.get('metrics') and position['metrics']['live']:
+        where += ', ' + throughput(position['metrics'])
+    return where
+
+def newmetrics(live = False):  #sets up a dictionary for keeping track of how long IGV takes to answer each kind of command.  With live, the progress line also shows how fast images are being taken.  Workers in a pool share it, so it comes with a lock for taking turns
+    return {'lock' : threading.Lock(),
+            'start' : time.time(),
+            'commands' : {},  #command -> {'count', 'seconds', 'max', 'buckets'}
+            'loads' : {},  #bam file -> {'count', 'seconds', 'max'}
+            'snapshots' : 0,
+            'recent' : collections.deque(maxlen = 100),  #when the last few snapshots finished, for working out the current rate
+            'live' : live}
+
+def latencybuckets():  #the upper limits (in seconds) of the histogram buckets for command times, from a quick goto on a local drive to a whole batch script
+    return [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+
+def recordtime(metrics, command, sent, bam = None):  #adds the time since sent to the totals for a command (and for the bam file, if it was a load).  Does nothing if we are not keeping track
+    if not metrics:
+        return
+    finished = time.time()
+    seconds = finished - sent
+    with metrics['lock']:
+        if command not in metrics['commands']:
+            metrics['commands'][command] = {'count' : 0, 'seconds' : 0.0, 'max' : 0.0, 'buckets' : [0] * len(latencybuckets())}
+        totals = metrics['commands'][command]
+        totals['count'] += 1
+        totals['seconds'] += seconds
+        totals['max'] = max(totals['max'], seconds)
+        for i, limit in enumerate(latencybuckets()):
+            if seconds <= limit:
+                totals['buckets'][i] += 1
+                break  #each time only goes in the first bucket it fits; they are added up when written out
+        if bam:
+            if bam not in metrics['loads']:
+                metrics['loads'][bam] = {'count' : 0, 'seconds' : 0.0, 'max' : 0.0}
+            metrics['loads'][bam]['count'] += 1
+            metrics['loads'][bam]['seconds'] += seconds
+            metrics['loads'][bam]['max'] = max(metrics['loads'][bam]['max'], seconds)
+        if command == 'snapshot':
+            metrics['snapshots'] += 1
+            metrics['recent'].append(finished)
+
+def throughput(metrics):  #describes how fast images are being taken right now (over the last hundred or so) and where the time is going
+    with metrics['lock']:
+        recent = list(metrics['recent'])
+        igvseconds = sum([metrics['commands'][command]['seconds'] for command in metrics['commands']])
+        snapshots = metrics['snapshots']
+    elapsed = time.time() - metrics['start']
+    rate = 0.0
+    if len(recent) > 1 and recent[-1] > recent[0]:
+        rate = (len(recent) - 1) / (recent[-1] - recent[0])
+    busy = 0
+    if elapsed > 0:
+        busy = min(100, round(100 * igvseconds / elapsed))  #with several IGV instances or commands in flight this adds up past 100, so it is capped
+    return str(snapshots) + ' images, ' + str(round(rate, 1)) + '/s, IGV busy ' + str(busy) + '%'
+
+def writemetrics(metrics, directory, form):  #writes the timings out next to the images, either as JSON or in the Prometheus text format (which can be picked up by a node exporter's textfile collector).  Returns the name of the file written
+    buckets = latencybuckets()
+    runseconds = time.time() - metrics['start']
+    if form == 'json':
+        summary = {'run_seconds' : round(runseconds, 3), 'snapshots' : metrics['snapshots'], 'commands' : {}, 'loads' : {}}
+        for command in sorted(metrics['commands']):
+            totals = metrics['commands'][command]
+            cumulative = 0
+            histogram = {}
+            for i in range(0, len(buckets)):
+                cumulative += totals['buckets'][i]
+                histogram[str(buckets[i])] = cumulative
+            histogram['+Inf'] = totals['count']
+            summary['commands'][command] = {'count' : totals['count'], 'total_seconds' : round(totals['seconds'], 6), 'mean_seconds' : round(totals['seconds'] / totals['count'], 6), 'max_seconds' : round(totals['max'], 6), 'buckets' : histogram}
+        for bam in metrics['loads']:
+            totals = metrics['loads'][bam]
+            summary['loads'][bam] = {'count' : totals['count'], 'total_seconds' : round(totals['seconds'], 6), 'max_seconds' : round(totals['max'], 6)}
+        filename = directory + '/autoIGVmetrics.json'
+        output = open(filename, 'w')
+        json.dump(summary, output, indent = 1)
+        output.close()
+        return filename
+    lines = ['# HELP autoigv_command_seconds Time from sending a command to IGV until its answer arrived.', '# TYPE autoigv_command_seconds histogram']
+    for command in sorted(metrics['commands']):
+        totals = metrics['commands'][command]
+        cumulative = 0
+        for i in range(0, len(buckets)):
+            cumulative += totals['buckets'][i]
+            lines.append('autoigv_command_seconds_bucket{command="' + command + '",le="' + str(buckets[i]) + '"} ' + str(cumulative))
+        lines.append('autoigv_command_seconds_bucket{command="' + command + '",le="+Inf"} ' + str(totals['count']))
+        lines.append('autoigv_command_seconds_sum{command="' + command + '"} ' + repr(totals['seconds']))
+        lines.append('autoigv_command_seconds_count{command="' + command + '"} ' + str(totals['count']))
+    lines += ['# HELP autoigv_bam_load_seconds Time IGV took to load each BAM file.', '# TYPE autoigv_bam_load_seconds summary']
+    for bam in metrics['loads']:
+        label = bam.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')  #escaped the way the format asks for label values
+        lines.append('autoigv_bam_load_seconds_sum{bam="' + label + '"} ' + repr(metrics['loads'][bam]['seconds']))
+        lines.append('autoigv_bam_load_seconds_count{bam="' + label + '"} ' + str(metrics['loads'][bam]['count']))
+    lines += ['# HELP autoigv_snapshots_total Images taken during the run.', '# TYPE autoigv_snapshots_total counter', 'autoigv_snapshots_total ' + str(metrics['snapshots'])]
+    lines += ['# HELP autoigv_run_seconds How long the run took from start to finish.', '# TYPE autoigv_run_seconds gauge', 'autoigv_run_seconds ' + repr(runseconds)]
+    filename = directory + '/autoIGVmetrics.prom'
+    output = open(filename, 'w')
+    output.write('\n'.join(lines) + '\n')
+    output.close()
+    return filename
+
+def newplan():  #sets up the dictionary for adding up what a run would do, for --plan
+    return {'lines' : 0,  #lines read from the target list
+            'imaged' : set(),  #line numbers that get at least one image
+            'chunks' : 0,
+            'commands' : {},  #command -> how many times it would be sent
+            'loads' : {},  #bam file -> how many times it would be loaded
+            'images' : {'group' : 0, 'single' : 0}}
+
+def countlines(numberedlines, plan):  #passes the (line number, line) pairs along, counting them as they go by
+    for linecount, line in numberedlines:
+        plan['lines'] += 1
+        yield (linecount, line)
+
+def plannedsteps(chunks, plan, cache = None):  #passes along the steps of every chunk that would still need IGV, counting the chunks.  Snapshots the cache already has are taken out without copying anything
+    for steps in chunks:
+        if cache:
+            steps = cachelookup(steps, cache, None, None, True)
+        if not steps:
+            continue
+        plan['chunks'] += 1
+        for step in steps:
+            yield step
+
+def planrun(steps, plan, genome = None):  #adds up the commands a run would send IGV (which starts out with genome loaded), with each tracks step replaced by the loads and removes it would need (assuming every load works, as the run itself would until one fails)
+    for command, argument, linecount, locus, bam in expandtracks(steps, genome):
+        plan['commands'][command] = plan['commands'].get(command, 0) + 1
+        if command == 'load':
+            plan['loads'][argument] = plan['loads'].get(argument, 0) + 1
+        elif command == 'snapshot':
+            plan['imaged'].add(linecount)
+            if bam == 'all':
+                plan['images']['group'] += 1
+            else:
+                plan['images']['single'] += 1
+    return plan
+
+def findtimings(directories):  #looks for the metrics file (see --metrics) of the most recent run in or under each directory, to estimate how long a new run will take.  Returns a list with the file found, or an empty list
+    found = []
+    for directory in directories:
+        if directory and os.path.isdir(directory):
+            found += glob.glob(directory + '/autoIGVmetrics.*') + glob.glob(directory + '/*/autoIGVmetrics.*')
+    if not found:
+        return []
+    return [max(found, key = os.path.getmtime)]
+
+def readtimings(filenames):  #reads the command timings from the metrics files of earlier runs, in either form writemetrics writes, adding them all together.  Returns a dictionary with command -> [count, seconds] and bam file -> [count, seconds] for loads
+    timings = {'commands' : {}, 'loads' : {}, 'files' : []}
+    for filename in filenames:
+        if os.path.isdir(filename):  #a run directory, which keeps its metrics file inside
+            filename = (findtimings([filename]) or [filename + '/autoIGVmetrics.json'])[0]
+        try:
+            text = open(filename).read()
+        except OSError:
+            print ('\nUnable to read timings from ' + filename + '.', end = '')
+            continue
+        timings['files'].append(filename)
+        try:
+            summary = json.loads(text)
+            for kind in ('commands', 'loads'):
+                for key in summary.get(kind, {}):
+                    totals = timings[kind].setdefault(key, [0, 0.0])
+                    totals[0] += summary[kind][key]['count']
+                    totals[1] += summary[kind][key]['total_seconds']
+            continue
+        except ValueError:  #not JSON, so it should be the Prometheus text format
+            pass
+        for line in text.splitlines():
+            match = re.match(r'autoigv_(command|bam_load)_seconds_(sum|count)\{(command|bam)="((?:[^"\\]|\\.)*)"\} (\S+)$', line)
+            if not match:
+                continue
+            kind = 'commands'
+            key = match.group(4)
+            if match.group(1) == 'bam_load':
+                kind = 'loads'
+                key = re.sub(r'\\(.)', lambda escaped: '\n' if escaped.group(1) == 'n' else escaped.group(1), key)  #undoes the escaping writemetrics did
+            totals = timings[kind].setdefault(key, [0, 0.0])
+            if match.group(2) == 'count':
+                totals[0] += int(float(match.group(5)))
+            else:
+                totals[1] += float(match.group(5))
+    return timings
+
+def estimateseconds(plan, timings):  #works out how long IGV would spend on the commands in a plan, going by the average time each kind of command took before.  Loads go by each file's own average where we have one, since one huge or far away file can take far longer than the rest.  Returns the seconds and a list of commands we have no timings for
+    seconds = 0.0
+    missing = []
+    for command in plan['commands']:
+        count = plan['commands'][command]
+        if command == 'load':
+            for bam in plan['loads']:
+                totals = timings['loads'].get(bam) or timings['commands'].get('load')
+                if not totals or not totals[0]:
+                    missing.append(command)
+                    break
+                seconds += plan['loads'][bam] * totals[1] / totals[0]
+            continue
+        totals = timings['commands'].get(command)
+        if not totals or not totals[0]:
+            missing.append(command)
+            continue
+        seconds += count * totals[1] / totals[0]
+    return (seconds, missing)
+
+def describeseconds(seconds):  #puts a length of time in the units a person would use for it
+    if seconds < 60:
+        return str(round(seconds, 1)) + ' seconds'
+    if seconds < 3600:
+        return str(int(seconds // 60)) + ' min ' + str(int(seconds % 60)) + ' s'
+    return str(int(seconds // 3600)) + ' h ' + str(int(seconds % 3600 // 60)) + ' min'
+
+def reportplan(plan, timings, instances, done = 0, cachehits = 0, pipeline = 0):  #tells the user what a run would do and how long it should take
+    images = plan['images']['group'] + plan['images']['single']
+    print ('\nPlan for this run:')
+    print ('\t' + str(plan['lines']) + ' lines in the target list, ' + str(len(plan['imaged'])) + ' of them with images to take')
+    print ('\t' + str(images) + ' images (' + str(plan['images']['group']) + ' group, ' + str(plan['images']['single']) + ' single) in ' + str(plan['chunks']) + ' chunks')
+    if done:
+        print ('\t' + str(done) + ' images already finished by the run being resumed')
+    if cachehits:
+        print ('\t' + str(cachehits) + ' images to be copied from the cache')
+    print ('\t' + str(len(plan['loads'])) + ' distinct BAM files, loaded ' + str(sum(plan['loads'].values())) + ' times in all')
+    if plan['loads']:
+        busiest = max(plan['loads'], key = lambda bam: plan['loads'][bam])
+        print ('\t' + 'Most loaded: ' + busiest + ' (' + str(plan['loads'][busiest]) + ' times)')
+    print ('Commands IGV would be sent:')
+    for command in sorted(plan['commands'], key = lambda command: -plan['commands'][command]):
+        print ('\t' + command.ljust(18) + str(plan['commands'][command]).rjust(10))
+    print ('\t' + 'total'.ljust(18) + str(sum(plan['commands'].values())).rjust(10))
+    if not timings['files']:
+        print ('No timings from an earlier run were found, so there is no time estimate.  Run once with --metrics json (or give a metrics file with --timings) to get one.')
+        return
+    seconds, missing = estimateseconds(plan, timings)
+    share = seconds / max(1, min(instances, plan['chunks']))  #each instance works through its share of the chunks at the same time as the others
+    print ('Estimated time, going by ' + ', '.join(timings['files']) + ':')
+    print ('\t' + describeseconds(seconds) + ' of IGV time, or about ' + describeseconds(share) + ' with ' + str(instances) + ' IGV instance(s)')
+    if images:
+        print ('\t' + str(round(seconds / images, 3)) + ' seconds per image')
+    if pipeline:
+        print ('\tPipelining overlaps commands, so the run should take less than this.')
+    if missing:
+        print ('\tNo timings for ' + ', '.join(sorted(missing)) + ', so these are left out of the estimate.')
+
+def choosemode(numberedlines, badbams, lookahead, checked = None):  #peeks at up to lookahead lines to see if any have multiple bam files listed.  Returns whether it found any, whether it got to the end of the list while looking, and the lines again (including the ones we peeked at) so that nothing is lost
+    peeked = list(itertools.islice(numberedlines, lookahead))
+    multi = multibamlist([line for linecount, line in peeked], badbams, checked)
+    return (multi, len(peeked) < lookahead, itertools.chain(peeked, numberedlines))
 
 def createsavedir(directory):
-    import os  #we need this to look for and create a directory
-    import datetime #we need this to get time and date info in order to name the directory
     now = datetime.datetime.now()  #stores the current date and time to the value "now"
     directory = directory + '/IGVimages.' + str(now.year) + str(now.month).zfill(2) + str(now.day).zfill(2) + str(now.hour).zfill(2) + str(now.minute).zfill(2) #creates a working directory for this run (identified by date and time of the run)
     if not filenamesfree(directory):  #checks to see if the directory we want is already created (such as someone encountering an error and then quickly starting again) this avoids collisions of filename where data could be overwritten
@@ -94,9 +725,8 @@ def createsavedir(directory):
         return directory  #and returns the directory name to the main subroutine
     
 def clean(line, badbams):  #this subroutine cleans up the line and makes sure it looks somewhat usable (starts with a genomic locus followed by a tab)
-    import re  #we need this library to do a regex
     line = line.strip('\r\n\t ') #removes any leading or trailing endlines, spaces, and tabs
-    line = re.sub('^chr', '', line) #removes a "chr" from the beginning of the line (before the chromosome number).  That will be added later and will prevent it from causing problems later
+    line = humanchrpattern.sub('', line) #removes a "chr" from the beginning of the line (before the chromosome number) for the human chromosomes.  That will be added later and will prevent it from causing problems later.  Other contigs keep their names exactly as given
     line = line.split('\t')
     if not wellformed(line[0]):
         return False #if the line does not match that pattern, the subroutine returns the boolean value False to the main subroutine
@@ -108,6 +738,17 @@ def clean(line, badbams):  #this subroutine cleans up the line and makes sure it
             cleanline.append(line[i])
     return cleanline #otherwise it returns the cleaned line (with only 1 element if no good bams were specified)
 
+def processcounts(cpus, shared, renderprocesses = None, reviewprocesses = None):  #works out how many processes --render and --review get when they were not given.  When both are used they run at the same time, so they split the CPUs between them (drawing getting the larger share) rather than each taking as many as it would on its own
+    if not shared:
+        return (renderprocesses or cpus, reviewprocesses or max(1, cpus // 2))
+    if reviewprocesses is None:
+        reviewprocesses = max(1, cpus // 4)
+        if renderprocesses is not None:
+            reviewprocesses = max(1, min(cpus // 2, cpus - renderprocesses))
+    if renderprocesses is None:
+        renderprocesses = max(1, cpus - reviewprocesses)
+    return (renderprocesses, reviewprocesses)
+
 def usage(sin):  #This subroutine prints directions
     print ('Error: ' + sin)
     print ('This script will take a tab-delimited list with the first column containing a genomic locus (formatted as ##:#######)')
@@ -117,40 +758,52 @@ def usage(sin):  #This subroutine prints directions
     print ('The -f (file) is a necessary commandline argument.  The -d (directory) is optional, as this script has a default.')
     print ('The -m argument can be used to automate the runs (such as for a bash script) and can take an argument of 1, 2, or 3.')
     print ('\t1. All files at once for the line.\n\t2. One file at a time at each locus.\n\t3. Both.')
+    print ('Several IGV instances can share a run by repeating -o and/or -r (such as -r 60151 -r 60152) or by listing comma-separated hosts and ports in the preferences file.')
     
-def connect(host, port):  #this subroutine creates the connection between the script and IGV
-    import socket  #the library needed for the low-level network connection
+def connect(host, port, metrics = None):  #this subroutine creates the connection between the script and IGV
     igv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  #creates a socket object called IGV
     igv.settimeout(20)  #sets IGV to give a timeout error if a command goes unresponded to for more than 20 seconds
     print('Attempting to establish a connecting with IGV...', end = '')  
     try:  #this statement contains an action that could cause a non-fatal exception to occur
         igv.connect((host, port))  #actually creates the connection with IGV on the local system
     except ConnectionRefusedError: #if the connection is refused (likely because IGV is not open or configured to allow connections).  This handles that exception mentioned above
-        usage('Unable to connect to IGV.  Be sure that IGV is running and configured to accept connections on its default port (60151)')  #prints an error message
-        quit() #and quits the program more gracefully than an unhandled exception
+        igv.close()
+        raise IGVError('Unable to connect to IGV on ' + str(host) + ':' + str(port) + '.  Be sure that IGV is running and configured to accept connections on that port (60151 by default).')  #reported more gracefully than an unhandled exception
     except:
-        usage('Unexpected error trying to connect with IGV.')
-        quit()
+        igv.close()
+        raise IGVError('Unexpected error trying to connect with IGV.')
     print('OK\nTesting connection...', end = '')
+    sent = time.time()
     try: #every time we send a command to IGV, we risk a BrokenPipeError if IGV stops functioning or the connection is otherwise broken.  This try/except statement will handle that more gracefully than simply having the program crash out with a long error message.
         igv.send(rawbytes('echo\n'))  #sends the command "echo" to IGV.  IGV should respond to this by repeating "echo" back to me
     except BrokenPipeError:  #what to do if this kind of error occurs (due to a failure to transmit the command to IGV successfully)
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending test message to IGV.')
+        raise IGVError('Unexpected error sending test message to IGV.')
     awaitIGVResponse(igv, 'echo')  #waits for and checks the IGV response
+    recordtime(metrics, 'echo', sent)
     print ('OK')
     return igv #returns the new and active socket connection
 
-def cmdnew(igv):  #subroutine to tell IGV to clear its display and start a new session
-    import socket
+def endpointlist(hosts, ports):  #pairs up the hosts and ports we were given into a list of (host, port) connections to make, one for each IGV instance in the pool.  Raises ValueError if they cannot be paired up
+    if len(hosts) == len(ports):  #one port for each host, so we just pair them up in order
+        return list(zip(hosts, ports))
+    if len(hosts) == 1:  #several IGV instances on the same computer, each listening on its own port
+        return [(hosts[0], port) for port in ports]
+    if len(ports) == 1:  #several computers, each running IGV on the same port
+        return [(host, ports[0]) for host in hosts]
+    raise ValueError('Unable to pair up ' + str(len(hosts)) + ' hosts with ' + str(len(ports)) + ' ports.  Give one host, one port, or the same number of each.')
+
+def cmdnew(igv, metrics = None):  #subroutine to tell IGV to clear its display and start a new session
+    sent = time.time()  #for timing how long IGV takes to answer, if we are keeping track
     try:
         igv.send(rawbytes('new\n')) #send IGV the "new" command
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending NEW command to IGV.')
+        raise IGVError('Unexpected error sending NEW command to IGV.')
     success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
+    recordtime(metrics, 'new', sent)
     if success:
         return True
     else:
@@ -162,107 +815,145 @@ def cookbytes(rawbytes):  #subroutine to take a utf-8 bytes input (such as what
 def rawbytes(stringin):  #subroutine to take a string and make it into UTF-8 bytes, often for sending via socket connection
     return bytes(stringin, 'utf-8')
 
-def cmdgenome(genomeid, igv): #tells IGV which genome to use
-    import socket
+def cmdgenome(genomeid, igv, metrics = None): #tells IGV which genome to use
+    sent = time.time()
     try:
         igv.send(rawbytes('genome ' + genomeid + '\n'))  #send the actual command to IGV to use a specific genome
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending GENOMEID command to IGV.')
+        raise IGVError('Unexpected error sending GENOMEID command to IGV.')
     success = awaitIGVResponse(igv)  #wait for acknowledgement
+    recordtime(metrics, 'genome', sent)
     if success:
         return True
     else:
         return False
 
-def cmdgotolocus(locus, igv):
-    import socket
+def cmdgotolocus(locus, igv, metrics = None):
+    sent = time.time()
     try:
-        igv.send (rawbytes('goto chr' + locus + '\n'))  #sends IGV a command to go to a specific locus
+        igv.send (rawbytes('goto ' + igvlocus(locus) + '\n'))  #sends IGV a command to go to a specific locus
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending GOTO command to IGV.')
+        raise IGVError('Unexpected error sending GOTO command to IGV.')
     success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
+    recordtime(metrics, 'goto', sent)
     if success:
         return True
     else:
         return False
 
-def cmdsaveimage(source, locus, igv, nocollapse):
-    import socket
-    import re
-    import ntpath
-    if not nocollapse:
-        try:
-            igv.send(rawbytes('collapse\n')) #tells IGV to collapse the image so we can fit it better in the photo
-        except BrokenPipeError:
-            quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
-        except:
-            quit('Unexpected error sending COLLAPSE command to IGV.')
-        success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
-        if not success:
-            return False
+def igvlocus(argument):  #gives IGV the name it knows a locus by.  The human chromosomes (1-22, X, Y, and MT) get back the chr that clean took off, and any other contig is passed along exactly as given.  A goto for split panels lists several loci separated by spaces, and each one is handled the same way
+    return ' '.join([humanlocuspattern.sub('chr\\g<0>', locus) for locus in argument.split(' ')])
+
+def imagename(source, locus):  #works out the name of the image file for a bam file (or 'all' for a group photo) at a locus.  Used both when taking the photo and when checking for it afterwards
     cleansource = re.sub('\\ ', ' ', source)
-    cleanlocus = re.sub('\:', 'c', locus)
+    cleanlocus = locus.replace(':', 'c')
+    cleanlocus = unsafepattern.sub('_', cleanlocus)  #some contig names have characters in them (such as * or |) that do not belong in a file name
     filename = ntpath.basename(cleansource)
     filename = cleanlocus + filename
     #filename = re.sub(' ', '_', filename)  #temporary workaround for filenames with whitespace, should be fixed by quoting filenames.  this line can be deleted once the fix is confirmed.  Fix should be applied in IGV 2.3.37
+    return filename + '.png'
+
+def cmdcollapse(igv, metrics = None):  #tells IGV to collapse the tracks so we can fit more of them into the photo
+    sent = time.time()
     try:
-        igv.send(rawbytes('snapshot \"' + filename + '.png\"\n')) #the actual command telling IGV to snap the photo
+        igv.send(rawbytes('collapse\n'))
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending SNAPSHOT command to IGV.')
+        raise IGVError('Unexpected error sending COLLAPSE command to IGV.')
     success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
-    if success:
-        return True
-    else:
-        return False
+    recordtime(metrics, 'collapse', sent)
+    return success
 
-def cmdloadfile(filename, igv):  #converts the filename to url format (easier for IGV to handle) and tells IGV to load it
-    import socket
-    import re
-    urlfile = 'file://' + re.sub(' ', '%20', filename)  #uses a regex to change any "\ " into " " (this would be an issue with terminal-formatted paths)
-    urlfile = re.sub(r'\\', '/', urlfile)  #uses a regex to change any other backslashes into forward slashes (this would be an issue with windows-formatted paths)
+def cmdsnapshot(filename, igv, metrics = None):  #tells IGV to save what it is showing to a file in the snapshot directory
+    sent = time.time()
     try:
-        igv.send(rawbytes('load ' + urlfile + '\n'))  #sends the command to IGV to open the file
+        igv.send(rawbytes('snapshot \"' + filename + '\"\n')) #the actual command telling IGV to snap the photo
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending LOAD command to IGV.')
+        raise IGVError('Unexpected error sending SNAPSHOT command to IGV.')
     success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
+    recordtime(metrics, 'snapshot', sent)
+    return success
+
+def fileurl(filename):  #converts a file path to url format (easier for IGV to handle)
+    urlfile = 'file://' + filename.replace(' ', '%20')  #uses a regex to change any "\ " into " " (this would be an issue with terminal-formatted paths)
+    urlfile = urlfile.replace('\\', '/')  #uses a regex to change any other backslashes into forward slashes (this would be an issue with windows-formatted paths)
+    return urlfile
+
+def cmdremovetrack(filename, igv, metrics = None):  #tells IGV to remove the tracks for a bam file (the alignments and their coverage), which IGV names after the file
+    trackname = ntpath.basename(filename)
+    for track in [trackname + ' Coverage', trackname]:
+        sent = time.time()
+        try:
+            igv.send(rawbytes('remove \"' + track + '\"\n'))
+        except BrokenPipeError:
+            raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        except:
+            raise IGVError('Unexpected error sending REMOVE command to IGV.')
+        success = awaitIGVResponse(igv)
+        recordtime(metrics, 'remove', sent)
+        if not success:
+            return False
+    return True
+
+def cmdloadfile(filename, igv, metrics = None):  #converts the filename to url format (easier for IGV to handle) and tells IGV to load it
+    sent = time.time()
+    try:
+        igv.send(rawbytes('load ' + fileurl(filename) + '\n'))  #sends the command to IGV to open the file
+    except BrokenPipeError:
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+    except:
+        raise IGVError('Unexpected error sending LOAD command to IGV.')
+    success = awaitIGVResponse(igv) #wait for acknowledgement from IGV that it is done and there were no errors returned
+    recordtime(metrics, 'load', sent, filename)  #load times are also kept for each file, since a slow drive or a huge file shows up here
     if success:  #note that if IGV returns an error here opening the file, we will know it by this subroutine returning a "False" value.  If I wanted to make it slightly more efficient (but harder to understand), I could have replaced the 5 lines starting with "success = awaitIGVResponse(igv)" with the single line "return awaitIGVResponse(igv)"
         return True
     else:
         return False
 
+def readresponse(igv):  #reads exactly one line (one response) from IGV.  A single recv could give us only part of a response, or more than one response stuck together, so we peek at what has arrived and only take up to the end of the first line
+    response = b''
+    while not response.endswith(b'\n'):
+        waiting = igv.recv(4096, socket.MSG_PEEK)  #look at what has arrived without taking it off the socket
+        if not waiting:  #the other end closed the connection
+            raise BrokenPipeError
+        linelength = waiting.find(b'\n') + 1  #if there is no end of line yet, find gives -1 and we take everything that is there
+        if not linelength:
+            linelength = len(waiting)
+        response += igv.recv(linelength)  #now actually take it, leaving anything after the end of the line for the next response
+    return cookbytes(response)
+
 def awaitIGVResponse(igv, expectedresponse =''):  #the second argument here is optional, and is only going to be supplied if the goal is to get a specific response from IVG (probably echo).  IGV usually responds "OK" when a command is completed or with Error:(Message) when a command fails.
-    import socket
-    import re
     try:  #the following statement could generate an exception, so we are preparing to handle it
-        response = cookbytes(igv.recv(4096))  #this is going to wait for and read the response from IGV.  The cookbytes function is the opposite of the rawbytes one and turns UTF-8 from a socket response into a string
+        response = readresponse(igv)  #this is going to wait for and read the response from IGV.  It uses the cookbytes function (the opposite of the rawbytes one) to turn UTF-8 from a socket response into a string
         response = response.strip('\r\n\t')
     except socket.timeout:  #if we timeout waiting for a response (indicating something has gone wrong)
-        usage('Timeout waiting for IGV to respond.  Has it locked up or been terminated or is another application already communicating with it on that port?')  #display an error message
         igv.close()
-        quit()
-    except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Timeout waiting for IGV to respond.  Has it locked up or been terminated or is another application already communicating with it on that port?')
+    except (BrokenPipeError, ConnectionResetError):
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error awaiting response from IGV.')
+        raise IGVError('Unexpected error awaiting response from IGV.')
+    return checkresponse(response, expectedresponse)
+
+def checkresponse(response, expectedresponse = ''):  #decides whether a response from IGV means the command worked.  Kept apart from reading the response so that the same checks can be used however the response arrived
     if expectedresponse == '':  #if there was no expected response provided
         if response == 'OK':
             return True
-        if re.match('^ERROR\W*?Could not locate genome', response , re.IGNORECASE):
-            quit('Fatal error: The genome requested is not valid.  If this was done using your default preferences, please delete the preferences file and restart the program.')
-        if re.match('^ERROR\W*?directory.+?does not exist', response , re.IGNORECASE):
-            errormessage = re.search('^ERROR\W*?(\w+?)', response, re.IGNORECASE)  #uses a regex to capture any error messages returned
+        if genomeerrorpattern.match(response):
+            raise IGVError('Fatal error: The genome requested is not valid.  If this was done using your default preferences, please delete the preferences file and restart the program.')
+        if directoryerrorpattern.match(response):
+            errormessage = errorpattern.search(response)  #uses a regex to capture any error messages returned
             errormessage = errormessage.string.strip('\t\r\n')  #remove any leading or trailing tabs or end of lines
-            quit('IGV is unable to save to the desired directory.  Check permissions or if the directory name is invalid.\nIGV response - ' + errormessage)
-        if re.match('^ERROR\W*?\w+?', response, re.IGNORECASE):  #checks to see if the response was an error message (which will begin with "Error")
-            errormessage = re.search('^ERROR\W*?(\w+?)', response, re.IGNORECASE)  #uses a regex to capture any error messages returned
+            raise IGVError('IGV is unable to save to the desired directory.  Check permissions or if the directory name is invalid.\nIGV response - ' + errormessage)
+        if errorpattern.match(response):  #checks to see if the response was an error message (which will begin with "Error")
+            errormessage = errorpattern.search(response)  #uses a regex to capture any error messages returned
             errormessage = errormessage.string.strip('\t\r\n')  #remove any leading or trailing tabs or end of lines
             print ('\nIGV returned the message:' + errormessage)
             return False
@@ -273,38 +964,35 @@ def awaitIGVResponse(igv, expectedresponse =''):  #the second argument here is o
         if response == expectedresponse: #asks if IGV responded in the expected manner
             return True  #if so, returns true
         else:
-            usage('IGV returned an unexpected response to a test command.')  #if not, displays an error message
-            igv.close()
-            quit()
+            raise IGVError('IGV returned an unexpected response to a test command.')
                 
-def bamfile(filename): #checks the validity of the entered bam file
-    import re
-    if not fileexists(filename):  #checks to be sure the file exists
-        return False  #if not, returns a false value
-    return re.match('.*\.bam$', filename)  #checks to make sure that the filename ends in .bam
+def bamfile(filename, checked = None): #checks the validity of the entered bam file.  If checked (the results of a preflight check) already has an answer for this file, we go with that instead of looking at the disk again
+    if checked is not None and filename in checked:
+        return checked[filename] in ('', noindex)  #an empty reason means nothing was wrong with it, and a missing index is only worth a warning
+    if not bampattern.match(filename):  #checks to make sure that the filename ends in .bam (this costs nothing, so it goes before looking at the disk, which can be slow on a network drive)
+        return False
+    return fileexists(filename)  #checks to be sure the file exists
 
 def fileexists(filename):  #subroutine to confirm that a file exists
-    import os
     test = os.path.isfile(filename)  #sets test to the boolean of if the file exists 
     return test  #and returns that boolean value
 
 def wellformed(locus):  #subroutine to make sure that the locus looks like a locus
-    import re
-    foundlocus = re.match('(1|2|3|4|5|6|7|8|9|10|11|12|13|14|15|16|17|18|19|20|21|22|X|x|Y|y|mt|MT|Mt)(\:\d+)', locus)  #a regex that will capture a cromosome (1-22 or X or Y or mt)
+    foundlocus = locuspattern.match(locus)  #a regex that will capture a contig name (1-22, X, Y, or MT for human, but any name the genome uses will do) and a position.  Whether the genome really has the contig is checked as the list is read, if we were given its contigs
     if foundlocus:  #if it found something that looked like a locus
         return (True)  #returns true for a successful run and a string with the locus itself (now cleaned up)
     else:
         return (False)
 
-def multibamlist(list, badbams):  #function for looking through several lines to see if they have multiple bam files listed
+def multibamlist(list, badbams, checked = None):  #function for looking through several lines to see if they have multiple bam files listed
     for line in list: #creates a loop throught he lines
-        line = line.split('\t')
-        if multibam(line, badbams, True): #runs the multibam test for each line individually
+        line = line.strip('\r\n\t ').split('\t')  #without the line ending, the last file on the line would never be found
+        if multibam(line, badbams, True, checked): #runs the multibam test for each line individually
             return True  #returns true if any of them are multibams
     else:
         return False #returns false if none of them are
 
-def multibam(line, badbams, testonly = False):  #function for testing a single line to see if multiple valid bam files are listed
+def multibam(line, badbams, testonly = False, checked = None):  #function for testing a single line to see if multiple valid bam files are listed
     bamfiles = 0  
     for i in range(0,len(line)):  #sets up a loop to iterate through the elements on the line
         if i == 0:  #if we are looking at the first element (should be a genomic locus)
@@ -316,12 +1004,53 @@ def multibam(line, badbams, testonly = False):  #function for testing a single l
                     break  #end this loop entirely and move on to the next block of code
         else:
             if line[i] not in badbams:
-                if bamfile(line[i]):  #checks to see if the file listed looks like a bam file and actually exists
+                if bamfile(line[i], checked):  #checks to see if the file listed looks like a bam file and actually exists
                     bamfiles += 1 #if so, adds 1 to the count of bamfiles
         if bamfiles > 1:  #after completing the loop through the elements on the line, if there is more than one valid file listed
             return True #send back a value of True
     return False  #otherwise we return a value of false (this line did not have multiple bam files)
 
+def listbams(numberedlines):  #reads through (line number, line) pairs and collects every distinct bam file path listed on a usable line, in the order they first appear
+    bams = {}  #a dictionary keeps the order and finds repeats quickly
+    for linecount, line in numberedlines:
+        locusarray = clean(line, ())
+        if not locusarray:  #lines without a valid locus will be skipped anyway, so their files do not matter
+            continue
+        for bam in locusarray[1:]:
+            bams[bam] = True
+    return list(bams)
+
+noindex = 'no .bai or .csi index found'  #the one thing checkbam finds that is only a warning, since IGV can read a small BAM file without one (or the index may be somewhere we do not look)
+
+def checkbam(filename):  #works out whether IGV will be able to load a bam file.  Returns an empty string if so, the reason why not, or noindex if it may have trouble
+    if not filename.endswith('.bam'):
+        return 'not a BAM file'
+    if not os.path.isfile(filename):
+        return 'missing'
+    for index in (filename + '.bai', filename[:-4] + '.bai', filename + '.csi'):  #IGV will look for the index under any of these names
+        if os.path.isfile(index):
+            return ''
+    return noindex
+
+def preflight(filenames, threads):  #checks every bam file (and its index) at once on a pool of threads, since on a network drive almost all of the time is spent waiting on the server.  Returns a dictionary of file -> reason it cannot be used (empty if it is fine), which can be handed to bamfile so nothing is checked twice
+    with concurrent.futures.ThreadPoolExecutor(max_workers = threads) as pool:
+        reasons = pool.map(checkbam, filenames)  #gives the answers back in the same order as the files
+        return dict(zip(filenames, reasons))
+
+def reportbams(checked):  #tells the user about every bam file the preflight check found a problem with.  Returns the set of those that cannot be used (files with no index are only warned about and still loaded)
+    badbams = set([bam for bam in checked if checked[bam] and checked[bam] != noindex])
+    unindexed = [bam for bam in checked if checked[bam] == noindex]
+    if unindexed:
+        print ('WARNING: ' + str(len(unindexed)) + ' of ' + str(len(checked)) + ' BAM files have no .bai or .csi index next to them.  They will still be loaded, but IGV may be slow or unable to show them:')
+        for bam in unindexed:
+            print ('\t' + bam)
+    if badbams:
+        print (str(len(badbams)) + ' of ' + str(len(checked)) + ' BAM files cannot be used and will be skipped:')
+        for bam in checked:
+            if bam in badbams:
+                print ('\t' + bam + ' (' + checked[bam] + ')')
+    return badbams
+
 def getphotoprefs():
     answer = False
     while not answer:  #enters the loop and stays in it until a valid answer is given
@@ -335,19 +1064,20 @@ def getphotoprefs():
             print('Invalid response.')
             answer = False #set answer to false so the loop will continue until a satisfactory answer is given
 
-def cmdsetimagedirectory(directory, igv):
-    import socket
-    import os
+def cmdsetimagedirectory(directory, igv, metrics = None):
     if directory[0] != '/':  #checks if the directory being used is absolute (starts with a slash) or relative (does not)
         cwd = os.getcwd()  #if a relative directory is being used, this gets the current working directory (CWD)
         directory = cwd + '/' + directory  #and adds it to the relative directory we have been using because IGV does not know what the working directory is (and will become very cross with us for passing a bogus directory here)
+    sent = time.time()
     try:
         igv.send(rawbytes('snapshotDirectory \"' + directory + '\"\n'))  #tells IGV where to save the snapshot  sends the directory in quotes to avoid errors caused by spaces in the path
     except BrokenPipeError:
-        quit('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
     except:
-        quit('Unexpected error sending SNAPSHOTDIRECTORY command to IGV.')
-    return awaitIGVResponse(igv)  #this is another (more efficient) way of ending my subroutines.  Functionally, this is the same as my usual endings using the "success" variable
+        raise IGVError('Unexpected error sending SNAPSHOTDIRECTORY command to IGV.')
+    success = awaitIGVResponse(igv)
+    recordtime(metrics, 'snapshotDirectory', sent)
+    return success
 
 def yesanswer(question):  #asks the question passed in and returns True if the answer is yes, False if the answer is no, and keeps the user in a loop until one of those is given.  Also useful for walking students through basic logical python functions
     answer = False  #initializes the answer variable to false.  Not absolutely necessary, since it should be undefined at this point and test to false, but explicit is always better than implicit
@@ -362,8 +1092,14 @@ def yesanswer(question):  #asks the question passed in and returns True if the a
             print ('Invalid response.')
             answer = False #set ansewr to false so the loop will continue until a satisfactory answer is given
     
+def keepgoing(askcontinue):  #decides whether to carry on after a problem such as a file that would not load.  askcontinue is the error policy: 'ask' (or True) asks the user, 'skip' (or False) carries on without asking, as is needed when nobody is watching, and 'stop' ends the run
+    if askcontinue == 'stop':
+        return False
+    if askcontinue and askcontinue != 'skip':
+        return yesanswer('Do you want to continue the run?')
+    return True
+
 def loadprefs(prefsfile): 
-    import os
     if prefsfile:  #if a preferences file is already specified (because the user specified one on the command line)
         prefslist = parseprefs(prefsfile)  #try to load the user-specified prefs file
         if prefslist:  #if we could load it and generate a good preferences list from it
@@ -392,7 +1128,6 @@ def loadprefs(prefsfile):
                 quit('Unexpected problem creating or reading new preferences file.')  #quitting for safety, as something must be wrong here
         
 def parseprefs(prefsfile):  #this function does the actual reading of the preferences file
-    import os
     if os.path.isfile(prefsfile):  #checks to make sure that the prefs file specified exists, otherwise skips directly to the final else statement and returns False (we read no prefs from no files)
         file = open(prefsfile, 'r')  #open the prefs file that we just checked to make sure is there.  Not going to put an error handler on this, as any error is something the user needs to see and should quit the program
         line = file.readline()  #reads the first line of the file
@@ -406,7 +1141,8 @@ def parseprefs(prefsfile):  #this function does the actual reading of the prefer
             if line:  #if line is not blank
                 prefslist.append(line)  #add it to the list of preferences in order
         try:  #this is actually to perform another test of validity
-            int(prefslist[1])  #try turning the value in the preferences file that was given as the port number into an integer
+            for port in prefslist[1].split(','):  #the port line can hold a comma-separated list of ports for a pool of IGV instances
+                int(port)  #try turning each value in the preferences file that was given as a port number into an integer
         except ValueError:  #if we get back a ValueError (because it was not something that could be turned into an integer type of variable)
             return False  #return False because something is wrong with the data in the file
         return prefslist  #otherwise return the validated list
@@ -414,7 +1150,6 @@ def parseprefs(prefsfile):  #this function does the actual reading of the prefer
         return False  #skip everything above and just return false, there was nothing to read or test in the file
     
 def makeprefsfile(prefsfile):  #makes a new preferences file if the old one was not found (the status of the old one was determined in a higher subroutine)
-    import os
     if os.path.isfile(prefsfile):  #checks to make sure that no preferences file exists (this avoids risk of overwriting something unintentionally and forces the user to delete the old file themselves if there was one)
         quit('Default prefsfile already found.  Please delete this file and then start again.')
 #begin default settings, only change if you know what you are doing
@@ -458,37 +1193,2881 @@ def makeprefsfile(prefsfile):  #makes a new preferences file if the old one was
     output.write(allprefs)  #writes the already formed preferences string to the file
     output.close()  #closes the file  (because we did not set any different buffering for the file, Python does not purge the buffer and write the actual file until this step, I believe.  If we were writing a VCF with gigs of data, how would we want to do this differently?)
     
+def compileline(locusarray, linecount, stackshot, singleshot, nocollapse, badbams, label = '', groupsingles = False, reusetracks = False, checked = None):  #turns a cleaned line into the list of steps (IGV commands) needed to take its photos.  Each step is (command, argument, line number, locus, bam file) so that we know what it was for if something goes wrong.  With groupsingles, the single photos are left for compilesingles to gather up by bam file.  With reusetracks, the group photo asks for its set of tracks instead of starting from scratch
+    bams = []  #the bam files on this line that we will actually try to load
+    newbadbams = []  #any bam files we found to be missing or invalid while compiling this line, so the caller can decide whether to keep going
+    for i in range(1, len(locusarray)):
+        if not locusarray[i]:  #if the element that should contain a bam file is just a blank 
+            continue #skip everything and go on to the next
+        if locusarray[i] in badbams:  #note that this should not be engaged, as the clean function should keep a previously-known bad bamfile from even getting here
+            print(label + 'Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') as it could not be opened previously.')
+            continue
+        if not bamfile(locusarray[i], checked): #checks for a valid bamfile
+            badbams.add(locusarray[i])
+            newbadbams.append(locusarray[i])
+            print(label + 'Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') due to it being missing or not a valid BAM file.')
+            continue
+        bams.append(locusarray[i])
+    if not bams:  #nothing left to take a picture of
+        print(label + 'Skipped line ' + str(linecount) + ' (locus ' + locusarray[0] + ') as no valid BAM files were specified for it.')
+        return ([], newbadbams, bams)
+    locus = locusarray[0]
+    steps = [('goto', locus, linecount, locus, None)]  #We can have this first because IGV will keep the previous locus after a "new" command.  If it stops doing this, we have to move the goto after each "new".
+    firstshot = False  #will be set to the bam file whose single photo we took while building the group photo
+    if stackshot and (len(bams) > 1 or not singleshot):  #if the user selected to get group photos of multiple bam files at each locus it will do this (if the user selected both multi and single image outputs and the line only had a single valid bam file, this will be skipped as both the multi and single shots would look the same)
+        if reusetracks:  #whatever IGV already has loaded will be compared to this set when the step is run, and only the differences loaded or removed
+            steps.append(('tracks', tuple(bams), linecount, locus, None))
+        else:
+            steps.append(('new', None, linecount, locus, None))  #clear the IGV screen
+        for bam in bams:
+            if reusetracks:  #the tracks step already took care of loading, and the first file will not be on its own if other tracks were kept
+                break
+            steps.append(('load', bam, linecount, locus, bam))
+            if not firstshot and singleshot and not groupsingles:  #the first file loaded for the group photo is already on its own, so we can take its single photo now and save a new/load later
+                if not nocollapse:
+                    steps.append(('collapse', None, linecount, locus, bam))
+                steps.append(('snapshot', imagename(bam, locus), linecount, locus, bam))
+                firstshot = bam
+        if not nocollapse:
+            steps.append(('collapse', None, linecount, locus, 'all'))
+        steps.append(('snapshot', imagename('all', locus), linecount, locus, 'all'))
+    if singleshot and not groupsingles:
+        for bam in bams:
+            if bam == firstshot:  #already taken above
+                firstshot = False
+                continue
+            steps.append(('new', None, linecount, locus, bam))
+            steps.append(('load', bam, linecount, locus, bam))
+            if not nocollapse:
+                steps.append(('collapse', None, linecount, locus, bam))
+            steps.append(('snapshot', imagename(bam, locus), linecount, locus, bam))
+    if len(steps) == 1:  #only the goto, because all of the photos were left for compilesingles
+        steps = []
+    return (steps, newbadbams, bams)
+
+def locuskey(locus):  #gives a sort key for a locus so that loci sort by chromosome (1-22, X, Y, MT, then any other contigs by name) and then by position
+    contig, position = locus.rsplit(':', 1)  #from the right, since a few contig names (such as HLA alleles) have colons in them
+    chromosomeorder = {'X' : 23, 'Y' : 24, 'M' : 25, 'MT' : 25}
+    if contig.upper() in chromosomeorder:
+        chromosome = (0, chromosomeorder[contig.upper()], '')
+    elif contig.isdigit():
+        chromosome = (0, int(contig), '')
+    else:
+        chromosome = (1, 0, contig)
+    position = positionpattern.match(position)  #only the start of the position counts, in case it was given as a range
+    return (chromosome, int(position.group(0)))
+
+def locusend(locus):  #gives the last position a locus covers (the end of a range, or the position itself)
+    position = rangepattern.match(locus.rsplit(':', 1)[1])
+    if position.group(3):
+        return int(position.group(3))
+    return int(position.group(1))
+
+def clusterloci(loci, window = None):  #sorts a list of (line number, locus) by chromosome and position and splits it into clusters of loci on the same chromosome that start within window bases of the first one in the cluster.  With no window, only lines with exactly the same locus end up together (they would give identical images anyway)
+    clusters = []
+    for linecount, locus in sorted(loci, key = lambda numberedlocus: (locuskey(numberedlocus[1]), numberedlocus[0])):
+        key = locuskey(locus)
+        if clusters:
+            firstkey = locuskey(clusters[-1][0][1])
+            if window is None and locus == clusters[-1][0][1]:
+                clusters[-1].append((linecount, locus))
+                continue
+            if window is not None and key[0] == firstkey[0] and key[1] - firstkey[1] <= window:
+                clusters[-1].append((linecount, locus))
+                continue
+        clusters.append([(linecount, locus)])
+    return clusters
+
+def clusterview(cluster, merge = False):  #works out what to show IGV for a cluster of loci.  Returns the argument for the goto (several loci for split panels, or one region covering them all with merge) and the region the cluster covers, which is used to name its image
+    loci = []  #each distinct locus once, in order
+    for linecount, locus in cluster:
+        if locus not in loci:
+            loci.append(locus)
+    if len(loci) == 1:  #nothing to cluster, so it looks just like it would have without clustering
+        return (loci[0], loci[0])
+    chromosome = loci[0].rsplit(':', 1)[0]
+    start = min([locuskey(locus)[1] for locus in loci])
+    end = max([locusend(locus) for locus in loci])
+    region = chromosome + ':' + str(start) + '-' + str(end)
+    if merge:
+        padding = 20  #a few bases either side so that loci right at the edges are not cut off
+        return (chromosome + ':' + str(max(1, start - padding)) + '-' + str(end + padding), region)
+    return (' '.join(loci), region)  #goto adds the chr in front of each one if it needs it
+
+def openmanifest(directory, name = 'autoIGVmanifest.txt'):  #opens the manifest for this run, adding to the end of any manifest already there (as when resuming).  The lines a resumed run compiles again are already in it, so those are remembered and not written twice
+    manifestfile = directory + '/' + name
+    written = set()
+    if os.path.isfile(manifestfile):
+        with open(manifestfile) as existing:
+            written = set([line for line in existing if not line.startswith('#')])
+    output = open(manifestfile, 'a')
+    if not os.path.getsize(manifestfile):
+        output.write('#line\tlocus\tbam\timage\tpanel\n')
+    return {'file' : output, 'written' : written}
+
+def writemanifest(manifest, cluster, bam, image, merge = False):  #writes down which image (and which panel of it) each line in a cluster ended up in
+    if not manifest:
+        return
+    loci = []
+    for linecount, locus in cluster:
+        if locus not in loci:
+            loci.append(locus)
+    for linecount, locus in cluster:
+        panel = str(loci.index(locus) + 1)
+        if merge and len(loci) > 1:
+            panel = 'merged'
+        entry = str(linecount) + '\t' + locus + '\t' + bam + '\t' + image + '\t' + panel + '\n'
+        if entry not in manifest['written']:
+            manifest['file'].write(entry)
+
+def compilecluster(cluster, bams, nocollapse, reusetracks = False, merge = False, manifest = None):  #compiles the group photo for a cluster of lines that all list the same bam files
+    gotoargument, region = clusterview(cluster, merge)
+    linecount = cluster[0][0]  #the cluster goes by its first line
+    image = imagename('all', region)
+    steps = [('goto', gotoargument, linecount, region, None)]
+    if reusetracks:
+        steps.append(('tracks', tuple(bams), linecount, region, None))
+    else:
+        steps.append(('new', None, linecount, region, None))
+        for bam in bams:
+            steps.append(('load', bam, linecount, region, bam))
+    if not nocollapse:
+        steps.append(('collapse', None, linecount, region, 'all'))
+    steps.append(('snapshot', image, linecount, region, 'all'))
+    writemanifest(manifest, cluster, 'all', image, merge)
+    return steps
+
+def compilesingles(singles, nocollapse, window = None, merge = False, manifest = None):  #gathers up the single photos from the whole list by bam file so that each file is loaded only once, then visited at each of its loci in chromosome order.  singles is a list of (line number, locus, bam file).  With a window, nearby loci are photographed together (see clusterloci).  Returns one chunk of steps for each bam file
+    groups = {}  #bam file -> list of (line number, locus), kept in the order the files first appear in the list
+    for linecount, locus, bam in singles:
+        if bam not in groups:
+            groups[bam] = []
+        groups[bam].append((linecount, locus))
+    chunks = []
+    for bam in groups:
+        steps = [('new', None, None, None, bam), ('load', bam, None, None, bam)]  #these belong to every line in the group, so they have no line number of their own
+        if not nocollapse:
+            steps.append(('collapse', None, None, None, bam))  #collapsing is a setting on the tracks, so once per load is enough
+        for cluster in clusterloci(groups[bam], window):  #the same locus in the same file on another line would give an identical image with the same name, so it is only taken once
+            gotoargument, region = clusterview(cluster, merge)
+            image = imagename(bam, region)
+            steps.append(('goto', gotoargument, cluster[0][0], region, bam))
+            steps.append(('snapshot', image, cluster[0][0], region, bam))
+            writemanifest(manifest, cluster, bam, image, merge)
+        chunks.append(steps)
+    return chunks
+
+def compilechunks(numberedlines, stackshot, singleshot, nocollapse, badbams, loadonce = False, label = '', reusetracks = False, groupbytracks = False, checked = None, window = None, merge = False, manifest = None):  #compiles every line in a list (or reader) of (line number, line) pairs into chunks of steps that can each be run on their own (one per line, or with loadonce, one per line for group photos and one per bam file for single photos).  With a window, nearby loci with the same bam files are clustered into one photo each, and which photo each line ended up in is written to the manifest.  Chunks are handed back one at a time as they are ready, so this can be used in a for loop.  Problems are reported as we go, but nobody is asked whether to continue since nothing is being run yet
+    chunks = []  #group photo chunks being held back for groupbytracks
+    singles = []  #single photos left to be gathered up by bam file when loadonce is set
+    clusters = {}  #bam files on a line -> list of (line number, locus) for its group photos, when clustering
+    if window is not None:  #clusters can only be made once the whole list has been seen, so the single photos are gathered up as well
+        loadonce = True
+    for linecount, locus in numberedlines:
+        if not locus: #if the line is blank, ignore it entirely 
+            continue
+        locusarray = clean(locus, badbams)
+        if not locusarray:  #if clean returned a value of false due to a problem with the line
+            print(label + 'Skipped line ' + str(linecount) + ' as it does not contain a valid locus.')
+            continue
+        if len(locusarray) == 1:
+            print(label + 'Skipped line ' + str(linecount) + ' (locus ' + locusarray[0] + ') as no valid BAM files were specified for it.')
+            continue
+        steps, newbadbams, bams = compileline(locusarray, linecount, stackshot, singleshot, nocollapse, badbams, label, loadonce, reusetracks or groupbytracks, checked)
+        if steps and window is not None:  #only the line and its bam files are needed to cluster it later
+            if tuple(bams) not in clusters:
+                clusters[tuple(bams)] = []
+            clusters[tuple(bams)].append((linecount, locusarray[0]))
+        elif steps and groupbytracks:  #these have to wait until we have seen them all so they can be put in order
+            chunks.append(steps)
+        elif steps:
+            yield steps  #hand this chunk back right away so that it can be run before the rest of the list has even been read
+        if loadonce and singleshot:
+            for bam in bams:
+                singles.append((linecount, locusarray[0], bam))
+    for bams in clusters:
+        for cluster in clusterloci(clusters[bams], window):
+            steps = compilecluster(cluster, bams, nocollapse, reusetracks or groupbytracks, merge, manifest)
+            if groupbytracks:
+                chunks.append(steps)
+            else:
+                yield steps
+    if groupbytracks:
+        for steps in groupchunksbytracks(chunks):
+            yield steps
+    if singles:
+        for steps in compilesingles(singles, nocollapse, window, merge, manifest):
+            yield steps
+
+def compilerun(numberedlines, genomes, *options):  #compiles the run with compilechunks (which takes the same options), or with a genome column, one genome at a time with compilegenomes
+    if genomes:
+        return compilegenomes(genomes, *options)
+    return compilechunks(numberedlines, *options)
+
+def compilegenomes(genomes, *options):  #compiles a list with a genome column one genome at a time, reading the list once for each so that the lines for one genome never wait in memory for another's.  Each chunk starts with a genome step (which does nothing if IGV already has that genome), since with a pool of IGV instances any of them may get it, and its images go in that genome's subdirectory
+    for genomeid in genomes['order']:
+        adapter = dict(genomes['adapter'])
+        adapter['only'] = genomeid
+        adapter['first'] = genomes['order'][0]
+        numberedlines = readlist(genomes['file'], genomes['position'], adapter)
+        if genomes.get('plan'):
+            numberedlines = countlines(numberedlines, genomes['plan'])
+        folder = genomes['folders'][genomeid] + '/'
+        for steps in compilechunks(numberedlines, *options):
+            genomesteps = [('genome', genomeid, None, None, None)]
+            for command, argument, linecount, locus, bam in steps:
+                if command == 'snapshot':
+                    argument = folder + argument
+                genomesteps.append((command, argument, linecount, locus, bam))
+            yield genomesteps
+
+def trackset(steps):  #finds the set of tracks a chunk's group photo asks for (or None if it has no group photo)
+    for step in steps:
+        if step[0] == 'tracks':
+            return step[1]
+    return None
+
+def trackchanges(loaded, wanted):  #works out the fewest commands that will take IGV from the tracks it has loaded to the ones we want, keeping the tracks in the order we want them.  loaded is None if we do not know what IGV has loaded.  Returns a list of (command, bam file)
+    if loaded == list(wanted):  #nothing to do at all
+        return []
+    if loaded is not None:
+        kept = [track for track in loaded if track in wanted]
+        if (kept or not loaded) and kept == list(wanted[:len(kept)]):  #if the tracks we keep are already at the top in the right order (or IGV has nothing loaded at all), we only have to remove the others and add the rest below them
+            changes = [('remove', track) for track in loaded if track not in wanted]
+            changes += [('load', track) for track in wanted[len(kept):]]
+            return changes
+    changes = [('new', None)]  #otherwise it is quicker (and safer) to start over
+    changes += [('load', track) for track in wanted]
+    return changes
+
+def groupchunksbytracks(chunks, limit = 50):  #reorders the chunks so that lines with the same (or overlapping) group photo tracks are next to each other, then joins each run of identical sets into chunks of up to limit lines so that they stay on one IGV instance in a pool (without putting a whole list that shares one set of tracks on a single instance)
+    sets = {}  #track set -> chunks asking for it, in the order they appear
+    for steps in chunks:
+        tracks = trackset(steps)
+        if tracks not in sets:
+            sets[tracks] = []
+        sets[tracks].append(steps)
+    if not sets:  #nothing compiled (every line was bad, or a resumed run had already finished them all)
+        return []
+    remaining = list(sets.keys())
+    order = [remaining.pop(0)]
+    while remaining:  #greedily pick the set that needs the fewest commands to reach from the last one
+        last = order[-1]
+        best = min(remaining, key = lambda tracks: len(trackchanges(list(last) if last else None, tracks or ())))
+        remaining.remove(best)
+        order.append(best)
+    grouped = []
+    for tracks in order:
+        if tracks is None:  #chunks with no group photo have nothing to share
+            grouped += sets[tracks]
+        else:
+            for first in range(0, len(sets[tracks]), limit):
+                grouped.append([step for steps in sets[tracks][first:first + limit] for step in steps])
+    return grouped
+
+def newsession(igv, endpoint, genome, directory, journal = None, subdirectory = '', policy = None, cache = None):  #sets up the dictionary a worker uses to remember its IGV instance: the connection itself, what it has loaded, and how to set it up again from scratch if the connection has to be remade
+    if not policy:
+        policy = {'retries' : 0, 'igvcommand' : None, 'onerror' : 'ask'}
+    return {'igv' : igv,
+            'endpoint' : endpoint,  #(host, port)
+            'genome' : genome,
+            'directory' : directory,  #where this instance saves its snapshots
+            'tracks' : None,  #None means we do not know what IGV has loaded, so the first group photo will start from scratch
+            'journal' : journal,
+            'subdirectory' : subdirectory,
+            'policy' : policy,
+            'cache' : cache,  #where to keep a copy of each image taken, if we are caching them
+            'attempt' : 0}  #how many times we have retried the chunk we are on
+
+def launchigv(igvcommand, port, label = ''):  #starts a new copy of IGV with the command the user gave us (with {port} replaced by the port it should listen on), without waiting for it
+    command = igvcommand.replace('{port}', str(port))
+    print (label + 'Starting IGV with: ' + command)
+    try:
+        subprocess.Popen(shlex.split(command), stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, start_new_session = True)  #in its own session so that it keeps going if we are stopped
+    except OSError as error:
+        print (label + 'Unable to start IGV (' + str(error) + ').')
+
+def reconnect(session, label = ''):  #remakes a lost connection to IGV, waiting longer between each try (and starting IGV again if it is not answering at all and we know how), then sets the genome and snapshot directory again.  Returns True if it worked
+    host, port = session['endpoint']
+    try:
+        session['igv'].close()
+    except OSError:
+        pass
+    launched = False
+    wait = 1
+    for attempt in range(0, 8):  #about four minutes in all, which is enough for IGV to start up again on a slow machine
+        time.sleep(wait)
+        wait = min(wait * 2, 60)
+        igv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        igv.settimeout(20)
+        try:
+            igv.connect((host, port))
+        except ConnectionRefusedError:  #nothing is listening, so IGV has most likely crashed or been closed
+            igv.close()
+            if session['policy']['igvcommand'] and not launched:
+                launchigv(session['policy']['igvcommand'], port, label)
+                launched = True
+            continue
+        except OSError:
+            igv.close()
+            continue
+        try:  #everything below raises IGVError if IGV does not answer properly, which here just means trying again
+            igv.send(rawbytes('echo\n'))
+            awaitIGVResponse(igv, 'echo')
+            if not cmdgenome(session['genome'], igv):
+                raise IGVError('Failed to set the genome.')
+            if not cmdsetimagedirectory(session['directory'], igv):
+                raise IGVError('Failed to set the snapshot directory.')
+        except (IGVError, OSError):
+            igv.close()
+            continue
+        session['igv'] = igv
+        session['tracks'] = None  #a new (or reconnected) IGV may have anything loaded, so the next group photo starts from scratch
+        print (label + 'Reconnected with IGV on ' + host + ':' + str(port) + '.')
+        return True
+    return False
+
+def commandtimeout(metrics, command, filename = None, attempt = 0):  #works out how long to wait for IGV to answer a command, based on how long that command has been taking so far in this run (and how big the file is, for loads).  Each retry of the same chunk waits twice as long as the last
+    timeout = 20.0  #the usual timeout, which is plenty for most commands
+    if metrics:
+        with metrics['lock']:
+            totals = metrics['commands'].get(command)
+            if totals and totals['count'] >= 5:  #enough to go on
+                timeout = max(timeout, 10 * totals['seconds'] / totals['count'], 3 * totals['max'])
+            if command == 'load' and filename:
+                if filename not in metrics.setdefault('sizes', {}):  #looked up once per file, since each look can be slow on a network drive
+                    try:
+                        metrics['sizes'][filename] = os.path.getsize(filename)
+                    except OSError:
+                        metrics['sizes'][filename] = 0
+                timeout += 10 * metrics['sizes'][filename] / 1000000000  #ten more seconds for every gigabyte
+    return min(timeout * 2 ** attempt, 600)
+
+def adapttimeout(igv, session, metrics, command, filename = None):  #sets the timeout for the next command, if we are retrying failed chunks (otherwise the usual timeout is left alone)
+    if session and session.get('policy') and session['policy']['retries']:
+        igv.settimeout(commandtimeout(metrics, command, filename, session['attempt']))
+
+def supervise(steps, igv, position, badbams, askcontinue = True, label = '', session = None):  #runs a chunk of steps just like runsteps, but if the policy allows retries and something goes wrong with IGV partway through, remakes the connection and runs the chunk again (leaving out any photos it already took) instead of giving up on the run
+    if not session or not session.get('policy') or not session['policy']['retries']:
+        runsteps(steps, igv, position, badbams, askcontinue, label, session)
+        return
+    retries = session['policy']['retries']
+    session['attempt'] = 0
+    while True:
+        try:
+            runsteps(steps, session['igv'], position, badbams, askcontinue, label, session)
+            session['attempt'] = 0
+            return
+        except IGVError as error:
+            if isinstance(error, IGVStopped) or session['attempt'] >= retries:  #the user (or the error policy) chose to stop, or we have already tried enough times
+                raise
+            message = str(error) or 'see previous lines for details'
+        session['attempt'] += 1
+        print ('\n' + label + 'Problem with IGV (' + str(message) + '); reconnecting to try again (' + str(session['attempt']) + ' of ' + str(retries) + ').')
+        if not reconnect(session, label):
+            raise IGVError('Unable to reconnect with IGV on ' + session['endpoint'][0] + ':' + str(session['endpoint'][1]) + '.')
+        if session.get('journal'):  #anything this chunk already photographed does not need doing again
+            steps = skipfinished(steps, session['journal']['done'])
+
+def runsteps(steps, igv, position, badbams, askcontinue = True, label = '', session = None):  #sends a list of compiled steps to IGV one at a time, waiting for each one to finish and handling any errors.  session is a dictionary that remembers what this IGV instance has loaded from one call to the next
+    if session is None:
+        session = {'tracks' : None}  #None means we do not know what IGV has loaded, so the first group photo will start from scratch
+    skipline = False  #set to a line number if we could not go to its locus, so that we do not take pictures of the wrong place
+    metrics = position.get('metrics')  #if we are timing commands
+    for command, argument, linecount, locus, bam in steps:
+        if bam in badbams:  #this file failed to load earlier, so there is nothing to photograph
+            continue
+        adapttimeout(igv, session, metrics, command, argument)
+        if command == 'genome':
+            if argument != session.get('genome'):  #chunks come grouped by genome, so this only happens when the run moves on to the next one
+                print (label + 'Switching IGV to the genome ' + argument + '...')
+                if not cmdgenome(argument, igv, metrics):
+                    igv.close()
+                    raise IGVError('Failed to communicate with IGV when switching to the genome ' + argument + '.')
+                session['genome'] = argument  #remembered in case the connection has to be remade
+                session['tracks'] = None  #a new genome starts IGV over with no tracks
+            continue
+        if command == 'goto':
+            skipline = False
+            if not cmdgotolocus(argument, igv, metrics): #This subroutine will return a value of True if it executes successfully and gets no error message from IGV
+                print (label + 'Error loading going to locus ' + locus + ' see previous line for details.  Skipping to next locus.')  #so if false is returned, it will display an error message and try the next locus
+                skipline = linecount
+            continue
+        if linecount and linecount == skipline:  #steps shared by several lines (such as loading a file once for all of its single photos) have no line number and are never skipped this way
+            continue
+        where = ''
+        if linecount:
+            where = ' for line ' + str(linecount)
+        if command == 'tracks':
+            settracks(argument, igv, badbams, session, askcontinue, label, where, metrics)
+        elif command == 'new':
+            if not cmdnew(igv, metrics):  #clear the IGV screen
+                igv.close()
+                raise IGVError('Failed to communicate with IGV on "new" command' + where + '.')
+            session['tracks'] = []
+        elif command == 'load':
+            if not cmdloadfile(argument, igv, metrics): #tells IGV to load the file
+                print (label + 'Error loading file ' + argument + where + '; see previous line for details.  Skipping to next file.')
+                badbams.add(argument)
+                badbams.add(bam)  #the same unless the file was staged, in which case the steps after this one still go by the original
+                if not keepgoing(askcontinue):
+                    raise IGVStopped('OK. Goodbye.')
+            elif session['tracks'] is not None:
+                session['tracks'].append(argument)
+        elif command == 'collapse' or command == 'snapshot':
+            if command == 'snapshot':
+                print (label + 'Processing line ' + str(linecount) + ', ' + progress(position) + ' (' + argument + ').', end = ' \r')
+                success = cmdsnapshot(argument, igv, metrics)  #tells IGV to shoot the image
+                if success and session.get('cache'):  #keep a copy for the next run that needs the same image.  This has to come before the journal, which may hand the image to the packer to be taken away
+                    storeimage(session['cache'], session['directory'], argument, badbams)
+                if success and session.get('journal'):
+                    recordsnapshot(session['journal'], (command, argument, linecount, locus, bam), session.get('subdirectory', ''))
+                if success and session.get('taken') is not None:  #photograph keeps a list of the images it actually got
+                    session['taken'].append(argument)
+            else:
+                success = cmdcollapse(igv, metrics)
+            if not success:
+                igv.close()
+                raise IGVError('Problem saving snapshot' + where + ' in ' + bam + ' see previous line for details.\nPlease confirm that the directory /autoIGV/ exists and this script has access to write to it and create subdirectories.  Also try removing any non-word characters or whitespaces from your bam file name.')
+
+def settracks(wanted, igv, badbams, session, askcontinue = True, label = '', where = '', metrics = None):  #gets IGV showing exactly the tracks we want for a group photo, loading or removing only what differs from what it already has
+    wanted = [bam for bam in wanted if bam not in badbams]
+    changes = trackchanges(session['tracks'], wanted)
+    while changes:
+        command, bam = changes.pop(0)
+        adapttimeout(igv, session, metrics, command, bam)
+        if command == 'new':
+            if not cmdnew(igv, metrics):  #clear the IGV screen
+                igv.close()
+                raise IGVError('Failed to communicate with IGV on "new" command' + where + '.')
+            session['tracks'] = []
+        elif command == 'remove':
+            if cmdremovetrack(bam, igv, metrics):
+                session['tracks'].remove(bam)
+            else:  #if IGV would not remove it, we no longer know exactly what it is showing, so we start over
+                print (label + 'Unable to remove ' + bam + where + '; starting over with a new session.')
+                session['tracks'] = None
+                changes = trackchanges(None, wanted)
+        elif command == 'load':
+            if not cmdloadfile(bam, igv, metrics): #tells IGV to load the file
+                print (label + 'Error loading file ' + bam + where + ' in group photo; see previous line for details.  Skipping to next file.')
+                badbams.add(bam)
+                if not keepgoing(askcontinue):
+                    raise IGVStopped('OK. Goodbye.')
+            else:
+                session['tracks'].append(bam)
+
+def expandtracks(steps, genome = None):  #replaces each tracks step with the plain commands it would need, assuming every load works, and leaves out genome steps for the genome IGV will already have (starting from genome).  Hands the steps back one at a time.  This is for batch scripts, where nobody is around to check what IGV actually has loaded
+    loaded = None
+    for step in steps:
+        command, argument, linecount, locus, bam = step
+        if command == 'genome':
+            if argument == genome:
+                continue
+            genome = argument
+            loaded = None  #IGV starts over with no tracks
+        if command == 'tracks':
+            for change, track in trackchanges(loaded, argument):
+                yield (change, track, linecount, locus, track)
+                if change == 'new':
+                    loaded = []
+                elif change == 'remove':
+                    loaded.remove(track)
+                else:
+                    loaded.append(track)
+            continue
+        if command == 'new':
+            loaded = []
+        elif command == 'load' and loaded is not None:
+            loaded.append(argument)
+        yield step
+
+def imageline(locus, linecount, position, igv, stackshot, singleshot, nocollapse, badbams, askcontinue = True, label = '', reusetracks = False, session = None, checked = None):  #takes all of the photos for a single line of the locus list.  askcontinue is turned off for pools of IGV instances, where several workers cannot sensibly share one keyboard, and label tells the user which worker is talking
+    if not locus: #if the line is blank, ignore it entirely 
+        return
+    locusarray = clean(locus, badbams)
+    if not locusarray:  #if clean returned a value of false due to a problem with the line
+        print(label + 'Skipped line ' + str(linecount) + ' as it does not contain a valid locus.')
+        return
+    if len(locusarray) == 1:
+        print(label + 'Skipped line ' + str(linecount) + ' (locus ' + locusarray[0] + ') as no valid BAM files were specified for it.')
+        return
+    steps, newbadbams, bams = compileline(locusarray, linecount, stackshot, singleshot, nocollapse, badbams, label, False, reusetracks, checked)
+    if newbadbams and not keepgoing(askcontinue):
+        raise IGVStopped('OK. Goodbye.')
+    if session and session.get('journal'):  #leave out anything an earlier run already finished
+        steps = skipfinished(steps, session['journal']['done'])
+    if session and session.get('cache') and steps:  #and anything the cache already has
+        steps = cachelookup(steps, session['cache'], session['directory'], session.get('journal'))
+    supervise(steps, igv, position, badbams, askcontinue, label, session)
+
+def goodimage(filename):  #checks that an image file exists and at least starts out looking like a PNG (a crash can leave an empty or partly written file behind)
+    if not os.path.isfile(filename) or not os.path.getsize(filename):
+        return False
+    image = open(filename, 'rb')
+    signature = image.read(8)
+    image.close()
+    return signature == b'\x89PNG\r\n\x1a\n'
+
+def journalkey(step):  #what the journal remembers about a snapshot step: (line number, locus, bam file, group or single), all as text
+    command, argument, linecount, locus, bam = step
+    if bam == 'all':
+        return (str(linecount), locus, bam, 'group')
+    return (str(linecount), locus, bam, 'single')
+
+def readjournal(directory):  #reads the journal of an earlier run in this directory.  Returns the settings it was started with and the set of snapshots it finished whose images are still on disk and look intact
+    settings = {}
+    done = set()
+    journalfile = directory + '/autoIGVjournal.txt'
+    if not os.path.isfile(journalfile):
+        return (settings, done)
+    archived = readarchiveindex(directory)  #images that were already packed away count as finished too
+    journal = open(journalfile, 'r')
+    for line in journal:
+        fields = line.rstrip('\r\n').split('\t')
+        if fields[0] == '#':  #a setting the run was started with
+            if len(fields) == 3:
+                settings[fields[1]] = fields[2]
+            continue
+        if len(fields) != 5:  #most likely the last line, cut off part way through writing when the run died
+            continue
+        if goodimage(directory + '/' + re.sub(r'^worker\d+/', '', fields[4])) or re.sub(r'^worker\d+/', '', fields[4]) in archived:  #the image may have been written into a worker subdirectory, but those are merged before we get here
+            done.add(tuple(fields[:4]))
+    journal.close()
+    return (settings, done)
+
+def openjournal(directory, done, settings, name = 'autoIGVjournal.txt'):  #opens the journal for this run, adding to the end of any journal already there.  The journal is shared by every worker, so it comes with a lock for taking turns writing to it
+    journalfile = directory + '/' + name
+    fresh = not os.path.isfile(journalfile)
+    output = open(journalfile, 'a')
+    if fresh:  #a new run writes down what it was started with, so that --resume can pick up the same settings
+        for setting in settings:
+            output.write('#\t' + setting + '\t' + str(settings[setting]) + '\n')
+        output.flush()
+    return {'file' : output, 'lock' : threading.Lock(), 'done' : done, 'directory' : directory, 'archive' : None}
+
+def recordsnapshot(journal, step, subdirectory = ''):  #adds a finished snapshot to the journal right away, so that it survives the program being killed.  If we are archiving, the image is also handed to the packer
+    key = journalkey(step)
+    with journal['lock']:
+        journal['file'].write('\t'.join(key) + '\t' + subdirectory + step[1] + '\n')
+        journal['file'].flush()  #get it out of our buffer now rather than whenever Python gets around to it
+        journal['done'].add(key)
+    if journal.get('review'):  #the reviewer hands the image on to the packer once it has made its thumbnail
+        journal['review']['queue'].put((subdirectory, step[1], key))
+    elif journal.get('archive'):
+        journal['archive']['queue'].put((journal['directory'] + '/' + subdirectory + step[1], key, step[1]))
+
+def openarchive(directory, shardsize):  #starts the packer, which runs in the background recompressing each finished image and packing it into the current shard, a tar file of at most shardsize bytes in the run directory.  Where each image went is written down in an index next to the shards
+    indexfile = directory + '/autoIGVarchive.txt'
+    fresh = not os.path.isfile(indexfile)
+    index = open(indexfile, 'a')
+    if fresh:
+        index.write('#image\tline\tlocus\tbam\tkind\tshard\toffset\tsize\n')
+        index.flush()
+    archive = {'directory' : directory,
+               'shardsize' : shardsize,
+               'queue' : queue.Queue(),  #(image file, journal key) for each image waiting to be packed
+               'shards' : len([name for name in os.listdir(directory) if re.match(r'^autoIGVarchive\d+\.tar$', name)]),  #a resumed run starts a new shard rather than adding to one that may have been cut off
+               'tar' : None,  #the shard being filled
+               'index' : index,
+               'packed' : 0,
+               'saved' : 0}  #bytes saved by recompressing
+    archive['thread'] = threading.Thread(target = packer, args = (archive,))
+    archive['thread'].daemon = True  #lets the program exit (such as with control-C) without waiting on it
+    archive['thread'].start()
+    return archive
+
+def packer(archive):  #packs images as they are handed over, until it is handed None
+    while True:
+        item = archive['queue'].get()
+        if item is None:
+            break
+        try:
+            packimage(archive, item[0], item[1], item[2])
+        except OSError as error:  #the image stays where it is if it could not be packed
+            print ('\nUnable to archive ' + item[0] + ' (' + str(error) + ').')
+
+def packimage(archive, filename, key, name):  #recompresses one image and adds it to the current shard (starting a new shard if it would not fit), writes down where it went, and removes the loose file.  name is what it is called in the shard and the index: its path within the run directory, so that images in different genomes' subdirectories never clash
+    claimed = filename + '.packing'
+    try:
+        os.replace(filename, claimed)  #renamed first, so that if IGV saves a new image with the same name while we are working, we do not remove that one by mistake
+    except FileNotFoundError:  #already packed (the same image can be finished twice, such as after a retry)
+        return
+    original = open(claimed, 'rb')
+    data = original.read()
+    original.close()
+    smaller = recompresspng(data)
+    archive['saved'] += len(data) - len(smaller)
+    if archive['tar'] is None or (archive['tar'].offset + len(smaller) > archive['shardsize'] and archive['tar'].offset > 0):
+        if archive['tar'] is not None:
+            archive['tar'].close()
+        archive['shards'] += 1
+        archive['shardname'] = 'autoIGVarchive' + str(archive['shards']).zfill(4) + '.tar'
+        archive['tar'] = tarfile.open(archive['directory'] + '/' + archive['shardname'], 'w')  #plain tar, so the shards can also be opened with the usual tools
+    info = tarfile.TarInfo(name)
+    info.size = len(smaller)
+    info.mtime = int(os.path.getmtime(claimed))
+    archive['tar'].addfile(info, io.BytesIO(smaller))
+    archive['tar'].fileobj.flush()  #on disk before the index says it is there
+    offset = archive['tar'].offset - tarfile.BLOCKSIZE * ((info.size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE)  #the image ends the shard so far, padded out to a whole block, which tells us where it starts however long its header was
+    archive['index'].write(name + '\t' + '\t'.join(key) + '\t' + archive['shardname'] + '\t' + str(offset) + '\t' + str(info.size) + '\n')
+    archive['index'].flush()
+    archive['packed'] += 1
+    os.remove(claimed)
+
+def recompresspng(data):  #squeezes a PNG down without changing a single pixel, by joining its image data into one chunk and compressing it again as hard as zlib can.  Gives back the original if that did not make it any smaller (or it does not look like a PNG)
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        return data
+    chunks = []
+    imagedata = []
+    place = 8
+    try:
+        while place < len(data):
+            length, kind = struct.unpack('>I4s', data[place:place + 8])
+            body = data[place + 8:place + 8 + length]
+            place += 12 + length
+            if kind == b'IDAT':
+                if not imagedata:
+                    chunks.append((b'IDAT', None))  #the new image data goes where the first chunk of it was
+                imagedata.append(body)
+            else:
+                chunks.append((kind, body))
+        pixels = zlib.decompress(b''.join(imagedata))
+    except (struct.error, zlib.error):  #cut off or otherwise damaged, so we leave it alone
+        return data
+    output = [data[:8]]
+    for kind, body in chunks:
+        if body is None:
+            body = zlib.compress(pixels, 9)
+        output.append(struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
+    squeezed = b''.join(output)
+    if len(squeezed) < len(data):
+        return squeezed
+    return data
+
+def closearchive(archive):  #waits for the packer to finish everything handed to it and closes the shard and index.  Safe to call more than once
+    if not archive or archive['thread'] is None:
+        return
+    archive['queue'].put(None)
+    archive['thread'].join()
+    archive['thread'] = None
+    if archive['tar'] is not None:
+        archive['tar'].close()
+    archive['index'].close()
+
+def readarchiveindex(directory):  #reads the index of a run's archive.  Returns a dictionary of image name -> (line number, locus, bam file, group or single, shard, offset, size), with the last one packed winning if a name turns up more than once
+    archived = {}
+    indexfile = directory + '/autoIGVarchive.txt'
+    if not os.path.isfile(indexfile):
+        return archived
+    index = open(indexfile, 'r')
+    for line in index:
+        fields = line.rstrip('\r\n').split('\t')
+        if line.startswith('#') or len(fields) != 8:
+            continue
+        archived[fields[0]] = tuple(fields[1:])
+    index.close()
+    return archived
+
+def extractimages(directory, key, destination = '.'):  #copies images out of a run's archive into destination (into the same subdirectory as in the run, for an image in a genome's subdirectory).  key is either the name of an image or a locus, which gets every image taken there.  Returns the names of the images extracted
+    archived = readarchiveindex(directory)
+    wanted = [name for name in archived if name == key or ntpath.basename(name) == key or archived[name][1] == key]
+    for name in wanted:
+        line, locus, bam, kind, shard, offset, size = archived[name]
+        shardfile = open(directory + '/' + shard, 'rb')
+        shardfile.seek(int(offset))  #straight to the image, without reading through the rest of the shard
+        data = shardfile.read(int(size))
+        shardfile.close()
+        if ntpath.dirname(name):
+            os.makedirs(destination + '/' + ntpath.dirname(name), exist_ok = True)
+        output = open(destination + '/' + name, 'wb')
+        output.write(data)
+        output.close()
+    return wanted
+
+def openreview(directory, processes, archive = None, width = 250, pagesize = 50):  #starts the reviewer, which runs in the background while the images are being taken.  It is handed each image as it is written down in the journal, and on a pool of processes makes a thumbnail width pixels across for it and a contact sheet for each locus (the group photo first, then the single photos), then keeps an index of everything, as JSON and as HTML pages of pagesize loci each, in a review subdirectory of the run.  Images an earlier run (or an interrupted one) finished without being reviewed are handed over first.  If we are archiving, each image goes on to the packer once its thumbnail is made
+    folder = directory + '/autoIGVreview'
+    os.makedirs(folder + '/thumbnails', exist_ok = True)
+    os.makedirs(folder + '/sheets', exist_ok = True)
+    review = {'directory' : directory,
+              'folder' : folder,
+              'processes' : processes,
+              'width' : width,
+              'pagesize' : pagesize,
+              'archive' : archive,
+              'queue' : queue.Queue(),  #(worker subdirectory, image, journal key) for each image waiting to be reviewed
+              'images' : {},  #image -> what we know about it (see reviewimage)
+              'loci' : {},  #locus (with the genome's subdirectory in front, if it has one) -> its images, in the order they were finished, and its contact sheet once one is made
+              'dirty' : {},  #locus -> how many images had been reviewed when it last got a new one, for loci whose contact sheet needs making (again)
+              'reviewed' : 0,
+              'sheets' : 0,
+              'failed' : 0,
+              'finished' : False,  #whether we have been handed the None that says nothing more is coming
+              'error' : None,  #what stopped the review, if something did
+              'written' : time.time()}  #when the index was last written
+    reviewfile = folder + '/review.json'
+    if os.path.isfile(reviewfile):  #carrying on from an earlier run
+        try:
+            earlier = json.load(open(reviewfile, 'r'))
+            review['images'] = earlier['images']
+            review['loci'] = earlier['loci']
+        except (ValueError, KeyError):  #cut off part way through writing, so everything gets looked at again
+            pass
+    journalfile = directory + '/autoIGVjournal.txt'
+    if os.path.isfile(journalfile):
+        for line in open(journalfile, 'r'):
+            fields = line.rstrip('\r\n').split('\t')
+            if fields[0] == '#' or len(fields) != 5:
+                continue
+            image = re.sub(r'^worker\d+/', '', fields[4])  #any worker subdirectories were merged before we got here
+            if image not in review['images'] and goodimage(directory + '/' + image):
+                review['queue'].put(('', image, tuple(fields[:4])))
+    review['thread'] = threading.Thread(target = reviewer, args = (review,))
+    review['thread'].daemon = True  #lets the program exit (such as with control-C) without waiting on it
+    review['thread'].start()
+    return review
+
+def reviewer(review):  #runs in the background, reviewing images as they are handed over until it is handed None.  If anything goes wrong that stops the reviewing, it is reported and the images are still passed along to the packer (if we are archiving), so that a problem with the review never costs us the archive
+    thumbnails = collections.deque()  #(image, journal key, worker subdirectory, future) for each thumbnail being made, oldest first
+    try:
+        reviewimages(review, thumbnails)
+    except Exception as error:  #anything at all, since nobody else is watching this thread
+        review['error'] = str(error) or type(error).__name__
+        print ('\nThe review stopped early (' + review['error'] + ').  The rest of the images will not be reviewed.')
+        for image, key, subdirectory, future in thumbnails:
+            passalong(review, subdirectory, image, key)
+        while not review['finished']:
+            item = review['queue'].get()
+            if item is None:
+                break
+            passalong(review, *item)
+
+def passalong(review, subdirectory, image, key):  #hands an image the reviewer is done with on to the packer, if we are archiving
+    if review['archive']:
+        review['archive']['queue'].put((review['directory'] + '/' + subdirectory + image, key, image))
+
+def reviewimages(review, thumbnails):  #reviews images as they are handed over, until it is handed None.  The thumbnails for the next several images are made at once, and the ones that are finished are written down in order.  A locus's contact sheet is made once a few more images have come in without any of them being for it, which for most runs (where each locus is finished before the next is started) means each sheet is only made once
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = review['processes'])
+    sheets = []  #(locus, sheet file, future) for each contact sheet being made
+    finished = False
+    lull = False
+    try:
+        while not finished or thumbnails:
+            if not finished and len(thumbnails) < 4 * review['processes'] and not (thumbnails and thumbnails[0][3].done()):
+                try:
+                    item = review['queue'].get(timeout = 0.1 if thumbnails or sheets else 5)  #only wait a moment while there is something else to do
+                except queue.Empty:
+                    item = False
+                lull = item is False and not thumbnails  #nothing is coming in, so whatever loci have been waiting get their sheets now
+                if item is None:
+                    finished = True
+                    review['finished'] = True
+                elif item:
+                    subdirectory, image, key = item
+                    thumbnails.append((image, key, subdirectory, executor.submit(makethumbnail, review['directory'] + '/' + subdirectory + image, review['folder'] + '/thumbnails/' + image, review['width'])))
+            if thumbnails and (finished or len(thumbnails) >= 4 * review['processes'] or thumbnails[0][3].done()):
+                image, key, subdirectory, future = thumbnails.popleft()
+                future.exception()  #waits for it to be done with the image before the packer can take it away
+                passalong(review, subdirectory, image, key)
+                reviewimage(review, image, key, future.result())
+            for locus in [locus for locus in review['dirty'] if finished or lull or review['reviewed'] - review['dirty'][locus] >= 4 * review['processes']]:
+                del review['dirty'][locus]
+                sheet = 'sheets/' + unsafepattern.sub('_', locus.replace(':', 'c').replace('/', '_')) + '.png'
+                pictures = [review['folder'] + '/' + review['images'][image]['thumbnail'] for image in review['loci'][locus]['images'] if review['images'][image]['thumbnail']]
+                sheets.append((locus, sheet, executor.submit(makesheet, pictures, review['folder'] + '/' + sheet)))
+            for locus, sheet, future in [made for made in sheets if made[2].done() or (finished and not thumbnails)]:
+                sheets.remove((locus, sheet, future))
+                if future.result() is None:
+                    review['loci'][locus]['sheet'] = sheet
+                    review['sheets'] += 1
+            if time.time() - review['written'] > 60:  #the index is kept up to date as we go, so the images can be looked through while the run is still going
+                writereview(review)
+    finally:
+        executor.shutdown(cancel_futures = True)
+    writereview(review)
+
+def reviewimage(review, image, key, result):  #writes down what we know about a finished image, and marks its locus as needing its contact sheet made (again).  result is what makethumbnail handed back
+    linecount, locus, bam, kind = key
+    folder = ntpath.dirname(image)  #the genome's subdirectory, if the list has a genome column
+    if folder:
+        locus = folder + '/' + locus
+    size, problem = result
+    thumbnail = 'thumbnails/' + image
+    if problem:
+        review['failed'] += 1
+        print ('\nUnable to make a thumbnail of ' + image + ' (' + problem + ').')
+        thumbnail = None
+    sample = 'all'
+    if kind == 'single':
+        sample = re.sub(r'\.bam$', '', ntpath.basename(bam))
+    review['images'][image] = {'line' : int(linecount), 'locus' : locus, 'bam' : bam, 'sample' : sample, 'kind' : kind, 'thumbnail' : thumbnail, 'size' : size}
+    entry = review['loci'].setdefault(locus, {'images' : [], 'sheet' : None})
+    if image not in entry['images']:  #the same image can be finished twice (such as a clustered image shared by several lines, or after a retry)
+        if kind == 'group':
+            entry['images'].insert(len([other for other in entry['images'] if review['images'][other]['kind'] == 'group']), image)  #group photos go first on the sheet
+        else:
+            entry['images'].append(image)
+    review['reviewed'] += 1
+    review['dirty'][locus] = review['reviewed']
+
+def readpng(filename):  #reads an 8 bit PNG (as IGV saves them) into an array of pixels (height by width by red, green, and blue).  Raises ValueError for anything we cannot read
+    data = open(filename, 'rb').read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('not a PNG')
+    place = 8
+    imagedata = []
+    palette = None
+    width = None
+    while place < len(data):
+        length, kind = struct.unpack('>I4s', data[place:place + 8])
+        body = data[place + 8:place + 8 + length]
+        place += 12 + length
+        if kind == b'IHDR':
+            width, height, depth, colortype, compression, filtering, interlace = struct.unpack('>IIBBBBB', body)
+        elif kind == b'PLTE':
+            palette = numpy.frombuffer(body, dtype = numpy.uint8).reshape(-1, 3)
+        elif kind == b'IDAT':
+            imagedata.append(body)
+        elif kind == b'IEND':
+            break
+    if width is None:
+        raise ValueError('no IHDR chunk')
+    channels = {0 : 1, 2 : 3, 3 : 1, 4 : 2, 6 : 4}.get(colortype)
+    if depth != 8 or interlace or not channels or (colortype == 3 and palette is None):
+        raise ValueError('only 8 bit, non-interlaced PNGs can be read')
+    stride = width * channels
+    raw = numpy.frombuffer(zlib.decompress(b''.join(imagedata)), dtype = numpy.uint8)
+    if len(raw) < height * (stride + 1):
+        raise ValueError('image data cut off')
+    rows = raw[:height * (stride + 1)].reshape(height, stride + 1)
+    pixels = numpy.zeros((height, stride), dtype = numpy.uint8)
+    previous = numpy.zeros(stride, dtype = numpy.uint8)
+    for number in range(0, height):  #undoes the filter on each row, which depends on the row above it
+        kind = rows[number, 0]
+        row = rows[number, 1:]
+        if kind == 0:
+            current = row
+        elif kind == 1:  #each byte is the difference from the one a pixel to its left, so adding them up along each channel undoes it
+            current = (numpy.cumsum(row.reshape(width, channels), axis = 0, dtype = numpy.uint32) % 256).astype(numpy.uint8).ravel()
+        elif kind == 2:
+            current = row + previous
+        elif kind in (3, 4):  #average and Paeth depend on the byte just undone to their left, so these go a byte at a time
+            line = bytearray(row.tobytes())
+            above = previous.tobytes()
+            for byte in range(0, stride):
+                left = line[byte - channels] if byte >= channels else 0
+                if kind == 3:
+                    line[byte] = (line[byte] + ((left + above[byte]) >> 1)) & 255
+                else:
+                    upperleft = above[byte - channels] if byte >= channels else 0
+                    estimate = left + above[byte] - upperleft
+                    distances = (abs(estimate - left), abs(estimate - above[byte]), abs(estimate - upperleft))
+                    if distances[0] <= distances[1] and distances[0] <= distances[2]:
+                        nearest = left
+                    elif distances[1] <= distances[2]:
+                        nearest = above[byte]
+                    else:
+                        nearest = upperleft
+                    line[byte] = (line[byte] + nearest) & 255
+            current = numpy.frombuffer(bytes(line), dtype = numpy.uint8)
+        else:
+            raise ValueError('unknown filter on row ' + str(number))
+        pixels[number] = current
+        previous = pixels[number]
+    pixels = pixels.reshape(height, width, channels)
+    if colortype == 3:
+        return palette[numpy.minimum(pixels[:, :, 0], len(palette) - 1)]
+    if channels <= 2:  #gray, with or without transparency
+        return numpy.repeat(pixels[:, :, :1], 3, axis = 2)
+    return pixels[:, :, :3]  #transparency is dropped, since IGV's images never use it
+
+def shrinkimage(pixels, width):  #scales an image down to at most width pixels across, averaging each block of pixels that becomes one
+    factor = max(1, -(-pixels.shape[1] // width))
+    height = max(1, pixels.shape[0] // factor)
+    across = max(1, pixels.shape[1] // factor)
+    blocks = pixels[:height * factor, :across * factor].reshape(height, factor, across, factor, 3)
+    return blocks.mean(axis = (1, 3)).round().astype(numpy.uint8)
+
+def makethumbnail(image, thumbnail, width):  #makes a thumbnail of an image.  Runs in the pool's processes.  Returns the size of the original image (width, height) and None if it worked, or None and a message saying why not
+    try:
+        pixels = readpng(image)
+        os.makedirs(ntpath.dirname(thumbnail), exist_ok = True)
+        writepng(thumbnail, shrinkimage(pixels, width))
+    except (OSError, ValueError, struct.error, zlib.error) as error:
+        return (None, str(error))
+    return ((pixels.shape[1], pixels.shape[0]), None)
+
+def makesheet(thumbnails, sheet, columns = 4, gap = 4):  #puts a locus's thumbnails together into one contact sheet, the first one (the group photo, if there is one) across the top and the rest in rows of columns below it.  Runs in the pool's processes.  Returns None if it worked, or a message saying why not
+    try:
+        pictures = [readpng(thumbnail) for thumbnail in thumbnails]
+        if not pictures:
+            return 'no thumbnails'
+        rows = [pictures[:1]] + [pictures[place:place + columns] for place in range(1, len(pictures), columns)]
+        heights = [max([picture.shape[0] for picture in row]) for row in rows]
+        widths = [sum([picture.shape[1] for picture in row]) + gap * (len(row) - 1) for row in rows]
+        image = numpy.empty((sum(heights) + gap * (len(rows) + 1), max(widths) + 2 * gap, 3), dtype = numpy.uint8)
+        image[:, :] = (200, 200, 200)  #gray between the pictures, so white edges still show where one ends
+        top = gap
+        for row, height in zip(rows, heights):
+            left = gap
+            for picture in row:
+                image[top:top + picture.shape[0], left:left + picture.shape[1]] = picture
+                left += picture.shape[1] + gap
+            top += height + gap
+        writepng(sheet, image)
+    except (OSError, ValueError, struct.error, zlib.error) as error:
+        return str(error)
+    return None
+
+def writereview(review):  #writes the review index: review.json with every image, locus, and sample, and HTML pages to look through them, index.html listing every locus and every sample and a page for each pagesize loci showing their contact sheets and thumbnails.  Everything is written under a temporary name first, so that a page being looked at is never half written
+    def save(name, text):
+        output = open(review['folder'] + '/' + name + '.partial', 'w')
+        output.write(text)
+        output.close()
+        os.replace(review['folder'] + '/' + name + '.partial', review['folder'] + '/' + name)
+    def link(path):
+        return html.escape(urllib.parse.quote(path))
+    def locusorder(locus):  #by genome, then by position
+        folder, name = ([''] + locus.rsplit('/', 1))[-2:]
+        try:
+            return (folder, locuskey(name), name)
+        except (ValueError, IndexError):  #not something we know how to sort, so it goes after the rest by name
+            return (folder, (float('inf'),), name)
+    def pagename(page):
+        return 'page' + str(page).zfill(4) + '.html'
+    def anchor(locus):
+        return 'locus' + unsafepattern.sub('_', locus)
+    loci = sorted(review['loci'], key = locusorder)
+    samples = {}
+    pages = {}
+    for number in range(0, len(loci)):
+        pages[loci[number]] = number // review['pagesize'] + 1
+        for image in review['loci'][loci[number]]['images']:
+            sample = review['images'][image]['sample']
+            if sample != 'all' and loci[number] not in samples.setdefault(sample, []):
+                samples[sample].append(loci[number])
+    pagecount = max(1, -(-len(loci) // review['pagesize']))
+    index = {'images' : review['images'],
+             'loci' : review['loci'],
+             'samples' : samples,
+             'pages' : {locus : pagename(pages[locus]) for locus in loci}}
+    save('review.json', json.dumps(index, indent = 1))
+    header = '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>autoIGV review: ' + html.escape(review['directory']) + '</title>\n<style>body{font-family:sans-serif} img{border:1px solid #ccc;margin:2px;vertical-align:top} figure{display:inline-block;margin:4px} figcaption{font-size:small}</style></head><body>\n'
+    contents = [header, '<h1>autoIGV review</h1>\n<p>' + str(len(review['images'])) + ' images at ' + str(len(loci)) + ' loci.</p>\n<h2>Loci</h2>\n<ul>\n']
+    for locus in loci:
+        contents.append('<li><a href="' + pagename(pages[locus]) + '#' + anchor(locus) + '">' + html.escape(locus) + '</a> (' + str(len(review['loci'][locus]['images'])) + ')</li>\n')
+    contents.append('</ul>\n<h2>Samples</h2>\n<ul>\n')
+    for sample in sorted(samples):
+        contents.append('<li>' + html.escape(sample) + ': ' + ', '.join(['<a href="' + pagename(pages[locus]) + '#' + anchor(locus) + '">' + html.escape(locus) + '</a>' for locus in samples[sample]]) + '</li>\n')
+    contents.append('</ul>\n</body></html>\n')
+    save('index.html', ''.join(contents))
+    for page in range(1, pagecount + 1):
+        navigation = '<p><a href="index.html">Index</a>'
+        if page > 1:
+            navigation += ' | <a href="' + pagename(page - 1) + '">Previous</a>'
+        navigation += ' | Page ' + str(page) + ' of ' + str(pagecount)
+        if page < pagecount:
+            navigation += ' | <a href="' + pagename(page + 1) + '">Next</a>'
+        navigation += '</p>\n'
+        contents = [header, navigation]
+        for locus in loci[(page - 1) * review['pagesize']:page * review['pagesize']]:
+            entry = review['loci'][locus]
+            contents.append('<h2 id="' + anchor(locus) + '">' + html.escape(locus) + '</h2>\n')
+            if entry['sheet']:
+                contents.append('<p><a href="' + link(entry['sheet']) + '">Contact sheet</a></p>\n')
+            for image in entry['images']:
+                details = review['images'][image]
+                caption = html.escape(details['sample'] + ' (line ' + str(details['line']) + ')')
+                picture = caption
+                if details['thumbnail']:
+                    picture = '<img src="' + link(details['thumbnail']) + '" alt="' + caption + '" loading="lazy">'
+                contents.append('<figure><a href="' + link('../' + image) + '">' + picture + '</a><figcaption>' + caption + '</figcaption></figure>\n')
+        contents.append(navigation + '</body></html>\n')
+        save(pagename(page), ''.join(contents))
+    review['written'] = time.time()
+
+def closereview(review):  #waits for the reviewer to finish everything handed to it and write the index.  Safe to call more than once
+    if not review or review['thread'] is None:
+        return
+    review['queue'].put(None)
+    review['thread'].join()
+    review['thread'] = None
+
+def skipfinished(steps, done):  #takes out the snapshots in a chunk that an earlier run already finished (along with the collapse and goto that only served them).  Returns an empty list if nothing is left to photograph
+    remaining = []
+    snapshots = 0
+    for step in steps:
+        if step[0] == 'snapshot' and journalkey(step) in done:
+            if remaining and remaining[-1][0] == 'collapse' and remaining[-1][2] == step[2]:
+                remaining.pop()
+            if len(remaining) > 1 and remaining[-1][0] == 'load' and remaining[-2][0] == 'new' and remaining[-2][4] == step[4] and remaining[-1][2] == step[2]:  #a single photo's own new session and load are not needed either (but not a load that the group photo after it still needs)
+                remaining.pop()
+                remaining.pop()
+            continue
+        if step[0] == 'snapshot':
+            snapshots += 1
+        remaining.append(step)
+    if not snapshots:  #everything in this chunk was already done
+        return []
+    needed = False  #whether a snapshot still to be taken comes after this point (before the next goto), going backwards through the chunk
+    for place in range(len(remaining) - 1, -1, -1):  #a goto can only go once nothing after it needs it, since later photos on its line (such as the other single photos in mode 2) are taken there too
+        if remaining[place][0] == 'snapshot':
+            needed = True
+        elif remaining[place][0] == 'goto':
+            if not needed:
+                del remaining[place]
+            needed = False
+    return remaining
+
+def unfinishedchunks(chunks, done):  #passes along only the chunks (with only the snapshots) that still need doing
+    for steps in chunks:
+        steps = skipfinished(steps, done)
+        if steps:
+            yield steps
+
+def opencache(directory, limit, genome):  #sets up the snapshot cache, a directory of images named for everything that went into them (see cachekey) that is shared between runs.  limit is the most it may hold, in bytes.  Workers in a pool share it, so it comes with a lock for taking turns
+    os.makedirs(directory, exist_ok = True)
+    size = 0
+    for folder, subfolders, filenames in os.walk(directory):  #adding it up once now means we only have to look through it all again when it is full
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(folder, filename))
+            except OSError:
+                pass
+    return {'directory' : directory,
+            'limit' : limit,
+            'genome' : genome,
+            'size' : size,
+            'lock' : threading.Lock(),
+            'stats' : {},  #bam file -> (size, modification time), looked up once per run since each look can be slow on a network drive
+            'pending' : {},  #image name -> cache key for each image we still have to take, so it can be stored once IGV has taken it
+            'hits' : 0,
+            'stored' : 0}
+
+def cachekey(cache, view, tracks, collapsed, kind, genome = None):  #works out the name an image is kept under in the cache from everything that decides what it looks like: the genome (the cache's own unless another is given), what IGV was told to go to, the tracks loaded (in order, along with each file's size and modification time so that a BAM file that has been redone is never mistaken for the old one), whether they were collapsed, and whether it is a group or single photo.  Returns None if a file cannot be looked at, so the image is not cached
+    description = [genome or cache['genome'], view, kind, str(collapsed)]
+    for bam in tracks:
+        if bam not in cache['stats']:
+            try:
+                info = os.stat(bam)
+                cache['stats'][bam] = (info.st_size, info.st_mtime_ns)
+            except OSError:
+                cache['stats'][bam] = None
+        if cache['stats'][bam] is None:
+            return None
+        description.append(os.path.abspath(bam) + '\t' + str(cache['stats'][bam][0]) + '\t' + str(cache['stats'][bam][1]))
+    return hashlib.sha1(bytes('\n'.join(description), 'utf-8')).hexdigest()
+
+def cachefile(cache, key):  #where an image is kept in the cache.  The first two characters of the key make a subdirectory, so that no one directory ends up with millions of files in it
+    return cache['directory'] + '/' + key[:2] + '/' + key + '.png'
+
+def linkimage(source, destination):  #puts a copy of an image at destination, as a hard link if possible (which takes no extra space) or as a real copy if the two are on different drives.  The copy is made under a temporary name first so that nobody ever sees half an image
+    temporary = destination + '.partial'
+    try:
+        os.link(source, temporary)
+    except FileExistsError:
+        os.remove(temporary)
+        return linkimage(source, destination)
+    except OSError:
+        shutil.copyfile(source, temporary)
+    os.replace(temporary, destination)
+
+def cachelookup(steps, cache, directory, journal = None, dryrun = False):  #finds every snapshot in a chunk that the cache already has, puts those images straight into the directory for the session, and takes them out of the chunk (along with the commands that only served them).  Returns whatever is left to photograph.  With dryrun, the hits are only counted, for planning a run
+    found = set()  #journal keys of the snapshots the cache had
+    view = None  #what IGV will be showing at each point in the chunk, worked out the same way expandtracks does
+    tracks = []
+    collapsed = False
+    genome = None  #the cache's own genome, unless the chunk says otherwise
+    for step in steps:
+        command, argument, linecount, locus, bam = step
+        if command == 'genome':
+            genome = argument
+        elif command == 'goto':
+            view = argument
+        elif command == 'new':
+            tracks = []
+            collapsed = False
+        elif command == 'load':
+            tracks.append(argument)
+            collapsed = False
+        elif command == 'tracks':
+            tracks = list(argument)
+            collapsed = False
+        elif command == 'collapse':
+            collapsed = True  #collapsing is a setting on the tracks, so it lasts until something else is loaded
+        elif command == 'snapshot':
+            kind = 'single'
+            if bam == 'all':
+                kind = 'group'
+            key = cachekey(cache, view, tracks, collapsed, kind, genome)
+            if not key:
+                continue
+            cached = cachefile(cache, key)
+            if goodimage(cached):
+                found.add(journalkey(step))
+                if not dryrun:
+                    linkimage(cached, directory + '/' + argument)
+                    os.utime(cached)  #the cache throws out whatever was used least recently when it fills up
+                    if journal:
+                        recordsnapshot(journal, step)
+                with cache['lock']:
+                    cache['hits'] += 1
+            elif not dryrun:
+                with cache['lock']:
+                    cache['pending'][argument] = (key, tuple(tracks))
+    if not found:
+        return steps
+    return skipfinished(steps, found)
+
+def cachedchunks(chunks, cache, directory, journal = None):  #passes along only the chunks (with only the snapshots) that the cache could not supply
+    for steps in chunks:
+        steps = cachelookup(steps, cache, directory, journal)
+        if steps:
+            yield steps
+
+def storeimage(cache, directory, filename, badbams = ()):  #adds an image IGV just took to the cache, then makes room if the cache is now too big.  Images taken while one of their files had failed to load are left out, since they do not show what their key says they do
+    with cache['lock']:
+        pending = cache['pending'].pop(filename, None)
+    if not pending:
+        return
+    key, tracks = pending
+    if [bam for bam in tracks if bam in badbams] or not goodimage(directory + '/' + filename):
+        return
+    cached = cachefile(cache, key)
+    os.makedirs(os.path.dirname(cached), exist_ok = True)
+    linkimage(directory + '/' + filename, cached)
+    with cache['lock']:
+        cache['stored'] += 1
+        cache['size'] += os.path.getsize(cached)
+        if cache['size'] > cache['limit']:
+            evictcache(cache)
+
+def evictcache(cache):  #throws out the images used least recently until the cache is back down to 90% of its limit, so that this does not have to happen again after every image.  Called with the lock already held
+    images = []
+    for folder, subfolders, filenames in os.walk(cache['directory']):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            try:
+                info = os.stat(path)
+            except OSError:  #another run sharing the cache got to it first
+                continue
+            images.append((info.st_mtime, info.st_size, path))
+    images.sort()
+    cache['size'] = sum([image[1] for image in images])
+    for modified, size, path in images:
+        if cache['size'] <= 0.9 * cache['limit']:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        cache['size'] -= size
+
+def openstage(directory, flank, threads, samtools = 'samtools'):  #sets up the staging area, a directory on a fast local drive where small BAM files holding only the reads around each target (and their indexes) are made for IGV to load instead of the originals.  Slices are kept between runs and used again if the same file is wanted at the same loci
+    directory = os.path.abspath(directory)  #IGV does not know our working directory
+    os.makedirs(directory, exist_ok = True)
+    return {'directory' : directory,
+            'flank' : flank,  #bases on either side of each locus to take reads from, so that the view can be scrolled a little
+            'threads' : threads,
+            'samtools' : samtools,
+            'lock' : threading.Lock(),
+            'contigs' : {},  #bam file -> the contig names in its header, read once per run
+            'broken' : False,  #set if samtools cannot be run at all, so we stop trying
+            'made' : 0,
+            'reused' : 0}
+
+def bamcontigs(stage, bam):  #reads the contig names from a bam file's header, so that we ask samtools for 1:1000 or chr1:1000 depending on how the file names them
+    with stage['lock']:
+        if bam in stage['contigs']:
+            return stage['contigs'][bam]
+    contigs = set()
+    header = subprocess.run([stage['samtools'], 'view', '-H', bam], stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+    for line in cookbytes(header.stdout).split('\n'):
+        if line.startswith('@SQ'):
+            for field in line.split('\t'):
+                if field.startswith('SN:'):
+                    contigs.add(field[3:])
+    with stage['lock']:
+        stage['contigs'][bam] = contigs
+    return contigs
+
+def slicebam(stage, bam, loci):  #makes (or finds from before) a small bam file with only the reads from bam within the flank of each locus, along with its index.  The slice has the same file name as the original, in a directory of its own, so that IGV gives its track the same name.  Returns the path to the slice, or None if one could not be made and IGV should load the original
+    if stage['broken']:
+        return None
+    try:
+        contigs = bamcontigs(stage, bam)
+    except OSError:  #samtools is not installed (or not where we were told)
+        with stage['lock']:
+            if not stage['broken']:  #several threads may find this out at once, but the user only needs telling once
+                print ('\nUnable to run ' + stage['samtools'] + ', so BAM files will be loaded from where they are instead of being staged.')
+            stage['broken'] = True
+        return None
+    regions = []
+    for locus in loci:
+        contig = locus.rsplit(':', 1)[0]
+        names = [name for name in (contig, 'chr' + contig, contigname(contig)) if name in contigs]
+        if not names:  #the file does not have this contig at all, so there is nothing to slice
+            return None
+        start = max(1, locuskey(locus)[1] - stage['flank'])
+        regions.append(names[0] + ':' + str(start) + '-' + str(locusend(locus) + stage['flank']))
+    regions = sorted(set(regions))
+    try:
+        info = os.stat(bam)
+    except OSError:
+        return None
+    key = hashlib.sha1(bytes('\n'.join([os.path.abspath(bam), str(info.st_size), str(info.st_mtime_ns)] + regions), 'utf-8')).hexdigest()  #a bam file that has been redone gets new slices
+    folder = stage['directory'] + '/' + key[:2] + '/' + key
+    slicefile = folder + '/' + ntpath.basename(bam)
+    if os.path.isfile(slicefile + '.bai'):  #made by an earlier run (the index is made last, so the slice is complete)
+        os.utime(folder)  #the staging area throws out whatever was used least recently when it is tidied
+        with stage['lock']:
+            stage['reused'] += 1
+        return slicefile
+    working = tempfile.mkdtemp(dir = stage['directory'])  #made somewhere else first and moved into place when finished, so a slice is never seen half made
+    partial = working + '/' + ntpath.basename(bam)
+    made = subprocess.run([stage['samtools'], 'view', '-b', '-M', '-o', partial, bam] + regions, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)  #-M reads the regions together, so a read covering two of them is only taken once
+    if not made.returncode:
+        made = subprocess.run([stage['samtools'], 'index', partial], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    if made.returncode:
+        shutil.rmtree(working, ignore_errors = True)
+        return None
+    os.makedirs(os.path.dirname(folder), exist_ok = True)
+    try:
+        os.replace(working, folder)
+    except OSError:  #another worker (or run) made the same slice while we were at it
+        shutil.rmtree(working, ignore_errors = True)
+    with stage['lock']:
+        stage['made'] += 1
+    return slicefile
+
+def chunkregions(steps):  #works out which loci each bam file loaded in a chunk is photographed at.  Returns a dictionary of bam file -> list of loci (each panel of a split view separately)
+    regions = {}
+    loaded = []
+    view = []
+    for command, argument, linecount, locus, bam in steps:
+        if command == 'goto':
+            view = argument.split(' ')
+        elif command == 'new':
+            loaded = []
+        elif command == 'load':
+            loaded.append(argument)
+        elif command == 'tracks':
+            loaded = list(argument)
+        elif command == 'snapshot':
+            for track in loaded:
+                regions.setdefault(track, [])
+                regions[track] += [locus for locus in view if locus not in regions[track]]
+    return regions
+
+def restage(steps, slices):  #swaps the bam files loaded in a chunk for their slices.  Only what gets loaded changes; every other step still names the original file, so images are named and problems are reported just as they would be without staging
+    staged = []
+    for step in steps:
+        command, argument, linecount, locus, bam = step
+        if command == 'load' and slices.get(argument):
+            step = (command, slices[argument], linecount, locus, bam)
+        elif command == 'tracks':
+            step = (command, tuple([slices.get(track) or track for track in argument]), linecount, locus, bam)
+        staged.append(step)
+    return staged
+
+def stagedchunks(chunks, stage, runlimit = 20):  #passes the chunks along with their bam files swapped for local slices, making the slices for the next several chunks on a pool of threads while the current one is being photographed so that IGV never waits on the network drive.  Chunks in a row that load the same bam files (up to runlimit of them) share one slice of each, covering all of their loci, so that IGV sees the same file from one chunk to the next and -t/--groupbytracks can keep the tracks loaded
+    chunks = iter(chunks)
+    ahead = collections.deque()  #(run of chunks, bam file -> future for its slice), oldest first
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = stage['threads'])
+    upcoming = next(chunks, None)  #read one chunk ahead, to see whether it carries on the current run
+    try:
+        while True:
+            while len(ahead) < 2 * stage['threads'] and upcoming is not None:  #enough to keep every thread busy while we wait on the oldest
+                run = [upcoming]
+                regions = chunkregions(upcoming)
+                upcoming = next(chunks, None)
+                while upcoming is not None and len(run) < runlimit:
+                    nextregions = chunkregions(upcoming)
+                    if set(nextregions) != set(regions):  #different files, so a new run (and new slices)
+                        break
+                    for bam in nextregions:
+                        regions[bam] += [locus for locus in nextregions[bam] if locus not in regions[bam]]
+                    run.append(upcoming)
+                    upcoming = next(chunks, None)
+                ahead.append((run, dict([(bam, executor.submit(slicebam, stage, bam, regions[bam])) for bam in regions])))
+            if not ahead:
+                break
+            run, futures = ahead.popleft()
+            slices = dict([(bam, futures[bam].result()) for bam in futures])
+            for steps in run:
+                yield restage(steps, slices)
+    finally:  #also when the run stops early, so that no slices are still being started for chunks that will never be photographed
+        executor.shutdown(cancel_futures = True)
+
+def tidystage(stage, limit):  #throws out the slices used least recently until the staging area holds no more than limit bytes.  Only done once the run is over, since a slice still waiting to be loaded must not disappear
+    slices = []
+    total = 0
+    for prefix in os.listdir(stage['directory']):
+        if len(prefix) != 2 or not os.path.isdir(stage['directory'] + '/' + prefix):
+            continue
+        for key in os.listdir(stage['directory'] + '/' + prefix):
+            folder = stage['directory'] + '/' + prefix + '/' + key
+            size = sum([os.path.getsize(folder + '/' + filename) for filename in os.listdir(folder)])
+            slices.append((os.path.getmtime(folder), size, folder))
+            total += size
+    for modified, size, folder in sorted(slices):
+        if total <= limit:
+            break
+        shutil.rmtree(folder, ignore_errors = True)
+        total -= size
+
+def opentriage(mindepth = 0, minalt = 0, action = 'skip', threads = 4, recordfile = None):  #sets up coverage triage, which reads each BAM file's index and the few compressed blocks around a locus itself (no IGV needed) to find photos with too few reads to be worth taking.  Decisions are written to recordfile (if we have a run directory for it) so that nobody is left wondering where an image went
+    record = None
+    if recordfile:
+        record = open(recordfile, 'a')
+        if not record.tell():
+            record.write('#line\tlocus\tbam\tdepth\talt\tdecision\n')
+    return {'mindepth' : mindepth,  #a photo needs at least this many reads at its locus in at least one of its BAM files
+            'minalt' : minalt,  #and at least this many of them not showing the most common base there
+            'action' : action,  #skip the photos that fall short, or take them last
+            'threads' : max(1, threads),
+            'lock' : threading.Lock(),
+            'indexes' : {},  #bam file -> its index, or None if it has none we can read.  Read once per run
+            'references' : {},  #bam file -> contig name -> number in the file
+            'coverage' : {},  #(bam file, locus) -> (depth, alt), so a locus photographed more than once is only read once
+            'record' : record,
+            'deferred' : [],  #chunks put off until the end of the run
+            'dropped' : 0,  #chunks with nothing left to take at all
+            'skipped' : 0,
+            'last' : 0}
+
+def bgzfblock(handle, coffset):  #reads the BGZF block (a small gzip file of its own, which is how BAM files and CSI indexes are compressed) starting coffset bytes into a file.  Returns its uncompressed contents and where the next block starts, which is the same place at the end of the file
+    handle.seek(coffset)
+    header = handle.read(12)
+    if len(header) < 12 or header[:2] != b'\x1f\x8b':
+        return (b'', coffset)
+    extralength = struct.unpack('<H', header[10:12])[0]
+    extra = handle.read(extralength)
+    blocksize = None
+    at = 0
+    while at + 4 <= len(extra):  #the extra field holds subfields, one of which (BC) gives the size of the whole block
+        fieldlength = struct.unpack_from('<H', extra, at + 2)[0]
+        if extra[at:at + 2] == b'BC':
+            blocksize = struct.unpack_from('<H', extra, at + 4)[0] + 1
+        at += 4 + fieldlength
+    if blocksize is None:
+        return (b'', coffset)
+    compressed = handle.read(blocksize - 12 - extralength)
+    return (zlib.decompress(compressed[:-8], -15), coffset + blocksize)  #the last 8 bytes are a checksum and length
+
+def bgzfopen(filename, voffset = 0):  #opens a BGZF file for reading from a virtual offset (the start of a block in the file, times 65536, plus how far into the block once uncompressed), which is how BAM indexes say where to look
+    stream = {'handle' : open(filename, 'rb'), 'coffset' : voffset >> 16, 'data' : b'', 'at' : 0}
+    stream['data'], stream['coffset'] = bgzfblock(stream['handle'], stream['coffset'])
+    stream['at'] = voffset & 0xffff
+    return stream
+
+def bgzfread(stream, size):  #reads the next size bytes from a BGZF file, carrying on into the next blocks as needed.  Gives back fewer at the end of the file
+    while len(stream['data']) - stream['at'] < size:
+        block, nextblock = bgzfblock(stream['handle'], stream['coffset'])
+        if nextblock == stream['coffset']:  #the end of the file
+            break
+        stream['data'] = stream['data'][stream['at']:] + block
+        stream['at'] = 0
+        stream['coffset'] = nextblock
+    piece = stream['data'][stream['at']:stream['at'] + size]
+    stream['at'] += len(piece)
+    return piece
+
+def bamreferences(bam):  #reads the names of the contigs from a BAM file's header.  Returns a dictionary of name -> the number the reads use for it
+    stream = bgzfopen(bam)
+    try:
+        if bgzfread(stream, 4) != b'BAM\x01':
+            return {}
+        textlength = struct.unpack('<i', bgzfread(stream, 4))[0]
+        bgzfread(stream, textlength)  #the header text, which we do not need
+        references = {}
+        for number in range(0, struct.unpack('<i', bgzfread(stream, 4))[0]):
+            namelength = struct.unpack('<i', bgzfread(stream, 4))[0]
+            references[cookbytes(bgzfread(stream, namelength)[:-1])] = number  #the name ends in a null
+            bgzfread(stream, 4)  #and is followed by the contig's length
+        return references
+    finally:
+        stream['handle'].close()
+
+def readbamindex(bam):  #reads a BAM file's index (.bai, or .csi, which can cover longer contigs).  Returns a dictionary with the binning scheme and, for each contig, its bins (bin -> (smallest offset of any read in it, list of (start, end) chunks)) and the linear index of a .bai, or None if there is no index we can read
+    for indexfile in (bam + '.bai', bam[:-4] + '.bai', bam + '.csi'):  #the same names checkbam looks for
+        if os.path.isfile(indexfile):
+            break
+    else:
+        return None
+    data = open(indexfile, 'rb').read()
+    if data[:2] == b'\x1f\x8b':  #a .csi is compressed
+        data = gzip.decompress(data)
+    if data[:4] == b'BAI\x01':
+        index = {'minshift' : 14, 'depth' : 5, 'references' : []}  #the fixed scheme a .bai uses
+        at = 4
+    elif data[:4] == b'CSI\x01':
+        minshift, depth, auxlength = struct.unpack_from('<iii', data, 4)
+        index = {'minshift' : minshift, 'depth' : depth, 'references' : []}
+        at = 16 + auxlength
+    else:
+        return None
+    csi = data[:4] == b'CSI\x01'
+    references = struct.unpack_from('<i', data, at)[0]
+    at += 4
+    for reference in range(0, references):
+        bins = {}
+        binscount = struct.unpack_from('<i', data, at)[0]
+        at += 4
+        for i in range(0, binscount):
+            binnumber = struct.unpack_from('<I', data, at)[0]
+            at += 4
+            smallest = 0
+            if csi:
+                smallest = struct.unpack_from('<Q', data, at)[0]
+                at += 8
+            chunkcount = struct.unpack_from('<i', data, at)[0]
+            at += 4
+            offsets = struct.unpack_from('<' + str(2 * chunkcount) + 'Q', data, at)
+            at += 16 * chunkcount
+            bins[binnumber] = (smallest, list(zip(offsets[0::2], offsets[1::2])))
+        linear = ()
+        if not csi:
+            intervals = struct.unpack_from('<i', data, at)[0]
+            at += 4
+            linear = struct.unpack_from('<' + str(intervals) + 'Q', data, at)
+            at += 8 * intervals
+        index['references'].append((bins, linear))
+    return index
+
+def regionbins(start, end, minshift, depth):  #lists the bins that can hold reads overlapping start to end (counting from 0, end not included), coarsest first, as laid out in the SAM specification
+    bins = []
+    shift = minshift + depth * 3
+    first = 0  #the number of the first bin at each level
+    end -= 1
+    for level in range(0, depth + 1):
+        bins += list(range(first + (start >> shift), first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << (level * 3)
+    return bins
+
+def bamindex(triage, bam):  #gives the index and contig numbers for a bam file, reading them the first time they are asked for
+    with triage['lock']:
+        if bam in triage['indexes']:
+            return (triage['indexes'][bam], triage['references'][bam])
+    try:
+        index = readbamindex(bam)
+        references = bamreferences(bam)
+    except (OSError, struct.error, zlib.error, EOFError):  #unreadable or not what it says it is, so we cannot tell and the photo is taken as usual
+        index = None
+        references = {}
+    with triage['lock']:
+        triage['indexes'][bam] = index
+        triage['references'][bam] = references
+    return (index, references)
+
+def locuscoverage(triage, bam, locus):  #counts the reads in a bam file at a locus, skipping those IGV hides by default (unmapped, failing quality checks, or duplicates).  For a single position, also counts how many of them do not show the most common base there (a deletion counts as a base of its own), which stands in for support for a variant without needing the reference.  For a range, every read overlapping it counts and alt is None.  Returns (depth, alt), or None if the file cannot be read this way
+    key = (bam, locus)
+    with triage['lock']:
+        if key in triage['coverage']:
+            return triage['coverage'][key]
+    index, references = bamindex(triage, bam)
+    if not index:
+        return None
+    reference = bamcontig(references, locus.rsplit(':', 1)[0])
+    if reference is None:  #the file has no reads on this contig at all
+        coverage = (0, 0)
+    else:
+        start = locuskey(locus)[1] - 1  #counting from 0, as BAM files do
+        end = locusend(locus)
+        try:
+            coverage = countreads(bam, index, reference, start, end)
+        except (OSError, struct.error, zlib.error):
+            return None
+    with triage['lock']:
+        triage['coverage'][key] = coverage
+    return coverage
+
+def bamcontig(references, contig):  #finds the number a BAM file uses for a contig, whether or not the file and the list agree about having chr in front.  Returns None if the file does not have it
+    for name in (contig, 'chr' + contig, contigname(contig)):
+        if name in references:
+            return references[name]
+    return None
+
+def regionreads(bam, index, reference, start, end):  #reads the BAM file's reads on contig number reference that might overlap start to end (counting from 0, end not included), using its index to jump straight to them, and skipping those IGV hides by default (unmapped, failing quality checks, or duplicates).  Hands back each one as (where it starts, its CIGAR operations, the record, and where its sequence starts in the record)
+    if reference >= len(index['references']):
+        return
+    start = max(0, start)  #a window hanging off the start of the contig would otherwise look up the last 16 kb window and bin -1
+    bins, linear = index['references'][reference]
+    binnumbers = regionbins(start, end, index['minshift'], index['depth'])
+    smallest = 0  #no read overlapping the region starts before this offset
+    if linear:
+        if start >> 14 < len(linear):
+            smallest = linear[start >> 14]
+    else:  #a .csi keeps the smallest offset for each bin instead.  The finest bin holding the start gives the tightest limit
+        for binnumber in reversed(regionbins(start, start + 1, index['minshift'], index['depth'])):
+            if binnumber in bins:
+                smallest = bins[binnumber][0]
+                break
+    chunks = [chunk for binnumber in binnumbers if binnumber in bins for chunk in bins[binnumber][1] if chunk[1] > smallest]
+    if not chunks:
+        return
+    stream = bgzfopen(bam, max(smallest, min([chunk[0] for chunk in chunks])))  #reads are sorted, so everything overlapping the region is read in one pass from here
+    try:
+        while True:
+            size = bgzfread(stream, 4)
+            if len(size) < 4:
+                break
+            record = bgzfread(stream, struct.unpack('<i', size)[0])
+            readreference, position, namelength, mapq, binnumber, cigarcount, flag, sequencelength = struct.unpack_from('<iiBBHHHi', record)
+            if readreference != reference or position >= end:  #past the region, so we are done
+                break
+            if flag & 0x604:  #unmapped, failed quality checks, or a duplicate
+                continue
+            cigar = struct.unpack_from('<' + str(cigarcount) + 'I', record, 32 + namelength)
+            yield (position, cigar, record, 32 + namelength + 4 * cigarcount)
+    finally:
+        stream['handle'].close()
+
+def countreads(bam, index, reference, start, end):  #does the counting for locuscoverage, from start to end (counting from 0, end not included)
+    depth = 0
+    bases = {}
+    single = end - start == 1
+    for position, cigar, record, sequenceat in regionreads(bam, index, reference, start, end):
+        base = readbase(cigar, record, sequenceat, position, start, single)
+        if base is None:
+            continue
+        depth += 1
+        bases[base] = bases.get(base, 0) + 1
+    if not single:
+        return (depth, None)
+    return (depth, depth - max(bases.values() or [0]))
+
+def readbase(cigar, record, sequenceat, position, target, single):  #works out what a read shows at target from where it starts and its CIGAR string: the base there, '-' for a deletion, or None if it does not cover target (including a spliced gap).  For a range, only whether the read reaches target or beyond matters, and any overlap gives True
+    reference = position
+    query = 0
+    for operation in cigar:
+        length = operation >> 4
+        kind = operation & 15
+        consumesreference = kind in (0, 2, 3, 7, 8)  #M, D, N, =, and X move along the reference
+        if consumesreference and reference + length > target and (reference <= target or not single):
+            if not single:
+                return True
+            if kind == 2:
+                return '-'
+            if kind == 3:
+                return None
+            offset = query + target - reference
+            packed = record[sequenceat + offset // 2]
+            if offset % 2:
+                return '=ACMGRSVTWYHKDBN'[packed & 15]
+            return '=ACMGRSVTWYHKDBN'[packed >> 4]
+        if consumesreference:
+            reference += length
+        if kind in (0, 1, 4, 7, 8):  #M, I, S, =, and X move along the read
+            query += length
+    return None
+
+def triagechunk(steps, triage, coverage):  #decides which snapshots in a chunk are worth taking, given coverage (bam file, locus) -> (depth, alt) for every file at every locus in it.  A photo is kept if any of its files passes at any of its loci, or if we could not tell.  Returns the chunk with the others taken out, and a chunk of their own for each one put off until the end
+    low = set()  #journal keys of the snapshots that fall short
+    later = []
+    view = ''
+    loaded = []
+    collapsed = False
+    genomesteps = []  #the chunk's genome step, which a chunk of its own needs as well
+    for step in steps:
+        command, argument, linecount, locus, bam = step
+        if command == 'genome':
+            genomesteps = [step]
+        elif command == 'goto':
+            view = argument
+        elif command == 'new':
+            loaded = []
+        elif command == 'load':
+            loaded.append(argument)
+        elif command == 'tracks':
+            loaded = list(argument)
+        elif command == 'collapse':
+            collapsed = True
+        elif command == 'snapshot':
+            tracks = loaded
+            if bam != 'all':
+                tracks = [bam]
+            results = [coverage.get((track, panel)) for track in tracks for panel in view.split(' ')]
+            best = (0, 0)
+            keep = False
+            for result in results:
+                if result is None:
+                    keep = True
+                    continue
+                best = max(best, (result[0], result[1] or 0))
+                if result[0] >= triage['mindepth'] and (result[1] is None or result[1] >= triage['minalt']):
+                    keep = True
+            decision = 'keep'
+            if not keep:
+                low.add(journalkey(step))
+                decision = triage['action']
+                if triage['action'] == 'last':  #its own chunk, which starts from scratch so that it does not depend on what was loaded before it
+                    newbam = bam
+                    if bam == 'all':
+                        newbam = None
+                    chunk = genomesteps + [('goto', view, linecount, locus, None), ('new', None, linecount, locus, newbam)]
+                    chunk += [('load', track, linecount, locus, track) for track in tracks]
+                    if collapsed:
+                        chunk.append(('collapse', None, linecount, locus, bam))
+                    later.append(chunk + [step])
+            if triage['record']:
+                with triage['lock']:
+                    triage['record'].write('\t'.join([str(linecount), locus, bam, str(best[0]), str(best[1]), decision]) + '\n')
+    with triage['lock']:
+        triage['skipped'] += len(low) - len(later)
+        triage['last'] += len(later)
+    if not low:
+        return (steps, later)
+    return (skipfinished(steps, low), later)
+
+def reporttriage(triage):  #says how many photos triage left out or put off, and finishes writing down its decisions
+    print (str(triage['skipped']) + ' photos skipped and ' + str(triage['last']) + ' left until last for low coverage...', end = '')
+    if triage['record']:
+        triage['record'].close()
+
+def triagepairs(steps):  #lists every (bam file, locus) a chunk photographs, each panel of a split view separately
+    regions = chunkregions(steps)
+    return [(bam, locus) for bam in regions for locus in regions[bam]]
+
+def triagedchunks(chunks, triage):  #passes along the chunks with the snapshots that are not worth taking left out (or, with the later action, moved to the end of the run).  The reads for the next several chunks are counted on a pool of threads while the current one is being photographed
+    chunks = iter(chunks)
+    ahead = collections.deque()  #(chunk, (bam file, locus) -> future for its coverage), oldest first
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers = triage['threads'])
+    while True:
+        while len(ahead) < 2 * triage['threads']:
+            steps = next(chunks, None)
+            if steps is None:
+                break
+            ahead.append((steps, dict([(pair, executor.submit(locuscoverage, triage, pair[0], pair[1])) for pair in triagepairs(steps)])))
+        if not ahead:
+            break
+        steps, futures = ahead.popleft()
+        steps, later = triagechunk(steps, triage, dict([(pair, futures[pair].result()) for pair in futures]))
+        triage['deferred'] += later
+        if steps:
+            yield steps
+        else:
+            triage['dropped'] += 1
+    executor.shutdown()
+    for steps in deferredorder(triage['deferred']):
+        yield steps
+    if triage['record']:
+        triage['record'].flush()
+
+def deferredorder(deferred):  #puts the chunks left until last in an order that switches genomes as little as possible.  The run came to them grouped by genome, so they are too, but the genome the run finished on goes first since IGV already has it loaded
+    groups = collections.OrderedDict()  #genome (or None without a genome column) -> its chunks, in the order they were put off
+    for steps in deferred:
+        genome = None
+        if steps and steps[0][0] == 'genome':
+            genome = steps[0][1]
+        groups.setdefault(genome, []).append(steps)
+    return [steps for genome in reversed(groups) for steps in groups[genome]]
+
+renderfiles = {'lock' : threading.Lock(), 'indexes' : {}, 'references' : {}, 'fastas' : {}}  #the BAM indexes, contig numbers, and FASTA indexes the renderer has read so far.  Each process in the pool keeps its own, so that a file is only read once per process however many images it is in
+
+def rendersettings(reference = None, width = 1000, flank = 50, maxrows = 40):  #how images drawn without IGV (--render) should look.  width is in pixels, flank is how many bases to show either side of a single position, and maxrows is the most reads stacked up for each BAM file.  reference is a FASTA file (with a .fai index next to it) to find mismatches against; without one, the most common base at each position stands in for it
+    return {'reference' : reference,
+            'width' : width,
+            'flank' : flank,
+            'maxrows' : maxrows,
+            'coverageheight' : 40,  #pixels for the coverage track above each BAM file's reads
+            'rowheight' : 4,  #pixels for each row of reads, plus one between rows
+            'gap' : 4,  #pixels between the panels of a split view
+            'colors' : {'background' : (255, 255, 255), 'read' : (185, 185, 185), 'coverage' : (175, 175, 175), 'deletion' : (0, 0, 0), 'insertion' : (138, 43, 226), 'separator' : (220, 220, 220),
+                        'bases' : ((0, 150, 0), (0, 0, 255), (209, 113, 5), (255, 0, 0))}}  #A, C, G, and T, in IGV's colors
+
+def readfastaindex(fasta):  #reads a FASTA index (.fai) into a dictionary of contig name -> (length, where its sequence starts in the file, bases on each line, bytes on each line)
+    contigs = {}
+    for line in open(fasta + '.fai', 'r'):
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) >= 5:
+            contigs[fields[0]] = (int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4]))
+    return contigs
+
+def referencebases(fasta, contig, start, end):  #reads the reference from start to end (counting from 0, end not included) out of an uncompressed FASTA file using its index.  Returns an array of base codes (0 to 3 for A, C, G, and T, and -1 for anything else, including past either end of the contig), or None if the FASTA does not have the contig
+    with renderfiles['lock']:
+        if fasta not in renderfiles['fastas']:
+            renderfiles['fastas'][fasta] = readfastaindex(fasta)
+        contigs = renderfiles['fastas'][fasta]
+    name = [name for name in (contig, 'chr' + contig, contigname(contig)) if name in contigs]
+    if not name:
+        return None
+    length, offset, linebases, linebytes = contigs[name[0]]
+    codes = numpy.full(end - start, -1, dtype = numpy.int8)
+    first = max(0, start)
+    last = min(length, end)
+    if last <= first:
+        return codes
+    handle = open(fasta, 'rb')
+    handle.seek(offset + (first // linebases) * linebytes + first % linebases)
+    text = handle.read((last - first) + ((last - first) // linebases + 2) * (linebytes - linebases)).replace(b'\n', b'').replace(b'\r', b'')[:last - first]
+    handle.close()
+    lookup = numpy.full(256, -1, dtype = numpy.int8)
+    for code, letters in enumerate((b'Aa', b'Cc', b'Gg', b'Tt')):
+        for letter in letters:
+            lookup[letter] = code
+    codes[first - start:first - start + len(text)] = lookup[numpy.frombuffer(text, dtype = numpy.uint8)]
+    return codes
+
+def pileup(bam, contig, start, end, maxrows):  #reads the alignments in a BAM file from start to end (counting from 0, end not included) and stacks them into rows the way IGV does, each read going in the first row with room for it.  Returns a dictionary of arrays (all positions counted from start): the aligned blocks, deletions and spliced gaps, and insertions of each read drawn (with their rows), every aligned base in the window (with its row, or -1 for a read past the last row, which still counts towards coverage), and how many rows were used.  Returns None if the file has no index we can read
+    index, references = bamindex(renderfiles, bam)
+    if not index:
+        return None
+    blocks = []  #(row, start, end) for each stretch of a read lined up with the reference
+    gaps = []  #(row, start, end) for each deletion or spliced gap
+    insertions = []  #(row, position)
+    baserows = []  #for the aligned bases: the row, position, and base of each one, gathered a read at a time and joined together at the end
+    basepositions = []
+    basecodes = []
+    rowends = []  #where the last read in each row ends
+    nibbles = numpy.array([-1, 0, 1, -1, 2, -1, -1, -1, 3, -1, -1, -1, -1, -1, -1, -1], dtype = numpy.int8)  #BAM's 4 bit base codes -> 0 to 3 for A, C, G, and T, or -1
+    reference = bamcontig(references, contig)
+    if reference is not None:
+        for position, cigar, record, sequenceat in regionreads(bam, index, reference, start, end):
+            length = sum([operation >> 4 for operation in cigar if (operation & 15) in (0, 2, 3, 7, 8)])  #how much of the reference the read covers
+            if position + length <= start:
+                continue
+            row = -1
+            for number in range(0, len(rowends)):
+                if rowends[number] < position:  #at least one base of space between reads, as IGV leaves
+                    row = number
+                    break
+            if row < 0 and len(rowends) < maxrows:
+                row = len(rowends)
+                rowends.append(0)
+            if row >= 0:
+                rowends[row] = position + length
+            sequencelength = struct.unpack_from('<i', record, 16)[0]
+            packed = numpy.frombuffer(record, dtype = numpy.uint8, count = (sequencelength + 1) // 2, offset = sequenceat)
+            sequence = nibbles[numpy.column_stack((packed >> 4, packed & 15)).ravel()[:sequencelength]]
+            here = position - start
+            query = 0
+            for operation in cigar:
+                size = operation >> 4
+                kind = operation & 15
+                if kind in (0, 7, 8):  #M, =, and X line the read up with the reference
+                    if row >= 0:
+                        blocks.append((row, here, here + size))
+                    baserows.append(numpy.full(size, row, dtype = numpy.int32))
+                    basepositions.append(numpy.arange(here, here + size, dtype = numpy.int32))
+                    basecodes.append(sequence[query:query + size])
+                    here += size
+                    query += size
+                elif kind in (2, 3):  #a deletion, or a spliced gap
+                    if row >= 0:
+                        gaps.append((row, here, here + size))
+                    here += size
+                elif kind == 1:  #an insertion
+                    if row >= 0:
+                        insertions.append((row, here))
+                    query += size
+                elif kind == 4:  #soft clipped bases are in the sequence but not lined up with anything
+                    query += size
+    bases = (numpy.concatenate(baserows), numpy.concatenate(basepositions), numpy.concatenate(basecodes)) if baserows else (numpy.zeros(0, numpy.int32), numpy.zeros(0, numpy.int32), numpy.zeros(0, numpy.int8))
+    inside = (bases[1] >= 0) & (bases[1] < end - start)  #only the bases in the window matter from here on
+    return {'blocks' : numpy.array(blocks, dtype = numpy.int64).reshape(-1, 3),
+            'gaps' : numpy.array(gaps, dtype = numpy.int64).reshape(-1, 3),
+            'insertions' : numpy.array(insertions, dtype = numpy.int64).reshape(-1, 2),
+            'bases' : (bases[0][inside], bases[1][inside], bases[2][inside]),
+            'rows' : len(rowends)}
+
+def rowspans(rows, starts, ends, rowcount, bases, width):  #works out which pixels of a stack of rowcount rows, width pixels across and showing bases positions, are covered by spans (given as row, start, and end positions).  Every span is at least a pixel wide, however far out the view is.  Returns a rowcount by width array of True and False
+    covered = numpy.zeros((rowcount, width + 1), dtype = numpy.int32)
+    if len(rows):
+        starts = numpy.clip(starts, 0, bases)
+        ends = numpy.clip(ends, 0, bases)
+        keep = (ends > starts) & (rows >= 0)
+        rows, starts, ends = rows[keep], starts[keep], ends[keep]
+        left = starts * width // bases
+        right = numpy.maximum(left + 1, ends * width // bases)
+        numpy.add.at(covered, (rows, left), 1)  #mark where each span starts and stops, then add up along each row
+        numpy.add.at(covered, (rows, right), -1)
+    return numpy.cumsum(covered, axis = 1)[:, :width] > 0
+
+def rowpixels(covered, rowheight, lines):  #stretches a stack of rows (from rowspans) out to pixels, each row rowheight pixels tall plus a blank one below it, filling in only the lines (counted from the top of each row) given
+    pitch = rowheight + 1
+    pixels = numpy.zeros((covered.shape[0] * pitch, covered.shape[1]), dtype = bool)
+    for line in lines:
+        pixels[line::pitch] = covered
+    return pixels
+
+def drawpanel(image, top, left, width, pile, reference, settings):  #draws one BAM file's coverage and reads at one locus into the image, with its top left corner at (top, left)
+    colors = settings['colors']
+    height = settings['coverageheight']
+    bases = pile['length']
+    rows, positions, codes = pile['bases']
+    counts = numpy.zeros((4, bases), dtype = numpy.int64)  #how many reads show each base at each position
+    called = codes >= 0
+    numpy.add.at(counts, (codes[called], positions[called]), 1)
+    depth = numpy.bincount(positions, minlength = bases)[:bases]
+    if reference is None:  #without a reference, the most common base at each position stands in for it
+        reference = numpy.where(counts.sum(axis = 0) > 0, counts.argmax(axis = 0), -1)
+    columns = numpy.arange(width) * bases // width  #the position shown in each column of pixels
+    scale = height / max(1, depth.max())
+    bars = numpy.rint(depth[columns] * scale).astype(numpy.int64)
+    heights = numpy.arange(height, 0, -1)[:, None]  #how far each line of pixels is from the bottom of the coverage track
+    area = image[top:top + height, left:left + width]
+    area[heights <= bars[None, :]] = colors['coverage']
+    mismatched = counts.sum(axis = 0) - numpy.where(reference >= 0, counts[numpy.maximum(reference, 0), numpy.arange(bases)], 0)
+    flagged = (mismatched > 0.2 * numpy.maximum(depth, 1)) & (depth > 0)  #like IGV, a position gets colored by base when more than a fifth of the reads disagree with the reference
+    below = numpy.zeros(width, dtype = numpy.float64)
+    for code in range(0, 4):  #each base gets its share of the bar, stacked up from the bottom
+        share = numpy.where(flagged[columns], counts[code][columns] * scale, 0)
+        fill = (heights > numpy.rint(below)[None, :]) & (heights <= numpy.rint(below + share)[None, :])
+        area[fill] = colors['bases'][code]
+        below += share
+    if not pile['rows']:
+        return
+    rowheight = settings['rowheight']
+    top += height + 2
+    area = image[top:top + pile['rows'] * (rowheight + 1), left:left + width]
+    blocks = pile['blocks']
+    area[rowpixels(rowspans(blocks[:, 0], blocks[:, 1], blocks[:, 2], pile['rows'], bases, width), rowheight, range(0, rowheight))] = colors['read']
+    gaps = pile['gaps']
+    area[rowpixels(rowspans(gaps[:, 0], gaps[:, 1], gaps[:, 2], pile['rows'], bases, width), rowheight, [rowheight // 2])] = colors['deletion']
+    wrong = called & (rows >= 0) & (reference[positions] >= 0) & (codes != reference[positions])
+    for code in range(0, 4):
+        which = wrong & (codes == code)
+        area[rowpixels(rowspans(rows[which], positions[which], positions[which] + 1, pile['rows'], bases, width), rowheight, range(0, rowheight))] = colors['bases'][code]
+    insertions = pile['insertions']
+    area[rowpixels(rowspans(insertions[:, 0], insertions[:, 1], insertions[:, 1] + 1, pile['rows'], bases, width), rowheight, range(0, rowheight))] = colors['insertion']
+
+def writepng(filename, image):  #saves an array of pixels (height by width by red, green, and blue) as a PNG file.  It is written under a temporary name first so that nobody ever sees half an image
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    height, width = image.shape[:2]
+    rows = numpy.zeros((height, width * 3 + 1), dtype = numpy.uint8)  #each line starts with a byte saying it is not filtered
+    rows[:, 1:] = image.reshape(height, width * 3)
+    output = open(filename + '.partial', 'wb')
+    output.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b''))
+    output.close()
+    os.replace(filename + '.partial', filename)
+
+def renderimage(view, tracks, filename, settings, usereference = True):  #draws what IGV would show for tracks (a list of BAM files) at view (a goto argument, which may list several loci for split panels) and saves it to filename.  Runs in the pool's processes.  Returns None if it worked, or a message saying why not
+    try:
+        panels = []
+        for locus in view.split(' '):
+            contig = locus.rsplit(':', 1)[0]
+            start = locuskey(locus)[1] - 1  #counting from 0, as BAM files do
+            end = locusend(locus)
+            if end - start == 1:  #a single position is shown in the middle of a window around it
+                start = max(0, start - settings['flank'])  #not past the start of the contig, which has nothing in the index before it
+                end += settings['flank']
+            panels.append((contig, start, end))
+        panelwidth = max(1, (settings['width'] - settings['gap'] * (len(panels) - 1)) // len(panels))
+        piles = []  #for each track, a pile of reads for each panel
+        for bam in tracks:
+            trackpiles = []
+            for contig, start, end in panels:
+                pile = pileup(bam, contig, start, end, settings['maxrows'])
+                if pile is None:
+                    return 'no index for ' + bam + ' that could be read'
+                pile['length'] = end - start
+                trackpiles.append(pile)
+            piles.append(trackpiles)
+        references = [None] * len(panels)
+        if settings['reference'] and usereference:
+            references = [referencebases(settings['reference'], contig, start, end) for contig, start, end in panels]
+        heights = [settings['coverageheight'] + 2 + max([pile['rows'] for pile in trackpiles]) * (settings['rowheight'] + 1) + 6 for trackpiles in piles]
+        image = numpy.empty((max(1, sum(heights)), panelwidth * len(panels) + settings['gap'] * (len(panels) - 1), 3), dtype = numpy.uint8)
+        image[:, :] = settings['colors']['background']
+        top = 0
+        for track in range(0, len(tracks)):
+            for panel in range(0, len(panels)):
+                left = panel * (panelwidth + settings['gap'])
+                if panel:
+                    image[top:top + heights[track], left - settings['gap']:left] = settings['colors']['separator']
+                drawpanel(image, top, left, panelwidth, piles[track][panel], references[panel], settings)
+            top += heights[track]
+            image[top - 3:top - 1, :] = settings['colors']['separator']  #a line under each BAM file
+        writepng(filename, image)
+    except (OSError, ValueError, struct.error, zlib.error) as error:
+        return str(error)
+    return None
+
+def rendertasks(chunks, directory, genome = None):  #works out what to draw for every snapshot in the chunks: what IGV would have been told to go to, the tracks it would have had loaded, and the image to save.  Hands back (view, tracks, filename, step, whether the run's reference applies) one at a time
+    for steps in chunks:
+        view = ''
+        tracks = []
+        current = genome
+        for step in steps:
+            command, argument, linecount, locus, bam = step
+            if command == 'genome':
+                current = argument
+            elif command == 'goto':
+                view = argument
+            elif command == 'new':
+                tracks = []
+            elif command == 'load':
+                tracks.append(argument)
+            elif command == 'tracks':
+                tracks = list(argument)
+            elif command == 'snapshot':
+                yield (view, list(tracks), directory + '/' + argument, step, current == genome)
+
+def renderrun(chunks, directory, settings, processes, position, journal = None, genome = None):  #draws every snapshot in the chunks ourselves instead of asking IGV, on a pool of processes (numpy gives up the lock Python threads share for very little of this work).  The images for the next several snapshots are drawn while the finished ones are written down in the journal.  Returns a list of messages for the images that could not be drawn
+    failures = []
+    ahead = collections.deque()  #(step, future) for each image being drawn, oldest first
+    tasks = rendertasks(chunks, directory, genome)
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = processes)
+    drawn = 0
+    try:
+        while True:
+            while len(ahead) < 4 * processes:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                view, tracks, filename, step, usereference = task
+                ahead.append((step, executor.submit(renderimage, view, tracks, filename, settings, usereference)))
+            if not ahead:
+                break
+            step, future = ahead.popleft()
+            problem = future.result()
+            if problem:
+                failures.append('Unable to draw ' + step[1] + ' for line ' + str(step[2]) + ' (' + problem + ').')
+                continue
+            drawn += 1
+            if journal:
+                recordsnapshot(journal, step)
+            print ('Drawing line ' + str(step[2]) + ', ' + progress(position) + ' (' + step[1] + ').', end = ' \r')
+    finally:
+        executor.shutdown(cancel_futures = True)
+    position['drawn'] = drawn
+    return failures
+
+def batchtext(step):  #gives the line of an IGV batch script that does the same thing as a compiled step
+    command, argument, linecount, locus, bam = step
+    if command == 'goto':
+        return 'goto ' + igvlocus(argument)
+    if command == 'load':
+        return 'load ' + fileurl(argument)
+    if command == 'snapshot':
+        return 'snapshot \"' + argument + '\"'
+    if command == 'genome':
+        return 'genome ' + argument
+    if command == 'remove':
+        trackname = ntpath.basename(argument)
+        return 'remove \"' + trackname + ' Coverage\"\nremove \"' + trackname + '\"'
+    return command  #new and collapse take no arguments
+
+def writebatch(steps, scriptfile, genome, directory, exitwhendone):  #writes the compiled steps (a list or a reader) out as an IGV batch script that sets its own genome and snapshot directory, so it can be run on its own
+    if directory[0] != '/':  #IGV does not know our working directory, so the snapshot directory must be absolute (same as in cmdsetimagedirectory)
+        directory = os.getcwd() + '/' + directory
+    output = open(scriptfile, 'w')
+    output.write('genome ' + genome + '\n')
+    output.write('snapshotDirectory \"' + directory + '\"\n')
+    commands = 0
+    for step in expandtracks(steps, genome):  #steps can be a reader, so a huge run is written out as it is compiled
+        output.write(batchtext(step) + '\n')
+        commands += 1
+    if exitwhendone:  #for headless runs using igv.sh -b, so that IGV closes once it is finished
+        output.write('exit\n')
+    output.close()
+    return commands  #tells the caller how many commands went into the script
+
+def cmdbatch(scriptfile, igv, metrics = None):  #tells IGV to run a whole batch script.  IGV will not answer until the script is finished, so we stop waiting on the usual timeout until it does
+    scriptfile = os.path.abspath(scriptfile)  #IGV does not know our working directory
+    sent = time.time()
+    try:
+        igv.send(rawbytes('batch ' + scriptfile + '\n'))
+    except BrokenPipeError:
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+    except:
+        raise IGVError('Unexpected error sending BATCH command to IGV.')
+    timeout = igv.gettimeout()
+    igv.settimeout(None)  #a batch with thousands of snapshots can take hours, so there is no sensible timeout here
+    success = awaitIGVResponse(igv)
+    recordtime(metrics, 'batch', sent)
+    igv.settimeout(timeout)  #put the usual timeout back for anything else we send
+    return success
+
+def missingimages(steps, directory):  #checks that every snapshot in a list of compiled steps made it into the directory, and returns the steps for any that did not
+    missing = []
+    for step in steps:
+        if step[0] == 'snapshot':
+            filename = directory + '/' + step[1]
+            if not os.path.isfile(filename) or not os.path.getsize(filename):  #a zero-byte file means IGV failed partway through writing it
+                missing.append(step)
+    return missing
+
+def reportmissing(missing, label = ''):  #tells the user which planned images were never made
+    for command, argument, linecount, locus, bam in missing:
+        print (label + 'Missing image ' + argument + ' for line ' + str(linecount) + ' (locus: ' + locus + ').')
+    if missing:
+        print (label + str(len(missing)) + ' planned images were not produced.')
+
+def verifybatch(scriptfile):  #reads a batch script written by this program and checks the images it was supposed to make, such as after running it with igv.sh -b
+    directory = '.'
+    missing = []
+    total = 0
+    script = open(scriptfile, 'r')
+    for line in script:
+        line = line.strip('\r\n\t ')
+        if re.match('^snapshotDirectory ', line):
+            directory = line.split(' ', 1)[1].strip('\"')
+        if re.match('^snapshot ', line):
+            total += 1
+            filename = line.split(' ', 1)[1].strip('\"')
+            missing += missingimages([('snapshot', filename, total, '', None)], directory)
+    script.close()
+    for step in missing:
+        print ('Missing image ' + step[1])
+    print (str(total - len(missing)) + ' of ' + str(total) + ' planned images found in ' + directory + '.')
+    return not missing
+
+def batchworker(igv, label, steps, scriptfile, genome, workerdir, results, journal = None, subdirectory = '', metrics = None, cache = None):  #runs in its own thread for each IGV instance in a pool, submitting that instance's share of the run as a single batch script
+    try:
+        writebatch(steps, scriptfile, genome, workerdir, False)
+        if not cmdbatch(scriptfile, igv, metrics):
+            print (label + 'IGV reported an error while running ' + scriptfile + '.')
+    except (IGVError, SystemExit) as error:
+        message = str(error) or 'see previous lines for details'
+        print (label + 'stopped early (' + str(message) + ')')
+    missing = missingimages(steps, workerdir)  #either way, we check which images it managed to make
+    if journal or cache:  #and write down the ones it did make, in case we need to resume, and keep copies for next time
+        for step in steps:
+            if step[0] == 'snapshot' and step not in missing:
+                if cache:  #before the journal, which may hand the image to the packer
+                    storeimage(cache, workerdir, step[1])
+                if journal:
+                    recordsnapshot(journal, step, subdirectory)
+    if metrics:  #IGV does not tell us about each command in a batch, but we can at least count the images
+        with metrics['lock']:
+            metrics['snapshots'] += len([step for step in steps if step[0] == 'snapshot']) - len(missing)
+    results.append(missing)
+    igv.close()
+
+def sharechunks(chunks, count):  #splits the chunks of a run into a share for each IGV instance, handing the biggest chunks out first to whichever instance has the least work so far so that they all finish at about the same time
+    shares = [[] for i in range(0, count)]
+    sizes = [0] * count
+    order = sorted(range(0, len(chunks)), key = lambda i: len(chunks[i]), reverse = True)
+    for i in order:
+        smallest = sizes.index(min(sizes))
+        shares[smallest].append(i)
+        sizes[smallest] += len(chunks[i])
+    return [[chunks[i] for i in sorted(share)] for share in shares]  #each share is run in the same order as the list
+
+def runbatches(igvs, chunks, workerdirs, genome, directory, journal = None, metrics = None, cache = None):  #hands the compiled run to IGV as batch scripts, one for each instance in the pool, then checks the images against the plan
+    workers = []
+    results = []
+    shares = sharechunks(chunks, len(igvs))
+    for workernumber in range(0, len(igvs)):
+        label = ''
+        if len(igvs) > 1:
+            label = '[IGV ' + str(workernumber + 1) + '] '  #tags each message so the user can tell which instance it came from
+        steps = [step for chunk in shares[workernumber] for step in chunk]
+        scriptfile = directory + '/autoIGVbatch' + str(workernumber + 1) + '.txt'
+        subdirectory = ''
+        if len(igvs) > 1:
+            subdirectory = 'worker' + str(workernumber + 1) + '/'
+        worker = threading.Thread(target = batchworker, args = (igvs[workernumber], label, steps, scriptfile, genome, workerdirs[workernumber], results, journal, subdirectory, metrics, cache))
+        worker.daemon = True  #lets the program exit (such as with control-C) without waiting on IGV
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()  #wait until every batch has finished
+    missing = []
+    for result in results:
+        missing += result
+    return sorted(missing, key = lambda step: step[2])  #put the missing images back in the order of the file
+
+def poolworker(session, label, chunks, chunklock, position, badbams, failures):  #runs in its own thread for each IGV instance in a pool, taking chunks of steps from the shared chunks until there are none left.  session remembers what this worker's IGV has loaded between chunks, where to write down what it finishes, and how to reconnect
+    linecount = None
+    askcontinue = 'skip'  #several workers cannot sensibly share one keyboard, so problems are never asked about here
+    if session['policy']['onerror'] == 'stop':
+        askcontinue = 'stop'
+    try:  #anything that would normally stop the program only stops this worker, so we catch it here and report it back to the main thread
+        while True:
+            with chunklock:  #only one worker at a time can take the next chunk (this is also when more of the list gets read, if needed)
+                steps = next(chunks, None)
+                if steps and position.get('totalchunks'):
+                    position['chunk'] += 1
+            if not steps:  #nothing left, so this worker is done
+                break
+            linecount = steps[-1][2]  #the last step is always a snapshot, which always knows its line
+            supervise(steps, session['igv'], position, badbams, askcontinue, label, session)
+    except (IGVError, SystemExit) as error:
+        message = str(error) or 'see previous lines for details'
+        failures.append(label + 'stopped early at line ' + str(linecount) + ' (' + str(message) + ')')
+    session['igv'].close()
+
+def runpool(sessions, chunks, position, badbams):  #shares the chunks of a compiled run between several IGV instances, with each one taking the next chunk as soon as it is finished with its last one.  chunks can be a list or a reader that compiles them as they are needed
+    chunks = iter(chunks)
+    chunklock = threading.Lock()  #a reader cannot be used by two threads at once, so the workers take turns
+    failures = []  #each worker adds a message here if it has to stop early
+    workers = []
+    for workernumber in range(0, len(sessions)):
+        label = '[IGV ' + str(workernumber + 1) + '] '  #tags each message so the user can tell which instance it came from
+        worker = threading.Thread(target = poolworker, args = (sessions[workernumber], label, chunks, chunklock, position, badbams, failures))
+        worker.daemon = True  #lets the program exit (such as with control-C) without waiting on workers that are stuck waiting for IGV
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()  #wait until every worker has finished
+    return failures
+
+async def asynclisten(connection):  #runs alongside everything else for as long as a connection is open, reading IGV's responses a whole line at a time and handing each one to the oldest command still waiting for an answer (IGV always answers in the order it was asked)
+    while True:
+        try:
+            line = await connection['reader'].readline()  #the reader keeps anything after the end of the line for next time, so partial or stuck-together responses are not a problem here
+        except (ConnectionError, OSError):
+            line = b''
+        if not line:  #the connection was closed
+            break
+        if connection['pending']:
+            future = connection['pending'].popleft()
+            if not future.done():
+                future.set_result(cookbytes(line).strip('\r\n\t'))
+    while connection['pending']:  #nobody is going to answer these now
+        future = connection['pending'].popleft()
+        if not future.done():
+            future.set_exception(ConnectionError('Connection with IGV lost.'))
+
+async def asyncopen(igv = None, host = None, port = None):  #sets up an asynchronous connection to IGV, either taking over a socket we already connected (and set up) the usual way, or connecting to host and port and testing the connection with echo.  The connection is a dictionary holding the stream reader and writer and the responses still owed to us
+    if igv is not None:
+        reader, writer = await asyncio.open_connection(sock = igv)
+    else:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except ConnectionRefusedError:
+            raise IGVError('Unable to connect to IGV.  Be sure that IGV is running and configured to accept connections on its default port (60151)')
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  #without this, a short command sent while an earlier one is still unanswered can sit in our buffer for tens of milliseconds waiting for an acknowledgement, which defeats the point of keeping several in flight
+    connection = {'reader' : reader, 'writer' : writer, 'pending' : collections.deque()}
+    connection['listener'] = asyncio.ensure_future(asynclisten(connection))
+    if igv is None:
+        await asynccommand(connection, 'echo', 'echo')
+    return connection
+
+def asyncsend(connection, command):  #sends a command without waiting for IGV to finish it.  Gives back a future that will hold IGV's response once it arrives, so several commands can be in flight at once
+    future = asyncio.get_running_loop().create_future()
+    if connection['listener'].done():  #the connection has already closed, so there will never be an answer
+        future.set_exception(ConnectionError('Connection with IGV lost.'))
+        return future
+    connection['pending'].append(future)
+    connection['writer'].write(rawbytes(command + '\n'))
+    return future
+
+async def asyncresponse(future, expectedresponse = '', timeout = 20):  #waits for the response to a command sent with asyncsend and checks it the same way awaitIGVResponse does
+    try:
+        response = await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise IGVError('Timeout waiting for IGV to respond.  Has it locked up or been terminated or is another application already communicating with it on that port?')
+    except ConnectionError:
+        raise IGVError('Connection with IGV lost.  Please confirm that IGV is still running properly.')
+    return checkresponse(response, expectedresponse)
+
+async def asynccommand(connection, text, expectedresponse = '', metrics = None, bam = None):  #sends one or more commands (one per line of text) and waits for all of them.  Returns True only if they all worked.  If we are timing commands, bam is passed along for loads
+    sent = time.time()
+    commands = text.split('\n')
+    futures = [asyncsend(connection, command) for command in commands]
+    await connection['writer'].drain()
+    success = True
+    for command, future in zip(commands, futures):
+        if not await asyncresponse(future, expectedresponse):
+            success = False
+        recordtime(metrics, command.split(' ', 1)[0], sent, bam)
+    return success
+
+async def asyncclose(connection):  #closes an asynchronous connection and waits for its listener to finish
+    connection['writer'].close()
+    try:
+        await connection['writer'].wait_closed()
+    except (ConnectionError, OSError):
+        pass
+    await connection['listener']
+
+async def asyncsettracks(connection, wanted, badbams, session, label = '', where = '', metrics = None):  #the asynchronous version of settracks.  It only runs once everything before it has been answered, so it knows exactly what IGV has loaded
+    wanted = [bam for bam in wanted if bam not in badbams]
+    changes = trackchanges(session['tracks'], wanted)
+    while changes:
+        command, bam = changes.pop(0)
+        loaded = None
+        if command == 'load':
+            loaded = bam
+        success = await asynccommand(connection, batchtext((command, bam, None, None, bam)), '', metrics, loaded)
+        if command == 'new':
+            if not success:
+                raise IGVError('Failed to communicate with IGV on "new" command' + where + '.')
+            session['tracks'] = []
+        elif command == 'remove':
+            if success:
+                session['tracks'].remove(bam)
+            else:  #if IGV would not remove it, we no longer know exactly what it is showing, so we start over
+                print (label + 'Unable to remove ' + bam + where + '; starting over with a new session.')
+                session['tracks'] = None
+                changes = trackchanges(None, wanted)
+        elif success:
+            session['tracks'].append(bam)
+        else:
+            print (label + 'Error loading file ' + bam + where + ' in group photo; see previous line for details.  Skipping to next file.')
+            badbams.add(bam)
+            if session['policy']['onerror'] == 'stop':  #nobody can be asked in the middle of a pipelined run, so only the stop policy changes anything here
+                raise IGVStopped('OK. Goodbye.')
+
+async def asyncsettle(inflight, position, badbams, label, session, failedlines):  #waits for the oldest command still in flight and deals with its response, just as runsteps would have if it had waited for it right away
+    step, future, sent = inflight.popleft()
+    command, argument, linecount, locus, bam = step
+    timeout = 20
+    if session.get('policy') and session['policy']['retries']:
+        timeout = commandtimeout(position.get('metrics'), command, argument, session['attempt'])
+    success = await asyncresponse(future, '', timeout)
+    if command == 'load':
+        recordtime(position.get('metrics'), command, sent, argument)  #measured from when it was sent, so this includes any time spent waiting behind the commands sent before it
+    else:
+        recordtime(position.get('metrics'), command, sent)
+    where = ''
+    if linecount:
+        where = ' for line ' + str(linecount)
+    if command == 'goto':
+        if success:
+            failedlines.discard(linecount)
+        else:
+            print (label + 'Error loading going to locus ' + locus + ' see previous line for details.  Skipping to next locus.')
+            failedlines.add(linecount)
+    elif command == 'new':
+        if not success:
+            raise IGVError('Failed to communicate with IGV on "new" command' + where + '.')
+        session['tracks'] = []
+    elif command == 'genome':
+        if not success:
+            raise IGVError('Failed to communicate with IGV when switching to the genome ' + argument + '.')
+        session['genome'] = argument
+        session['tracks'] = None
+    elif command == 'load':
+        if not success:
+            print (label + 'Error loading file ' + argument + where + '; see previous line for details.  Skipping to next file.')
+            badbams.add(argument)
+            badbams.add(bam)
+            if session['policy']['onerror'] == 'stop':
+                raise IGVStopped('OK. Goodbye.')
+        elif session['tracks'] is not None:
+            session['tracks'].append(argument)
+    elif not success:  #collapse or snapshot
+        raise IGVError('Problem saving snapshot' + where + ' in ' + bam + ' see previous line for details.\nPlease confirm that the directory /autoIGV/ exists and this script has access to write to it and create subdirectories.  Also try removing any non-word characters or whitespaces from your bam file name.')
+    elif command == 'snapshot':
+        if session.get('cache'):  #before the journal, which may hand the image to the packer
+            storeimage(session['cache'], session['directory'], argument, badbams)
+        if session.get('journal'):
+            recordsnapshot(session['journal'], step, session.get('subdirectory', ''))
+
+async def asyncrunsteps(connection, steps, position, badbams, label, session, window):  #the pipelined version of runsteps.  Up to window commands are sent before waiting for any answers, so IGV never sits idle waiting on us.  A snapshot (or a change of tracks) waits until everything before it has been answered, so that we never take a picture after a goto or load that failed
+    inflight = collections.deque()  #(step, future, time sent) for every command sent but not yet answered, oldest first
+    failedlines = set()  #lines whose goto failed, so their photos would be of the wrong place
+    for step in steps:
+        command, argument, linecount, locus, bam = step
+        barrier = command == 'snapshot' or command == 'tracks' or command == 'genome'
+        while inflight and (barrier or len(inflight) >= window):
+            await asyncsettle(inflight, position, badbams, label, session, failedlines)
+        if bam in badbams:  #this file failed to load earlier, so there is nothing to photograph
+            continue
+        if command != 'goto' and linecount and linecount in failedlines:
+            continue
+        if command == 'tracks':
+            where = ''
+            if linecount:
+                where = ' for line ' + str(linecount)
+            await asyncsettracks(connection, argument, badbams, session, label, where, position.get('metrics'))
+            continue
+        if command == 'genome' and argument == session.get('genome'):
+            continue
+        if command == 'snapshot':
+            print (label + 'Processing line ' + str(linecount) + ', ' + progress(position) + ' (' + argument + ').', end = ' \r')
+        inflight.append((step, asyncsend(connection, batchtext(step)), time.time()))
+        await connection['writer'].drain()
+    while inflight:
+        await asyncsettle(inflight, position, badbams, label, session, failedlines)
+
+async def asyncworker(session, label, chunks, position, badbams, failures, window):  #the asynchronous version of poolworker (and supervise).  Many of these share one event loop, one for each IGV instance, and take turns without needing threads
+    connection = await asyncopen(session['igv'])
+    retries = session['policy']['retries']
+    linecount = None
+    try:
+        for steps in chunks:  #every worker takes from the same reader, and since only one of them runs at a time, no lock is needed
+            if position.get('totalchunks'):
+                position['chunk'] += 1
+            linecount = steps[-1][2]  #the last step is always a snapshot, which always knows its line
+            session['attempt'] = 0
+            while True:
+                try:
+                    await asyncrunsteps(connection, steps, position, badbams, label, session, window)
+                    break
+                except IGVError as error:
+                    if isinstance(error, IGVStopped) or session['attempt'] >= retries:
+                        raise
+                    message = str(error) or 'see previous lines for details'
+                session['attempt'] += 1
+                print ('\n' + label + 'Problem with IGV (' + str(message) + '); reconnecting to try again (' + str(session['attempt']) + ' of ' + str(retries) + ').')
+                await asyncclose(connection)
+                if not await asyncio.to_thread(reconnect, session, label):  #reconnecting waits between tries, so it is done off to the side where it will not hold up the other workers
+                    raise IGVError('Unable to reconnect with IGV on ' + session['endpoint'][0] + ':' + str(session['endpoint'][1]) + '.')
+                connection = await asyncopen(session['igv'])
+                if session.get('journal'):
+                    steps = skipfinished(steps, session['journal']['done'])
+    except (IGVError, SystemExit) as error:
+        message = str(error) or 'see previous lines for details'
+        failures.append(label + 'stopped early at line ' + str(linecount) + ' (' + str(message) + ')')
+    await asyncclose(connection)
+
+async def asyncrunpool(sessions, chunks, position, badbams, window = 4):  #runs the chunks of a compiled run on one or more IGV instances from a single event loop, with up to window commands in flight on each connection.  Returns a list of messages from any workers that had to stop early
+    chunks = iter(chunks)
+    failures = []
+    workers = []
+    for workernumber in range(0, len(sessions)):
+        label = ''
+        if len(sessions) > 1:
+            label = '[IGV ' + str(workernumber + 1) + '] '  #tags each message so the user can tell which instance it came from
+        workers.append(asyncworker(sessions[workernumber], label, chunks, position, badbams, failures, window))
+    await asyncio.gather(*workers)
+    return failures
+
+def openqueue(queuefile):  #opens the task queue shared by every machine working on a run, a SQLite database on a drive they can all reach.  Each thread needs its own connection.  The long timeout is for waiting on another machine that is in the middle of taking a task
+    queue = sqlite3.connect(queuefile, timeout = 120, isolation_level = None)  #we say when transactions start and end ourselves
+    queue.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)')
+    queue.execute('CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, steps TEXT, status TEXT, worker TEXT, leaseuntil REAL, attempts INTEGER, finished REAL)')
+    return queue
+
+def enqueuetasks(queuefile, chunks, settings, batch = 500):  #the coordinator's job: puts every chunk of the run into the queue as a task waiting for a worker, along with the settings the workers need (the genome and where the images go).  chunks can be a reader, so a huge list is queued as it is compiled, batch tasks at a time so that workers started meanwhile are not kept waiting for the whole list to be compiled.  Returns the number of tasks queued
+    queue = openqueue(queuefile)
+    queue.execute('BEGIN IMMEDIATE')
+    for name in settings:
+        queue.execute('INSERT OR REPLACE INTO settings VALUES (?, ?)', (name, str(settings[name])))
+    queue.execute('COMMIT')  #the settings go in first, since a worker needs them before it can take anything
+    count = 0
+    waiting = []  #tasks compiled but not put in yet.  They go in a batch at a time, and the database is left alone while the next batch is compiled, so workers can get at it
+    for steps in itertools.chain(chunks, [None]):
+        if steps is not None:
+            waiting.append((json.dumps(steps),))
+        if waiting and (steps is None or len(waiting) >= batch):
+            queue.execute('BEGIN IMMEDIATE')
+            queue.executemany('INSERT INTO tasks (steps, status, attempts) VALUES (?, \'waiting\', 0)', waiting)
+            queue.execute('COMMIT')
+            count += len(waiting)
+            waiting = []
+    queue.close()
+    return count
+
+def queuesettings(queuefile):  #reads the settings the coordinator left for the workers
+    queue = openqueue(queuefile)
+    settings = dict(queue.execute('SELECT name, value FROM settings').fetchall())
+    queue.close()
+    return settings
+
+def leasetask(queue, worker, lease, maxattempts = 3):  #takes the next task nobody is working on (or whose worker has not been heard from since its lease ran out) and promises to finish it within lease seconds.  Tasks that have already been tried maxattempts times are given up on.  Returns (task number, steps), or None if nothing is left to take
+    queue.execute('BEGIN IMMEDIATE')  #only one machine at a time can be choosing a task, so no two take the same one
+    now = time.time()
+    queue.execute('UPDATE tasks SET status = \'failed\' WHERE status = \'leased\' AND leaseuntil < ? AND attempts >= ?', (now, maxattempts))
+    task = queue.execute('SELECT id, steps FROM tasks WHERE status = \'waiting\' OR (status = \'leased\' AND leaseuntil < ?) ORDER BY id LIMIT 1', (now,)).fetchone()
+    if task:
+        queue.execute('UPDATE tasks SET status = \'leased\', worker = ?, leaseuntil = ?, attempts = attempts + 1 WHERE id = ?', (worker, now + lease, task[0]))
+    queue.execute('COMMIT')
+    if not task:
+        return None
+    steps = []
+    for step in json.loads(task[1]):  #JSON turned our tuples into lists, so we turn them back
+        if step[0] == 'tracks':
+            step[1] = tuple(step[1])
+        steps.append(tuple(step))
+    return (task[0], steps)
+
+def renewlease(queuefile, task, worker, lease, stop):  #runs in the background while a task is being worked on, pushing its lease back every so often so that a long task is not taken away from a worker that is still going.  Stops when stop is set
+    queue = openqueue(queuefile)
+    while not stop.wait(lease / 3):
+        try:
+            queue.execute('UPDATE tasks SET leaseuntil = ? WHERE id = ? AND worker = ? AND status = \'leased\'', (time.time() + lease, task, worker))
+        except sqlite3.Error as error:  #most likely another machine holding the database for longer than the timeout.  The lease is renewed three times over before it runs out, so we try again next time rather than giving up on it
+            print ('\nUnable to renew the lease on task ' + str(task) + ' (' + str(error) + '); trying again in ' + str(round(lease / 3)) + ' seconds.')
+    queue.close()
+
+def finishtask(queue, task, worker, finished, maxattempts = 3):  #marks a task as done, or hands it back for someone else to try if this worker could not finish it (or gives up on it, if it has already been tried maxattempts times).  Nothing happens if the task has already been taken away from us (our lease ran out and someone else has it now)
+    if finished:
+        queue.execute('UPDATE tasks SET status = \'done\', finished = ? WHERE id = ? AND worker = ?', (time.time(), task, worker))
+    else:
+        queue.execute('UPDATE tasks SET status = CASE WHEN attempts >= ? THEN \'failed\' ELSE \'waiting\' END, worker = NULL WHERE id = ? AND worker = ? AND status = \'leased\'', (maxattempts, task, worker))
+
+def queuecounts(queue):  #how many tasks are in each state
+    return dict(queue.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+
+def queueworker(session, label, queuefile, worker, lease, position, badbams, failures):  #runs in its own thread for each IGV instance on a worker machine, taking tasks from the shared queue until there are none left.  Works just like poolworker, except that the tasks come from the queue and each one is marked as done there when it is finished
+    queue = openqueue(queuefile)
+    askcontinue = 'skip'  #nobody is watching a worker
+    if session['policy']['onerror'] == 'stop':
+        askcontinue = 'stop'
+    linecount = None
+    try:
+        while True:
+            leased = leasetask(queue, worker, lease)
+            if not leased:
+                break
+            task, steps = leased
+            counts = queuecounts(queue)
+            position['chunk'] = counts.get('done', 0) + counts.get('leased', 0)
+            linecount = steps[-1][2]
+            finishedalready = set([journalkey(step) for step in steps if step[0] == 'snapshot' and goodimage(session['directory'] + '/' + step[1])])  #a worker that was lost partway through a task may have taken some of its images already
+            steps = skipfinished(steps, finishedalready)
+            stop = threading.Event()
+            renewer = threading.Thread(target = renewlease, args = (queuefile, task, worker, lease, stop))
+            renewer.daemon = True
+            renewer.start()
+            try:
+                supervise(steps, session['igv'], position, badbams, askcontinue, label, session)
+            except (IGVStopped, SystemExit):
+                stop.set()
+                finishtask(queue, task, worker, False)  #let another worker have a go at it
+                raise
+            except IGVError as error:  #a task that goes wrong is handed back (and given up on after a few tries), and this worker carries on with the next one as long as its IGV can be reached
+                stop.set()
+                finishtask(queue, task, worker, False)
+                print ('\n' + label + 'Problem with IGV on line ' + str(linecount) + ' (' + (str(error) or 'see previous lines for details') + '); handed the task back and reconnecting.')
+                if not reconnect(session, label):
+                    raise IGVError('Unable to reconnect with IGV on ' + session['endpoint'][0] + ':' + str(session['endpoint'][1]) + '.')
+                continue
+            stop.set()
+            finishtask(queue, task, worker, True)
+    except (IGVError, SystemExit) as error:
+        message = str(error) or 'see previous lines for details'
+        failures.append(label + 'stopped early at line ' + str(linecount) + ' (' + str(message) + ')')
+    queue.close()
+    session['igv'].close()
+
+def runqueue(sessions, queuefile, lease, position, badbams):  #works on the shared queue with every IGV instance on this machine until it is empty.  Returns a list of messages from any that had to stop early
+    failures = []
+    workers = []
+    for workernumber in range(0, len(sessions)):
+        label = ''
+        if len(sessions) > 1:
+            label = '[IGV ' + str(workernumber + 1) + '] '
+        worker = socket.gethostname() + ':' + str(os.getpid()) + ':' + str(workernumber + 1)  #so the queue knows which tasks are whose
+        thread = threading.Thread(target = queueworker, args = (sessions[workernumber], label, queuefile, worker, lease, position, badbams, failures))
+        thread.daemon = True
+        thread.start()
+        workers.append(thread)
+    for thread in workers:
+        thread.join()
+    return failures
+
+def runworker(args):  #worker mode: connects to the IGV instances on this machine, sets them up with the settings the coordinator left in the queue, and works on the queue until it is empty
+    starttime = time.time()
+    queuefile = args['work']
+    settings = queuesettings(queuefile)
+    if 'directory' not in settings:
+        raise IGVError(queuefile + ' does not look like a queue made with --enqueue.')
+    print ('Loading preferences...', end = '')
+    prefs = loadprefs(args['prefsfile'])
+    print('PREFERENCES LOADED')
+    hosts = args['hosts'] or prefs[0].split(',')
+    ports = args['ports'] or [int(port) for port in prefs[1].split(',')]
+    genome = settings['genome']  #every worker has to use the same genome the coordinator was set up with
+    directory = settings['directory']
+    if not os.path.isdir(directory):
+        raise IGVError('The run directory ' + directory + ' cannot be seen from this machine.  Every worker needs to see it at the same path.')
+    metrics = None
+    if args['metrics'] or args['live'] or args['retries']:
+        metrics = newmetrics(args['live'])
+    policy = {'retries' : args['retries'], 'igvcommand' : args['igvcommand'], 'onerror' : args['onerror']}
+    sessions = []
+    try:
+        endpoints = endpointlist(hosts, ports)
+    except ValueError as error:
+        usage(str(error))
+        quit()
+    for host, port in endpoints:
+        igv = connect(host, port, metrics)
+        print ('Setting the genome in IGV...', end = '')
+        if not cmdgenome(genome, igv, metrics) or not cmdsetimagedirectory(directory, igv, metrics):
+            raise IGVError('Failed to set up IGV on ' + host + ':' + str(port) + '.')
+        print ('OK')
+        journal = openjournal(directory, set(), {}, 'autoIGVjournal.' + host + '.' + str(port) + '.' + str(os.getpid()) + '.txt')  #each worker keeps its own journal, since several machines appending to one file on a network drive can garble it
+        sessions.append(newsession(igv, (host, port), genome, directory, journal, '', policy))
+    queue = openqueue(queuefile)
+    position = {'metrics' : metrics, 'totalchunks' : sum(queuecounts(queue).values()), 'chunk' : 0}
+    queue.close()
+    print ('Working on the queue in ' + queuefile + '.')
+    failures = runqueue(sessions, queuefile, args['lease'], position, set())
+    for session in sessions:
+        session['journal']['file'].close()
+    queue = openqueue(queuefile)
+    counts = queuecounts(queue)
+    queue.close()
+    if failures:
+        print ('\n' + '\n'.join(failures))
+    print ('\nNothing left for this machine to do after ' + str(round(time.time() - starttime, 1)) + ' seconds.  The queue has ' + ', '.join([str(counts[status]) + ' ' + status for status in sorted(counts)]) + ' tasks.')
+    quit()
+
+def jobworker(session, label, jobs, daemon):  #runs in its own thread for each IGV instance the daemon holds, taking jobs in the order they came in and photographing each into a directory of its own.  The genome stays loaded from one job to the next, so a job only costs its own loads and snapshots
+    while True:
+        job = jobs.get()
+        started = time.time()
+        with daemon['lock']:
+            daemon['jobs'] += 1
+            jobdirectory = os.path.join(daemon['directory'], 'job' + str(daemon['jobs']))
+        lost = False  #whether the connection has to be remade before the next job
+        try:
+            setdirectory(session, jobdirectory)
+            print (label + 'Starting job ' + os.path.basename(jobdirectory) + ' (' + str(len(job['lines'])) + ' lines).')
+            images = photograph(session, job['lines'], job['mode'], job['nocollapse'], daemon['reusetracks'])
+            job['result'] = {'images' : images, 'directory' : jobdirectory, 'seconds' : round(time.time() - started, 3)}
+            print ('\n' + label + 'Finished job ' + os.path.basename(jobdirectory) + ' with ' + str(len(images)) + ' images in ' + str(round(time.time() - started, 1)) + ' seconds.')
+        except IGVStopped as error:  #the job asked to stop at a file that would not load.  IGV is still fine, so on to the next job
+            job['result'] = {'error' : str(error)}
+            print ('\n' + label + 'Job ' + os.path.basename(jobdirectory) + ' stopped: ' + str(error))
+        except (IGVError, OSError) as error:  #the job fails, and since we cannot tell what state IGV was left in, we always remake the connection before the next one
+            message = str(error) or 'see previous lines for details'
+            job['result'] = {'error' : message}
+            print ('\n' + label + 'Job ' + os.path.basename(jobdirectory) + ' failed: ' + message)
+            lost = True
+        except Exception as error:  #anything else (a job we could not make sense of, or a bug) fails only this job, rather than ending the thread and leaving the job waiting forever
+            job['result'] = {'error' : type(error).__name__ + ': ' + str(error)}
+            print ('\n' + label + 'Job ' + os.path.basename(jobdirectory) + ' failed: ' + job['result']['error'])
+        finally:  #whatever happened, whoever sent the job gets an answer
+            if job['result'] is None:
+                job['result'] = {'error' : 'The job was interrupted.'}
+            with daemon['lock']:
+                daemon['finished'] += 1
+            job['done'].set()
+        if lost and not reconnect(session, label):
+            dropworker(session, label, jobs, daemon)
+            return
+
+def dropworker(session, label, jobs, daemon):  #takes an IGV instance we could not reconnect with out of the daemon.  Once the last one is gone there is nothing left to take jobs, so the ones waiting are failed and the daemon is told to stop
+    host, port = session['endpoint']
+    with daemon['lock']:
+        daemon['workers'] -= 1
+        print (label + 'Unable to reconnect with IGV on ' + host + ':' + str(port) + '.  ' + str(daemon['workers']) + ' IGV instance(s) left taking jobs.')
+        if daemon['workers'] > 0:
+            return
+        daemon['stopped'] = 'Lost the connection to every IGV instance and could not reconnect.  Check that IGV is still running (or use --igvcommand so autoIGV can start it again).'
+        while not jobs.empty():
+            job = jobs.get()
+            job['result'] = {'error' : daemon['stopped']}
+            job['done'].set()
+
+def jobrequest(line, daemon, jobs):  #works out the answer to one request sent to the daemon: a job ({"lines": [...], and optionally "mode" and "nocollapse"}), which is answered once its images are taken, or {"status": true}, which is answered right away
+    try:
+        request = json.loads(line)
+        if request.get('status'):
+            with daemon['lock']:
+                return {'jobs' : daemon['jobs'], 'finished' : daemon['finished'], 'waiting' : jobs.qsize(), 'genome' : daemon['genome'], 'directory' : daemon['directory']}
+        if not isinstance(request['lines'], list):  #a single string would otherwise be taken one character at a time
+            raise TypeError('lines must be a list')
+        lines = [str(text) for text in request['lines']]
+        mode = int(request.get('mode') or daemon['mode'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return {'error' : 'A job is a line of JSON with a list of target lines, such as {"lines": ["1:12345\t/data/sample.bam"], "mode": 3}.'}
+    if mode not in (1, 2, 3):
+        return {'error' : 'The imaging mode must be 1, 2, or 3.'}
+    job = {'lines' : lines, 'mode' : mode, 'nocollapse' : bool(request.get('nocollapse', daemon['nocollapse'])), 'done' : threading.Event(), 'result' : None}
+    with daemon['lock']:  #checked under the lock so that a job cannot slip in after dropworker has failed the ones waiting
+        if daemon['stopped']:
+            return {'error' : daemon['stopped']}
+        jobs.put(job)
+    job['done'].wait()
+    return job['result']
+
+def handlejobs(connection, daemon, jobs):  #answers requests on one connection to the daemon, one line of JSON each way, until the other end hangs up
+    reader = connection.makefile('rb')
+    try:
+        for rawline in reader:
+            if not rawline.strip():
+                continue
+            connection.sendall(rawbytes(json.dumps(jobrequest(cookbytes(rawline), daemon, jobs)) + '\n'))
+    except OSError:  #the other end went away before its job was done.  The images are still taken
+        pass
+    reader.close()
+    connection.close()
+
+def rundaemon(args):  #daemon mode: connects to the IGV instance(s), loads the genome once, and then takes snapshot jobs from other programs on this machine (see sendjob) until stopped, so that a handful of images costs only the time to take them
+    print ('Loading preferences...', end = '')
+    prefs = loadprefs(args['prefsfile'])
+    print('PREFERENCES LOADED')
+    hosts = args['hosts'] or prefs[0].split(',')
+    ports = args['ports'] or [int(port) for port in prefs[1].split(',')]
+    genome = args['genome'] or prefs[2]
+    print ('Creating directory for this daemon\'s images...', end = '')
+    directory = createsavedir(args['directory'] or prefs[3])
+    if not directory:
+        raise IGVError('Output directory already appears to exist or could not be created.')
+    print ('OK')
+    metrics = None
+    if args['metrics'] or args['live'] or args['retries']:
+        metrics = newmetrics(args['live'])
+    onerror = 'skip'  #nobody is watching a daemon to ask
+    if args['onerror'] == 'stop':  #a job stops at the first file that will not load, but the daemon carries on
+        onerror = 'stop'
+    daemon = {'directory' : os.path.abspath(directory), 'genome' : genome, 'mode' : args['mode'] or 3, 'nocollapse' : args['nocollapse'], 'reusetracks' : args['reusetracks'], 'lock' : threading.Lock(), 'jobs' : 0, 'finished' : 0, 'workers' : 0, 'stopped' : None}
+    jobs = queue.Queue()  #jobs waiting for an IGV instance, oldest first
+    try:
+        endpoints = endpointlist(hosts, ports)
+    except ValueError as error:
+        usage(str(error))
+        quit()
+    daemon['workers'] = len(endpoints)
+    for workernumber in range(0, len(endpoints)):
+        host, port = endpoints[workernumber]
+        print ('Setting the genome in IGV...', end = '')
+        session = opensession(host, port, genome, daemon['directory'], {'retries' : args['retries'], 'igvcommand' : args['igvcommand'], 'onerror' : onerror}, metrics)
+        print ('OK')
+        label = ''
+        if len(endpoints) > 1:
+            label = '[IGV ' + str(workernumber + 1) + '] '
+        worker = threading.Thread(target = jobworker, args = (session, label, jobs, daemon))
+        worker.daemon = True
+        worker.start()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        listener.bind(('localhost', args['serve']))  #only programs on this machine can send jobs, since they can name any file this one can read
+    except OSError:
+        raise IGVError('Unable to listen on port ' + str(args['serve']) + '.  Is another program already using it?')
+    listener.listen(16)
+    print ('Taking snapshot jobs on port ' + str(args['serve']) + ' with ' + genome + ' loaded.  Send them with:\n\tpython3 autoIGV.py -f targets.txt --send ' + str(args['serve']) + '\nPress control-C to stop.')
+    listener.settimeout(1)  #wakes up every second to see whether the daemon has lost all of its IGV instances
+    try:
+        while not daemon['stopped']:
+            try:
+                connection, address = listener.accept()
+            except socket.timeout:
+                continue
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            handler = threading.Thread(target = handlejobs, args = (connection, daemon, jobs))
+            handler.daemon = True
+            handler.start()
+    except KeyboardInterrupt:
+        pass
+    listener.close()
+    if args['metrics']:
+        print ('\nWriting command timings...', end = '')
+        writemetrics(metrics, directory, args['metrics'])
+        print ('OK', end = '')
+    if daemon['stopped']:
+        raise IGVError(daemon['stopped'] + '  ' + str(daemon['finished']) + ' jobs finished before that; their images are in ' + directory + '.')
+    print ('\n' + str(daemon['finished']) + ' jobs finished.  Images saved to ' + directory + '\nGoodbye.')
+    quit()
+
+def sendjob(lines, port, mode = None, nocollapse = None, host = 'localhost'):  #hands a list of lines in our own format to a daemon started with --serve and waits for it to take them.  mode and nocollapse default to whatever the daemon was started with.  Returns the path of every image taken
+    job = {'lines' : list(lines)}
+    if mode:
+        job['mode'] = mode
+    if nocollapse is not None:
+        job['nocollapse'] = nocollapse
+    try:
+        connection = socket.create_connection((host, port))
+    except OSError:
+        raise IGVError('Unable to reach an autoIGV daemon on port ' + str(port) + '.  Start one with --serve ' + str(port) + '.')
+    reader = connection.makefile('rb')
+    try:
+        connection.sendall(rawbytes(json.dumps(job) + '\n'))
+        answer = reader.readline()
+    except OSError:
+        answer = b''
+    reader.close()
+    connection.close()
+    if not answer:
+        raise IGVError('The autoIGV daemon on port ' + str(port) + ' hung up before finishing the job.')
+    result = json.loads(cookbytes(answer))
+    if 'error' in result:
+        raise IGVError(result['error'])
+    return result['images']
+
+def sendfile(args):  #client mode for --send: reads the target file (our own list, VCF, or BED) and has the daemon photograph it, then prints where each image went
+    lines = []
+    try:
+        adapter = inputadapter(args['file'], args['format'], args['samples'], args['bams'], args['contigs'])
+    except ValueError as error:
+        usage(str(error))
+        quit()
+    for linecount, line in readlist(args['file'], None, adapter):
+        fields = line.rstrip('\r\n').split('\t')
+        fields[1:] = [os.path.abspath(bam) if os.path.exists(bam) else bam for bam in fields[1:]]  #the daemon may not be running in the same directory
+        lines.append('\t'.join(fields))
+    print ('Sending ' + str(len(lines)) + ' lines to the daemon on port ' + str(args['send']) + '...', end = '', flush = True)
+    images = sendjob(lines, args['send'], args['mode'] or None, args['nocollapse'] or None)
+    print ('OK')
+    for image in images:
+        print (image)
+    quit()
+
+def leftoverworkerdirs(directory):  #finds any worker subdirectories a pool left behind in a run directory (such as when the run was interrupted before they were merged)
+    return [directory + '/' + name for name in sorted(os.listdir(directory)) if re.match(r'^worker\d+$', name) and os.path.isdir(directory + '/' + name)]
+
+def mergeworkerdirs(directory, workerdirs):  #moves the images from each worker's subdirectory up into the directory for the session and removes the (now empty) subdirectories
+    for workerdir in workerdirs:
+        for filename in os.listdir(workerdir):
+            if os.path.isdir(workerdir + '/' + filename):  #a subdirectory for one genome's images, which every worker has
+                os.makedirs(directory + '/' + filename, exist_ok = True)
+                mergeworkerdirs(directory + '/' + filename, [workerdir + '/' + filename])
+                continue
+            os.replace(workerdir + '/' + filename, directory + '/' + filename)  #same as with a single IGV instance, a later image with the same name replaces an earlier one
+        try:
+            os.rmdir(workerdir)
+        except OSError:  #something we did not put there is still in the directory, so we leave it for the user
+            print ('Unable to remove ' + workerdir + ' as it is not empty.')
+
+#The functions below let another Python program drive IGV through this one (import autoIGV), so that a pipeline can run job after job from one long-lived process instead of starting this program again for each.  They all take the session dictionary opensession hands back, raise IGVError if IGV cannot do what it is asked (instead of quitting), and never ask anything at the keyboard.  For example:
+#    session = autoIGV.opensession(genome = 'hg19', directory = '/data/images')
+#    images = autoIGV.photograph(session, ['1:1000000\t/data/sample1.bam\t/data/sample2.bam'])
+#    autoIGV.closesession(session)
+
+def opensession(host = 'localhost', port = 60151, genome = None, directory = None, policy = None, metrics = None):  #connects to IGV and sets its genome and snapshot directory (either can be left for later).  policy works as it does for the commandline program, except that a BAM file that will not load is skipped unless it says to stop.  Pass in newmetrics() to time every command.  Returns the session dictionary the other functions here take
+    if not policy:
+        policy = {'retries' : 0, 'igvcommand' : None, 'onerror' : 'skip'}
+    session = newsession(connect(host, port, metrics), (host, port), genome, directory, None, '', policy)
+    session['metrics'] = metrics
+    if genome:
+        setgenome(session, genome)
+    if directory:
+        setdirectory(session, directory)
+    return session
+
+def closesession(session):  #closes the connection to IGV (which may not be the one we started with if it had to be remade)
+    session['igv'].close()
+
+def sessioncheck(success, what):  #turns a command IGV said it could not do into an IGVError
+    if not success:
+        raise IGVError('IGV was unable to ' + what + '; see previous line for details.')
+
+def setgenome(session, genome):
+    sessioncheck(cmdgenome(genome, session['igv'], session.get('metrics')), 'use the genome ' + genome)
+    session['genome'] = genome  #remembered in case the connection has to be remade
+
+def setdirectory(session, directory):  #makes the directory if it is not there yet, and has IGV save its snapshots there
+    os.makedirs(directory, exist_ok = True)
+    sessioncheck(cmdsetimagedirectory(directory, session['igv'], session.get('metrics')), 'save snapshots to ' + directory)
+    session['directory'] = directory
+
+def clearview(session):  #removes every track, like File > New Session
+    sessioncheck(cmdnew(session['igv'], session.get('metrics')), 'start a new session')
+    session['tracks'] = []
+
+def loadbam(session, bam):
+    sessioncheck(cmdloadfile(bam, session['igv'], session.get('metrics')), 'load ' + bam)
+    if session['tracks'] is not None:
+        session['tracks'].append(bam)
+
+def gotolocus(session, locus):  #locus can be anything IGV's goto understands, with or without chr in front of a human chromosome
+    sessioncheck(cmdgotolocus(locus, session['igv'], session.get('metrics')), 'go to ' + locus)
+
+def collapsetracks(session):
+    sessioncheck(cmdcollapse(session['igv'], session.get('metrics')), 'collapse the tracks')
+
+def snapshot(session, filename):  #saves what IGV is showing to filename in the session's directory.  Returns the path of the image
+    sessioncheck(cmdsnapshot(filename, session['igv'], session.get('metrics')), 'save the snapshot ' + filename)
+    return os.path.join(session['directory'] or '', filename)
+
+def runbatch(session, scriptfile):  #has IGV run a batch script (such as one written with -c write), waiting for as long as it takes
+    sessioncheck(cmdbatch(scriptfile, session['igv'], session.get('metrics')), 'finish the batch script ' + scriptfile)
+
+def photograph(session, lines, mode = 3, nocollapse = False, reusetracks = False, badbams = None):  #takes the photos for a list of lines in our own format (a locus, then a tab and each bam file, separated by tabs) the same way the commandline program would in imaging mode 1, 2, or 3.  badbams can be a set kept from one call to the next so that files that would not load are not tried again.  Returns the path of every image IGV saved, leaving out any it could not take (such as for a line whose locus it could not go to)
+    if badbams is None:
+        badbams = set()
+    position = {'metrics' : session.get('metrics')}
+    session['taken'] = []
+    try:
+        for steps in compilechunks(enumerate(lines, 1), mode != 2, mode != 1, nocollapse, badbams, False, '', reusetracks):
+            supervise(steps, session['igv'], position, badbams, session['policy']['onerror'], '', session)
+    finally:
+        taken = session.pop('taken')
+    return [os.path.join(session['directory'] or '', filename) for filename in taken]
+
 def main():
     stackshot = False #initializing a variable for how the user wants photographs taken
     singleshot = False #initializing another variable for another way the user might want photographs taken (at least one of these will be set to true before we start imaging)
-    badbams = [] #initializes an empty list for storing bam files that didn't open successfully (we can skip even trying to open them again during the program to save time)
+    badbams = set() #initializes an empty set for storing bam files that didn't open successfully (we can skip even trying to open them again during the program to save time).  A set rather than a list, since we look in it for every file on every line
     print ('\nPLEASE SET YOUR SYSTEM NOT TO SLEEP IF THIS WILL BE A LONG RUN, AS SLEEP MODE WILL INTERRUPT IT.\nInitializing:')
-    import time  #this module lets us determine how long the run took (it is used only once at the very start and once at the very end of the program)
     starttime = time.time() #mark the start time
     args = checkargs() #get the list of loci and bam files from the commandline arguments, takes a user-specified directory as an optional argument (returned as False if none was given).  DOES NOT CHECK VALIDITY OF THE DIRECTORY, ONLY THE INPUT FILE.  Check the directory at time of creation.
-    locusfile = args[0]
-    directory = args[1]
-    prefsfile = args[2]
-    genome = args[3]
-    host = args[4]
-    port = args[5]
-    mode = args[6]
-    nocollapse = args[7]
+    if args['verifybatch']:  #just checking the results of an earlier batch script, so there is nothing else to set up
+        if verifybatch(args['verifybatch']):
+            quit('All planned images were found.')
+        quit('Some planned images are missing.')
+    if args['extract']:
+        extracted = extractimages(args['extract'][0], args['extract'][1], args['directory'])
+        for name in extracted:
+            print ('Extracted ' + name)
+        if not extracted:
+            quit('No images in the archive match ' + args['extract'][1] + '.')
+        quit()
+    if args['work']:  #a worker takes everything it needs from the queue
+        runworker(args)
+    if args['serve']:  #a daemon takes its targets from the jobs sent to it
+        rundaemon(args)
+    if args['send']:  #and --send is where they come from
+        sendfile(args)
+    locusfile = args['file']
+    directory = args['directory']
+    prefsfile = args['prefsfile']
+    genome = args['genome']
+    hosts = args['hosts']
+    ports = args['ports']
+    mode = args['mode']
+    nocollapse = args['nocollapse']
+    compilemode = args['compile']
+    loadonce = args['loadonce']
+    reusetracks = args['reusetracks']
+    groupbytracks = args['groupbytracks']
+    lookahead = args['lookahead']
+    resume = args['resume']
+    pipeline = args['pipeline']
+    checkthreads = args['checkthreads']
+    window = args['cluster']  #None unless we are clustering nearby loci
+    policy = {'retries' : args['retries'], 'igvcommand' : args['igvcommand'], 'onerror' : args['onerror']}  #how to handle problems without anyone watching
+    onerror = policy['onerror']
+    metrics = None
+    if args['metrics'] or args['live'] or policy['retries']:  #retries use the timings to decide how long to wait for IGV
+        metrics = newmetrics(args['live'])
+    merge = args['mergeclusters']
+    cachedirectory = args['cache']
+    done = set()  #snapshots an earlier run already finished, if we are resuming one
+    if resume:
+        print ('Reading the journal of the run in ' + resume + '...', end = '')
+        mergeworkerdirs(resume, leftoverworkerdirs(resume))  #a pool that was interrupted leaves its images in worker subdirectories
+        journalsettings, done = readjournal(resume)
+        if not locusfile:
+            if 'file' not in journalsettings:
+                usage('The run in ' + resume + ' has no journal to tell us which target file it used.  Please give it with -f.')
+                quit()
+            locusfile = journalsettings['file']
+        if not mode and 'mode' in journalsettings:  #take the photos the same way as last time unless told otherwise
+            mode = int(journalsettings['mode'])
+        print ('OK\n' + str(len(done)) + ' images already finished.')
+    try:
+        adapter = inputadapter(locusfile, args['format'], args['samples'], args['bams'], args['contigs'], args['genomecolumn'])  #how to read the target file if it is a VCF or BED file (or if we are checking its contigs)
+    except ValueError as error:
+        usage(str(error))
+        quit()
     print ('Loading preferences...', end = '')
     prefs = loadprefs(prefsfile)
     print('PREFERENCES LOADED')
-    if not host:
-        host = prefs[0]  #directs the socket to this system (I do not recommend setting this to run IGV on someone else's system unless you both know what you're doing.)
-    if not port:
-        port = int(prefs[1])  #sets the port number to use to the default port for IGV to accept remote commands.  Likely to be returned as a string, so need to convert here.
+    if not hosts:
+        hosts = prefs[0].split(',')  #directs the socket to this system (I do not recommend setting this to run IGV on someone else's system unless you both know what you're doing.)  Several comma-separated hosts make a pool.
+    if not ports:
+        ports = [int(port) for port in prefs[1].split(',')]  #sets the port number to use to the default port for IGV to accept remote commands.  Likely to be returned as a string, so need to convert here.  Several comma-separated ports make a pool.
     if not genome:
         genome = prefs[2]  #sets the genome to use.  If you are using a different genome (either version of human or a different species), you will need to change this
     defaultdirectory = prefs[3]  #sets the default directory for dumping the IGV image captures
-    igv = connect(host, port) #calls the subroutine to start a connection with IGV.  Will exit the program if connection is not successful
-    print ('Getting list of targets...', end = '')
-    locuslist = generatelist(locusfile)  #gets the file with the loci to image and which files to image from.  Lines should be formatted with the locus as the first item, then a tab, then a list of bam file paths separated by tabs
+    igvs = []  #one connection for each IGV instance we will be driving (usually just one)
+    try:
+        endpoints = endpointlist(hosts, ports)
+    except ValueError as error:
+        usage(str(error))
+        quit()
+    enqueue = args['enqueue']
+    plan = args['plan']
+    render = args['render']
+    if compilemode != 'write' and not enqueue and not plan and not render:  #a batch script we are only writing for later (or a queue for the workers, or a plan, or images we draw ourselves) does not need IGV to be running now
+        for host, port in endpoints:
+            igvs.append(connect(host, port, metrics)) #calls the subroutine to start a connection with IGV.  Will exit the program if connection is not successful
+    print ('Opening list of targets...', end = '')
+    position = {'metrics' : metrics}  #keeps track of how far through the list we are for progress reports (and how fast we are going, if we are timing things)
+    numberedlines = readlist(locusfile, position, adapter)  #gets a reader for the file with the loci to image and which files to image from.  Lines should be formatted with the locus as the first item, then a tab, then a list of bam file paths separated by tabs.  Nothing is actually read until it is needed
     print ('OK\nCreating directory for saving this session\'s images...', end = '')
-    if directory:  #if the user specified a directory, this will execute.  If they did not, directory would be false from the value taken from the checkargs function
+    if plan:  #nothing is made for a plan, but we still need to know where to look for timings from earlier runs
+        directory = resume or directory or defaultdirectory
+    elif resume:  #we already have a directory to carry on in
+        directory = resume
+    elif directory:  #if the user specified a directory, this will execute.  If they did not, directory would be false from the value taken from the checkargs function
         directory = createsavedir(directory) #either gets the working directory name (the user specified one plus the subdirectory that is made up of the date and time of the run), or false if it failed
         if not directory:  #if we could not use the specified directory
             print ('Failed to create user-specified directory.')
@@ -498,20 +4077,77 @@ def main():
         directory = createsavedir(defaultdirectory)   #subdir for saving will be named with the date and time.  files within will be named ??chr??????.bamfilename.png
     if not directory:  #if no directory was returned (if we can't create a directory using even the default name, we end)
         usage('Output directory already appears to exist or could not be created.')
-        igv.close()
-        quit()
-    print ('OK\nSetting the genome in IGV...', end = '')
-    if not cmdgenome(genome, igv):  #tells IGV which genome to use (and checks for errors in execution of this command).  A connection should already be established, so a failure here would either mean trying to load an unavailable genome or loss of connection to IGV.  Either one means the program should stop.
-        usage('Failed to communicate with IGV on "genome selection" command for line ' + linecount + '.')
-        igv.close()
-        quit()
-    print ('OK\nSetting the snapshot save directory on IGV...', end = '')    
-    if not cmdsetimagedirectory(directory, igv):  #sends the command to IGV to set the output directory for images to the appropriate one for this session
-        usage('Failed to communicate with IGV when setting the snapshot directory.')
-        igv.close()
+        for igv in igvs:
+            igv.close()
         quit()
-    print ('OK\nChecking the list of targets...', end = '')
-    if multibamlist(locuslist, badbams): #checks to see if any of the lines in the locus list have multiple valid bam files listed.  If so, runs the next block to find out how the user wants them photographed
+    print ('OK')
+    genomes = None  #with a genome column, the genomes the list uses (in the order they will be photographed) and the subdirectory for each one's images
+    if args['genomecolumn']:
+        adapter['genome'] = genome  #for the lines that leave their genome blank
+        print ('Finding the genomes in the list...', end = '')
+        order = listgenomes(locusfile, genome)
+        genomes = {'file' : locusfile, 'position' : position, 'adapter' : adapter, 'order' : order, 'folders' : {}}
+        for genomeid in order:
+            folder = genomefolder(genomeid)
+            while folder in genomes['folders'].values():  #two genomes whose files have the same name
+                folder += '_'
+            genomes['folders'][genomeid] = folder
+        print ('OK\n' + str(len(order)) + ' genome(s) in the list: ' + ', '.join(order))
+    workerdirs = [directory]  #with a single IGV instance, it saves straight into the directory for the session
+    if len(igvs) > 1:  #with a pool, each instance gets its own subdirectory so that they never trip over each other, and we merge them at the end
+        workerdirs = [directory + '/worker' + str(workernumber + 1) for workernumber in range(0, len(igvs))]
+        for workerdir in workerdirs:
+            os.makedirs(workerdir, exist_ok = True)  #exist_ok in case an interrupted run left it behind
+    if genomes and not plan:  #IGV will not make a directory to save a snapshot in, so every genome's subdirectory is made now
+        for workerdir in workerdirs:
+            for genomeid in genomes['order']:
+                os.makedirs(workerdir + '/' + genomes['folders'][genomeid], exist_ok = True)
+    for workernumber in range(0, len(igvs)):
+        igv = igvs[workernumber]
+        print ('Setting the genome in IGV...', end = '')
+        if not cmdgenome(genome, igv, metrics):  #tells IGV which genome to use (and checks for errors in execution of this command).  A connection should already be established, so a failure here would either mean trying to load an unavailable genome or loss of connection to IGV.  Either one means the program should stop.
+            usage('Failed to communicate with IGV on "genome selection" command.')
+            igv.close()
+            quit()
+        print ('OK\nSetting the snapshot save directory on IGV...', end = '')    
+        if not cmdsetimagedirectory(workerdirs[workernumber], igv, metrics):  #sends the command to IGV to set the output directory for images to the appropriate one for this session
+            usage('Failed to communicate with IGV when setting the snapshot directory.')
+            igv.close()
+            quit()
+        print ('OK')
+    cache = None
+    if cachedirectory and (os.path.isdir(cachedirectory) or not plan):  #images from earlier runs that can be used again instead of asking IGV for them
+        cache = opencache(cachedirectory, int(args['cachesize'] * 1000000000), genome)
+    stage = None
+    if args['stage'] and compilemode is None and not plan:  #a batch script is handed over all at once, so there is no run to stage ahead of
+        stage = openstage(args['stage'], args['flank'], args['stagethreads'], args['samtools'])
+    triage = None
+    if args['mindepth'] is not None or args['minalt'] > 0:  #photos with too few reads to be worth looking at are found by reading the BAM files ourselves
+        recordfile = directory + '/autoIGVtriage.txt'  #every decision is written down next to the images
+        if plan:
+            recordfile = None
+        triage = opentriage(args['mindepth'] or 0, args['minalt'], args['lowcoverage'], checkthreads, recordfile)
+    checked = None  #the results of checking every bam file up front, if we do
+    if checkthreads > 0:
+        print ('Checking BAM files and their indexes...', end = '')
+        checked = preflight(listbams(readlist(locusfile, None, adapter)), checkthreads)  #reading the list an extra time costs far less than looking at the same files over and over on a slow drive
+        print ('OK')
+        badbams.update(reportbams(checked))
+        if badbams and compilemode != 'write' and not plan and not keepgoing(onerror):  #ask once now (or go by the error policy), rather than in the middle of the run
+            for igv in igvs:
+                igv.close()
+            quit('OK. Goodbye.')
+    print ('Checking the list of targets...', end = '')
+    if lookahead > 0:
+        multi, checkedall, numberedlines = choosemode(numberedlines, badbams, lookahead, checked)  #checks to see if any of the first lines in the locus list have multiple valid bam files listed.  If so, runs the next block to find out how the user wants them photographed
+        if not multi and not checkedall:  #a line further down may still have several bam files
+            if mode:  #so go by the imaging mode we were given rather than photographing every file on its own
+                multi = True
+            else:
+                print ('\nWARNING: None of the first ' + str(lookahead) + ' lines have multiple BAM files, so every BAM file will be photographed on its own, including on any later lines that have several.  Use -m to set the imaging mode, or a larger --lookahead.', end = '')
+    else:  #with no lookahead at all, we have to go by the imaging mode we were given (or ask)
+        multi = True
+    if multi:
         if mode:
             photoprefs = str(mode)
             print("OK\nImaging mode " + photoprefs + " set in arguments.")
@@ -528,88 +4164,215 @@ def main():
     else: #if the multibamlist function returns false because each line only has a single valid bam file listed, this will set it to just shoot single bams at each locus (this will be done silently as far as the user goes)
         singleshot = True
         print ('OK\nInitialization complete.\nStarting the run:')
-    linecount = 0  #initializes a variable to count our line number (used for informing the user of progress)
-    for locus in locuslist:
-        linecount += 1  #increments the line counter
-        firstshot = False  #initialize the Firstshot value to false
-        if not locus: #if the line is blank, ignore it entirely 
-            continue
-        locusarray = clean(locus, badbams)
-        if not locusarray:  #if clean returned a value of false due to a problem with the line
-            print('Skipped line ' + str(linecount) + ' as it does not contain a valid locus.')
-            continue
-        if len(locusarray) == 1:
-            print('Skipped line ' + str(linecount) + ' (locus ' + locusarray[0] + ') as no valid BAM files were specified for it.')
-            continue
-        if not cmdgotolocus(locusarray[0], igv): #We can have this here because IGV will keep the previous locus after a "new" command.  If it stops doing this, we have to move this call inside the inner loop and use a "break" command instead of a "continue". This subroutine will return a value of True if it executes successfully and gets no error message from IGV
-                print ('Error loading going to locus ' + locusarray[0] + ' see previous line for details.  Skipping to next locus.')  #so if false is returned, it will display an error message and try the next locus
-                continue #moves on to the next locus by forcing the loop to iterate without doing anything more 
-        if stackshot and (multibam(locusarray, badbams) or not singleshot):  #if the user selected to get group photos of multiple bam files at each locus it will do this (if the user selected both multi and single image outputs and the line only had a single valid bam file, this will be skipped as both the multi and single shots would look the same)
-            print ('Processing locus ' + str(linecount) + ' of ' + str(len(locuslist)) + ' to take group photo.', end = ' \r')
-            if not cmdnew(igv):  #clear the IGV screen
-                usage('Failed to communicate with IGV on "new" command for line ' + linecount + '.')
-                igv.close()
-                quit()
-            for i in range(1, len(locusarray)):
-                if not locusarray[i]:  #if the element that should contain a bam file is just a blank 
-                    continue #skip everything and go on to the next
-                if locusarray[i] in badbams:  #note that this should not be engaged, as the clean function should keep a previously-known bad bamfile from even getting here
-                    print('Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') in group photo as it could not be opened previously.')
-                    continue
-                if not bamfile(locusarray[i]): #checks for a valid bamfile
-                    badbams.append(locusarray[i])
-                    print('Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') in group photo due to it being missing or not a valid BAM file.')
-                    if not yesanswer('Do you want to continue the run?'):
-                        quit('OK. Goodbye.')
-                    continue
-                if not cmdloadfile(locusarray[i], igv): #tells IGV to load the file
-                    print ('Error loading file ' + locusarray[i] + ' in group photo; see previous line for details.  Skipping to next file.')
-                    badbams.append(locusarray[i])
-                    if not yesanswer('Do you want to continue the run?'):
-                        quit('OK. Goodbye.')
-                    continue
-                if not firstshot and singleshot:
-                    if cmdsaveimage(locusarray[i], locusarray[0], igv, nocollapse):
-                        firstshot = True                       
-            if not cmdsaveimage('all', locusarray[0], igv, nocollapse):  #tells IGV to shoot the image
-                usage('Problem saving snapshot of ' + locusarray[0] + ' in ' + locusarray[i] + ' see previous line for details.\nPlease confirm that the directory /autoIGV/ exists and this script has access to write to it and create subdirectories.  Also try removing any non-word characters or whitespaces from your bam file name.')
-                igv.close()
-                quit()
-        if singleshot:        
-            for i in range(1, len(locusarray)):
-                print ('Processing locus ' + str(linecount) + ' of ' + str(len(locuslist)) + ' file number ' + str(i) + ' of ' + str(len(locusarray)-1) + '.', end = ' \r')
-                if not locusarray[i]:  #if the element that should contain a bam file is just a blank 
-                    continue #skip everything and go on to the next
-                if locusarray[i] in badbams:
-                    print('Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') for single photo as it could not be opened previously.')
-                    continue
-                if not bamfile(locusarray[i]):
-                    print('Skipped ' + locusarray[i] + ' on line ' + str(linecount) + ' (locus: ' + locusarray[0] + ') due to it being missing or not a valid BAM file.')
-                    badbams.append(locusarray[i])
-                    if not yesanswer('Do you want to continue the run?'):
-                        quit('OK. Goodbye.')
-                    continue
-                if firstshot:
-                    firstshot = False
-                    continue
-                if not cmdnew(igv):
-                    usage('Failed to communicate with IGV on "new" command for line ' + linecount + '.')
-                    igv.close()
-                    quit()
-                if not cmdloadfile(locusarray[i], igv):
-                    print ('Error loading file ' + locusarray[i] + ' see previous line for details.  Skipping to next file.')
-                    badbams.append(locusarray[i])
-                    if not yesanswer('Do you want to continue the run?'):
-                        quit('OK. Goodbye.')
-                    continue
-                if not cmdsaveimage(locusarray[i], locusarray[0], igv, nocollapse):
-                    usage('Problem saving snapshot of ' + locusarray[0] + ' in ' + locusarray[i] + ' see previous line for details.\nPlease confirm that the directory /autoIGV/ exists and this script has access to write to it and create subdirectories.')
-                    igv.close()
-                    quit()
-    print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds.\nClosing connection with IGV...', end = '')
-    igv.close()  #close the connection to IGV when done
+    modenumber = 2  #written down in the journal so that a resumed run takes the same photos
+    if stackshot and singleshot:
+        modenumber = 3
+    elif stackshot:
+        modenumber = 1
+    if plan:  #add up what the run would do, then stop before anything is sent or written
+        print ('Working out the plan for the run...', end = '')
+        planned = newplan()
+        setup = (('echo', 'genome', 'snapshotDirectory'), len(endpoints))  #each IGV instance is checked and set up before the run starts
+        if compilemode == 'write':  #a written batch script sets itself up once
+            setup = (('genome', 'snapshotDirectory'), 1)
+        for command in setup[0]:
+            planned['commands'][command] = setup[1]
+        if genomes:
+            genomes['plan'] = planned  #each genome's lines are counted as they are read
+        chunks = unfinishedchunks(compilerun(countlines(numberedlines, planned), genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge), done)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        planrun(plannedsteps(chunks, planned, cache), planned, genome)
+        if genomes and setup[1] > 1 and planned['commands'].get('genome', 0) > setup[1]:  #each IGV instance in a pool switches to every other genome itself
+            planned['commands']['genome'] += (planned['commands']['genome'] - setup[1]) * (setup[1] - 1)
+        print ('OK')
+        timings = readtimings(args['timings'] or findtimings([directory, resume]))
+        cachehits = 0
+        if cache:
+            cachehits = cache['hits']
+        reportplan(planned, timings, len(endpoints), len(done), cachehits, pipeline)
+        if triage:
+            reporttriage(triage)
+            print ('OK')
+        quit()
+    manifest = None
+    if window is not None:  #keeps track of which image each line ended up in, since clustered images are named for the whole cluster
+        manifest = openmanifest(directory)
+    if compilemode == 'write':  #write the whole run out as a batch script for igv.sh -b and stop there
+        scriptfile = directory + '/autoIGVbatch.txt'
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)
+        if cache:  #the script only needs to take what the cache does not have (the new images are not added to it, since IGV takes them after we are gone)
+            chunks = cachedchunks(chunks, cache, directory)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        steps = (step for chunk in chunks for step in chunk)  #a reader, so the script is written as the list is read
+        commands = writebatch(steps, scriptfile, genome, directory, True)
+        if manifest:
+            manifest['file'].close()
+        if triage:
+            reporttriage(triage)
+            print ('OK')
+        print ('Batch script with ' + str(commands) + ' commands written to ' + scriptfile + '\nRun it with:\n\tigv.sh -b ' + scriptfile + '\nand check the images afterwards with:\n\tpython3 autoIGV.py --verifybatch ' + scriptfile)
+        quit()
+    if enqueue:  #the coordinator's job ends once everything is in the queue
+        print ('Putting the run into the queue...', end = '')
+        chunks = compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        tasks = enqueuetasks(enqueue, chunks, {'genome' : genome, 'directory' : os.path.abspath(directory), 'file' : os.path.abspath(locusfile), 'mode' : modenumber})
+        if manifest:
+            manifest['file'].close()
+        print ('OK')
+        if triage:
+            reporttriage(triage)
+            print ('OK')
+        print (str(tasks) + ' tasks queued in ' + enqueue + '.  Start a worker on each machine with:\n\tpython3 autoIGV.py --work ' + os.path.abspath(enqueue))
+        quit()
+    journal = openjournal(directory, done, {'file' : os.path.abspath(locusfile), 'mode' : modenumber})  #everything finished from here on is written down so that the run can be resumed
+    sessions = []  #what each worker needs to remember about its IGV instance
+    for workernumber in range(0, len(igvs)):
+        subdirectory = ''
+        if len(igvs) > 1:
+            subdirectory = 'worker' + str(workernumber + 1) + '/'
+        sessions.append(newsession(igvs[workernumber], endpoints[workernumber], genome, workerdirs[workernumber], journal, subdirectory, policy, cache))
+    archive = None
+    if args['archive']:  #every image written down in the journal is handed to the packer from here on
+        archive = openarchive(directory, int(args['archive'] * 1000000))
+        journal['archive'] = archive
+    review = None
+    if args['review']:  #every image written down in the journal is handed to the reviewer from here on (and by it to the packer)
+        review = openreview(directory, args['reviewprocesses'], archive)
+        journal['review'] = review
+    if render:  #every image is drawn here, on a pool of processes, without IGV
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        failures = renderrun(chunks, directory, rendersettings(args['reference']), args['renderprocesses'], position, journal, genome)
+        closereview(review)
+        closearchive(archive)
+        if failures:
+            print ('\n' + '\n'.join(failures))
+            print ('Run completed with errors in ' + str(round(time.time() - starttime, 1)) + ' seconds.  ' + str(position['drawn']) + ' images drawn, and the ones listed above are missing...', end = '')
+        else:
+            print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds.  ' + str(position['drawn']) + ' images drawn...', end = '')
+    elif compilemode == 'submit':  #compile the run into batch scripts and have IGV run them without waiting on us between commands
+        print ('Compiling the run into batch scripts for ' + str(len(igvs)) + ' IGV instance(s).')
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)
+        if cache:
+            chunks = cachedchunks(chunks, cache, directory, journal)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        chunks = list(chunks)  #the whole run has to be compiled to share it out evenly
+        missing = runbatches(igvs, chunks, workerdirs, genome, directory, journal, metrics, cache)  #the workers close their own connections when they finish
+        closereview(review)  #the reviewer and the packer have to be done with the worker subdirectories before they are merged
+        closearchive(archive)
+        if len(igvs) > 1:
+            mergeworkerdirs(directory, workerdirs)
+        reportmissing(missing)
+        if missing:
+            print ('Run completed with errors in ' + str(round(time.time() - starttime, 1)) + ' seconds...', end = '')
+        else:
+            print ('Run completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds...', end = '')
+    elif pipeline > 0:  #one event loop drives every IGV instance, keeping several commands in flight on each
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)
+        if cache:
+            chunks = cachedchunks(chunks, cache, directory, journal)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        if stage:
+            chunks = stagedchunks(chunks, stage)
+        if len(igvs) > 1:
+            print ('Sharing the run between ' + str(len(igvs)) + ' IGV instances.')
+        failures = asyncio.run(asyncrunpool(sessions, chunks, position, badbams, pipeline))  #the workers close their own connections when they finish
+        closereview(review)
+        closearchive(archive)
+        if len(igvs) > 1:
+            print ('\nMerging images from each IGV instance...', end = '')
+            mergeworkerdirs(directory, workerdirs)
+        if failures:
+            print ('\n' + '\n'.join(failures))
+            print ('Run completed with errors in ' + str(round(time.time() - starttime, 1)) + ' seconds.  Lines listed above may be missing images...', end = '')
+        else:
+            print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds...', end = '')
+    elif len(igvs) == 1 and not loadonce and not groupbytracks and window is None and not stage and not triage and not genomes:  #the usual case, where we just walk through the list one line at a time
+        session = sessions[0]  #remembers what IGV has loaded from one line to the next, where to write down what is finished, and how to reconnect
+        for linecount, locus in numberedlines:  #reads one line at a time and photographs it before reading the next
+            imageline(locus, linecount, position, session['igv'], stackshot, singleshot, nocollapse, badbams, onerror, '', reusetracks, session, checked)
+        print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds.\nClosing connection with IGV...', end = '')
+        session['igv'].close()  #close the connection to IGV when done (which may not be the one we started with if it had to be remade)
+    elif len(igvs) == 1:  #with loadonce, groupbytracks, or clustering, the whole list has to be compiled before we start so that photos can be gathered together (and with staging or triage, so that we can work ahead, or with a genome column, so that each genome's lines are taken together)
+        session = sessions[0]
+        knownbad = len(badbams)  #anything the preflight check found has already been asked about
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)
+        if cache:
+            chunks = cachedchunks(chunks, cache, directory, journal)
+        chunks = list(chunks)
+        if len(badbams) > knownbad and not keepgoing(onerror):
+            quit('OK. Goodbye.')
+        total = len(chunks)
+        position['totalchunks'] = total  #now that we know how many there are, we can report progress by chunk
+        position['chunk'] = 0
+        if triage:  #reads are counted for the chunks coming up while the current one is being photographed
+            chunks = triagedchunks(chunks, triage)
+        if stage:  #slices are made for the chunks coming up while the current one is being photographed
+            chunks = stagedchunks(chunks, stage)
+        for steps in chunks:
+            position['chunk'] += 1
+            if triage:  #chunks triage left out altogether are not waited for, and the ones it put off come at the end
+                position['totalchunks'] = total - triage['dropped'] + triage['last']
+            supervise(steps, session['igv'], position, badbams, onerror, '', session)
+        print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds.\nClosing connection with IGV...', end = '')
+        session['igv'].close()  #close the connection to IGV when done
+    else:
+        print ('Sharing the run between ' + str(len(igvs)) + ' IGV instances.')
+        chunks = unfinishedchunks(compilerun(numberedlines, genomes, stackshot, singleshot, nocollapse, badbams, loadonce, '', reusetracks, groupbytracks, checked, window, merge, manifest), done)  #the list is compiled as the workers need more, and handed out a chunk at a time
+        if cache:
+            chunks = cachedchunks(chunks, cache, directory, journal)
+        if triage:
+            chunks = triagedchunks(chunks, triage)
+        if stage:
+            chunks = stagedchunks(chunks, stage)
+        failures = runpool(sessions, chunks, position, badbams)  #the workers close their own connections when they finish
+        closereview(review)
+        closearchive(archive)
+        print ('\nMerging images from each IGV instance...', end = '')
+        mergeworkerdirs(directory, workerdirs)
+        if failures:  #if any of the workers had to stop, the others picked up its remaining chunks, but the one it was on may be missing images
+            print ('\n' + '\n'.join(failures))
+            print ('Run completed with errors in ' + str(round(time.time() - starttime, 1)) + ' seconds.  Lines listed above may be missing images...', end = '')
+        else:
+            print ('\nRun completed successfully in ' + str(round(time.time() - starttime, 1)) + ' seconds...', end = '')
+    if triage:
+        print ('OK')
+        reporttriage(triage)
+    if stage:
+        print ('OK\n' + str(stage['made']) + ' BAM slices staged and ' + str(stage['reused']) + ' reused from before.\nTidying the staging directory...', end = '')
+        tidystage(stage, int(args['stagesize'] * 1000000000))
+    if review:
+        print ('OK\nFinishing the review...', end = '')
+        closereview(review)
+        if review['error']:
+            print ('\nThe review stopped early (' + review['error'] + ') after ' + str(review['reviewed']) + ' images...', end = '')
+        else:
+            print ('OK\n' + str(review['reviewed']) + ' images reviewed, with ' + str(review['sheets']) + ' contact sheet(s) made.  Start at ' + review['folder'] + '/index.html...', end = '')
+    if archive:
+        print ('OK\nFinishing the archive...', end = '')
+        closearchive(archive)
+        print ('OK\n' + str(archive['packed']) + ' images packed into ' + str(archive['shards']) + ' shard(s), ' + str(round(archive['saved'] / 1000000, 1)) + ' MB smaller after recompressing...', end = '')
+    journal['file'].close()
+    if manifest:
+        manifest['file'].close()
+    if cache:
+        print ('OK\n' + str(cache['hits']) + ' images taken from the cache and ' + str(cache['stored']) + ' added to it...', end = '')
+    if args['metrics']:
+        print ('OK\nWriting command timings...', end = '')
+        writemetrics(metrics, directory, args['metrics'])
     print ('OK\nImages saved to ' + directory + '\nGoodbye.')
     quit()
-            
-main()
+
+if __name__ == '__main__':  #only when run from the commandline, so that importing this file (see opensession) does not start a run
+    try:
+        main()
+    except IGVError as error:  #anything the run could not get past
+        quit(str(error))
 
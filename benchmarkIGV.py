@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+'''
+This program measures how fast autoIGV can drive IGV, without needing IGV or any BAM files.  It makes up a target list of whatever size
+you ask for (with empty stand-in BAM and index files), starts stand-in IGV instances from mockIGV.py, runs autoIGV.py on the list in
+each of the ways you ask for, and reports how many snapshots per second each one managed along with how much CPU time and memory autoIGV
+itself used.  Running it before and after a change to the scheduling or communication code will show whether the change made things
+faster or slower.
+Run it with:  python3 benchmarkIGV.py --lines 1k --lines 100k --workflow serial --workflow pipeline
+'''
+
+def workflows():  #the ways of running autoIGV that can be benchmarked, and the options each one adds to the commandline
+    return {'serial' : [],
+            'loadonce' : ['-l'],
+            'reusetracks' : ['-t'],
+            'groupbytracks' : ['--groupbytracks'],
+            'cluster' : ['--cluster', '1000'],
+            'pipeline' : ['--pipeline', '8'],
+            'batch' : ['-c', 'submit']}
+
+def checkargs():  #subroutine for validating commandline arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument ("--lines", help = "Number of lines in the made up target list, such as 1000, 10k, or 1m.  May be repeated to try several sizes (default 1k).", action = "append")
+    parser.add_argument ("--workflow", help = "Way of running autoIGV to benchmark, or all.  May be repeated (default serial).", action = "append", choices = list(workflows()) + ['all'])
+    parser.add_argument ("-m", "--mode", help = "Imaging mode to pass to autoIGV (default 3).", choices = ['1', '2', '3'], default = '3')
+    parser.add_argument ("--bams", help = "Number of different BAM files to spread across the list (default 20).", type = int, default = 20)
+    parser.add_argument ("--perline", help = "Largest number of BAM files on a line (default 3).", type = int, default = 3)
+    parser.add_argument ("--instances", help = "Number of stand-in IGV instances to run autoIGV against (default 1).", type = int, default = 1)
+    parser.add_argument ("--port", help = "First port for the stand-in IGV instances (default 60200, to stay out of the way of a real IGV).", type = int, default = 60200)
+    parser.add_argument ("--latency", help = "How long the stand-in IGV should take for a command, as command=seconds.  May be repeated.", action = "append", default = [])
+    parser.add_argument ("--discard", help = "Have the stand-in IGV skip writing placeholder images.", action = "store_true")
+    parser.add_argument ("--seed", help = "Seed for making up the target list (default 1), so that runs can be compared.", type = int, default = 1)
+    parser.add_argument ("--workdir", help = "Directory for the made up files and the images (default: a temporary directory, removed afterwards).")
+    parser.add_argument ("--json", help = "Also write the results to this file as JSON.")
+    args = parser.parse_args()
+    chosen = args.workflow or ['serial']
+    if 'all' in chosen:
+        chosen = list(workflows())
+    try:
+        sizes = [parsecount(size) for size in (args.lines or ['1k'])]
+    except ValueError:
+        quit('Error: --lines takes a number, optionally ending in k or m (such as 10k).')
+    if args.instances < 1 or args.bams < 1 or args.perline < 1:
+        quit('Error: --instances, --bams, and --perline must all be at least 1.')
+    return {'sizes' : sizes,
+            'workflows' : chosen,
+            'mode' : args.mode,
+            'bams' : args.bams,
+            'perline' : args.perline,
+            'ports' : [args.port + instance for instance in range(0, args.instances)],
+            'latency' : args.latency,
+            'discard' : args.discard,
+            'seed' : args.seed,
+            'workdir' : args.workdir,
+            'json' : args.json}
+
+def parsecount(text):  #reads a count like 1000, 10k, or 1m
+    text = text.strip().lower()
+    multiplier = 1
+    if text.endswith('k'):
+        multiplier = 1000
+        text = text[:-1]
+    elif text.endswith('m'):
+        multiplier = 1000000
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+def makebams(directory, count):  #makes empty stand-in BAM files, each with an index next to it so that autoIGV's checks pass.  The stand-in IGV never reads them.  Returns their paths
+    import os
+    os.makedirs(directory, exist_ok = True)
+    bams = []
+    for number in range(1, count + 1):
+        bam = os.path.join(directory, 'sample' + str(number).zfill(4) + '.bam')
+        for filename in (bam, bam + '.bai'):
+            open(filename, 'w').close()
+        bams.append(bam)
+    return bams
+
+def makelist(filename, lines, bams, perline, seed):  #writes a made up target list.  About half of the loci fall in a few hundred hotspots so that clustering has something to do, and the rest are spread across the genome
+    import random
+    chooser = random.Random(seed)
+    chromosomes = [str(number) for number in range(1, 23)] + ['X', 'Y']
+    hotspots = [(chooser.choice(chromosomes), chooser.randint(1000000, 100000000)) for hotspot in range(0, 300)]
+    output = open(filename, 'w')
+    for line in range(0, lines):
+        if chooser.random() < 0.5:
+            chromosome, position = chooser.choice(hotspots)
+            position += chooser.randint(0, 5000)
+        else:
+            chromosome = chooser.choice(chromosomes)
+            position = chooser.randint(1, 150000000)
+        onthisline = chooser.sample(bams, chooser.randint(1, min(perline, len(bams))))
+        output.write(chromosome + ':' + str(position) + '\t' + '\t'.join(onthisline) + '\n')
+    output.close()
+
+def makeprefs(filename, ports, directory):  #writes an autoIGV preferences file pointing at the stand-in IGV instances
+    output = open(filename, 'w')
+    output.write('Order: host, port number, genome, default directory\nlocalhost\n' + ','.join([str(port) for port in ports]) + '\nhg19\n' + directory)
+    output.close()
+
+def runautoigv(arguments, logfile):  #runs autoIGV.py with the arguments given and waits for it to finish.  Returns its exit code, how long it took, how much CPU time it used, and its peak memory in megabytes
+    import os
+    import subprocess
+    import sys
+    import time
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'autoIGV.py')
+    log = open(logfile, 'w')
+    started = time.time()
+    process = subprocess.Popen([sys.executable, script] + arguments, stdin = subprocess.DEVNULL, stdout = log, stderr = subprocess.STDOUT)
+    pid, status, usage = os.wait4(process.pid, 0)  #unlike wait, this tells us the resources used by this one run
+    elapsed = time.time() - started
+    process.returncode = os.waitstatus_to_exitcode(status)  #so that subprocess does not try to collect it again
+    log.close()
+    peak = usage.ru_maxrss / 1024  #reported in kilobytes on Linux
+    if sys.platform == 'darwin':  #and in bytes on a Mac
+        peak = peak / 1024
+    return (process.returncode, elapsed, usage.ru_utime + usage.ru_stime, peak)
+
+def benchmark(args):  #runs every workflow on every size of list and returns a list of results
+    import os
+    import mockIGV
+    settings = mockIGV.newsettings(mockIGV.parsepairs(args['latency'], 'latency'), discard = args['discard'])
+    listeners = mockIGV.startservers(args['ports'], settings)
+    bams = makebams(os.path.join(args['workdir'], 'bams'), args['bams'])
+    prefsfile = os.path.join(args['workdir'], 'benchmarkprefs.ini')
+    makeprefs(prefsfile, args['ports'], os.path.join(args['workdir'], 'images'))
+    results = []
+    runnumber = 0
+    for size in args['sizes']:
+        listfile = os.path.join(args['workdir'], 'targets' + str(size) + '.txt')
+        print ('Making a target list of ' + str(size) + ' lines...', end = '', flush = True)
+        makelist(listfile, size, bams, args['perline'], args['seed'])
+        print ('OK')
+        for workflow in args['workflows']:
+            runnumber += 1
+            rundir = os.path.join(args['workdir'], 'run' + str(runnumber))  #autoIGV names its image directory by the minute, so each run gets its own parent to avoid clashes
+            os.makedirs(rundir)
+            arguments = ['-f', listfile, '-d', rundir, '-p', prefsfile, '-m', args['mode'], '--lookahead', '0'] + workflows()[workflow]
+            print ('Running ' + workflow + ' on ' + str(size) + ' lines...', end = '', flush = True)
+            with settings['lock']:
+                before = settings['counts'].get('snapshot', 0)
+            exitcode, elapsed, cpu, peak = runautoigv(arguments, os.path.join(rundir, 'autoIGV.log'))
+            with settings['lock']:
+                snapshots = settings['counts'].get('snapshot', 0) - before
+            if exitcode:
+                print ('FAILED (exit code ' + str(exitcode) + ', see ' + os.path.join(rundir, 'autoIGV.log') + ', kept if --workdir was given)')
+            else:
+                print ('OK')
+            results.append({'workflow' : workflow,
+                            'lines' : size,
+                            'instances' : len(args['ports']),
+                            'snapshots' : snapshots,
+                            'seconds' : round(elapsed, 3),
+                            'snapshots_per_second' : round(snapshots / elapsed, 1) if elapsed else 0.0,
+                            'cpu_seconds' : round(cpu, 3),
+                            'cpu_ms_per_snapshot' : round(1000 * cpu / snapshots, 3) if snapshots else 0.0,
+                            'peak_mb' : round(peak, 1),
+                            'exit_code' : exitcode})
+    for listener in listeners:
+        listener.close()
+    return results
+
+def report(results):  #prints the results as a table
+    columns = [('workflow', 'workflow'), ('lines', 'lines'), ('snapshots', 'images'), ('seconds', 'seconds'), ('snapshots_per_second', 'images/s'), ('cpu_seconds', 'CPU s'), ('cpu_ms_per_snapshot', 'CPU ms/image'), ('peak_mb', 'peak MB')]
+    rows = [[heading for key, heading in columns]] + [[str(result[key]) for key, heading in columns] for result in results]
+    widths = [max([len(row[column]) for row in rows]) for column in range(0, len(columns))]
+    for row in rows:
+        print ('  '.join([row[column].rjust(widths[column]) for column in range(0, len(columns))]))
+
+def main():
+    import json
+    import shutil
+    import tempfile
+    args = checkargs()
+    temporary = not args['workdir']
+    if temporary:
+        args['workdir'] = tempfile.mkdtemp(prefix = 'autoIGVbenchmark')
+    try:
+        results = benchmark(args)
+    finally:
+        if temporary:
+            shutil.rmtree(args['workdir'], ignore_errors = True)
+    print ('')
+    report(results)
+    if args['json']:
+        output = open(args['json'], 'w')
+        json.dump(results, output, indent = 1)
+        output.close()
+    if [result for result in results if result['exit_code']]:
+        quit('Some runs failed.')
+
+if __name__ == '__main__':
+    main()
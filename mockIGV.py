@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+'''
+This program pretends to be IGV for testing and benchmarking autoIGV.  It listens on IGV's port (60151 unless told otherwise) and answers
+the same text commands IGV does (echo, genome, new, load, goto, collapse, snapshot, snapshotDirectory, remove, and batch), but instead of
+drawing anything it writes a tiny placeholder PNG for each snapshot.  Each kind of command can be made to take a set amount of time, and
+errors can be injected, so that autoIGV can be put through its paces without a real IGV or any real BAM files.
+Run it with:  python3 mockIGV.py -r 60151 --latency load=0.2 --latency snapshot=0.05
+'''
+
+def checkargs():  #subroutine for validating commandline arguments
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument ("-r", "--port", help = "Port to listen on (default 60151).  May be repeated to stand in for a pool of IGV instances.", action = "append", type = int)
+    parser.add_argument ("--latency", help = "How long a command should take, as command=seconds (such as load=0.2).  May be repeated.", action = "append", default = [])
+    parser.add_argument ("--jitter", help = "Vary each latency randomly by up to this fraction of itself (default 0).", type = float, default = 0.0)
+    parser.add_argument ("--errors", help = "How often a command should fail, as command=fraction (such as load=0.01).  May be repeated.", action = "append", default = [])
+    parser.add_argument ("--failpattern", help = "Fail every load of a file whose path contains this text.", action = "append", default = [])
+    parser.add_argument ("--discard", help = "Do not write placeholder images (snapshots are still counted).", action = "store_true")
+    parser.add_argument ("--seed", help = "Seed for the random numbers used for jitter and errors, so that a run can be repeated exactly.", type = int)
+    parser.add_argument ("-q", "--quiet", help = "Do not print each command received.", action = "store_true")
+    args = parser.parse_args()
+    return {'ports' : args.port or [60151],
+            'settings' : newsettings(parsepairs(args.latency, 'latency'), args.jitter, parsepairs(args.errors, 'errors'), args.failpattern, args.discard, args.seed, args.quiet)}
+
+def parsepairs(pairs, option):  #turns a list of command=number strings from the commandline into a dictionary
+    values = {}
+    for pair in pairs:
+        try:
+            command, value = pair.split('=', 1)
+            values[command.lower()] = float(value)
+        except ValueError:
+            quit('Error: --' + option + ' takes command=number (such as load=0.2), not ' + pair)
+    return values
+
+def newsettings(latency = None, jitter = 0.0, errors = None, failpatterns = None, discard = False, seed = None, quiet = True):  #puts together the dictionary that tells the servers how to behave.  Also used by the benchmark, which runs the servers in its own process
+    import random
+    import threading
+    return {'latency' : latency or {},  #command -> seconds
+            'jitter' : jitter,
+            'errors' : errors or {},  #command -> fraction of the time it fails
+            'failpatterns' : failpatterns or [],
+            'discard' : discard,
+            'random' : random.Random(seed),
+            'quiet' : quiet,
+            'lock' : threading.Lock(),  #for the random numbers and counts, which every connection shares
+            'counts' : {}}  #command -> how many times it was received
+
+def placeholderpng():  #makes the smallest sensible PNG (one white pixel), so that anything checking the images finds a real, complete PNG
+    import struct
+    import zlib
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)  #1x1 pixel, 8 bit RGB
+    pixels = zlib.compress(b'\x00\xff\xff\xff')  #one row: no filter, then one white pixel
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', pixels) + chunk(b'IEND', b'')
+
+def unquote(argument):  #IGV accepts arguments with or without double quotes around them
+    argument = argument.strip()
+    if len(argument) > 1 and argument[0] == '"' and argument[-1] == '"':
+        return argument[1:-1]
+    return argument
+
+def respond(line, state, settings):  #carries out one command and returns IGV's answer to it.  state is what this IGV instance is showing and where it saves its pictures
+    import os
+    import time
+    line = line.strip('\r\n')
+    command, argument = (line.split(' ', 1) + [''])[:2]
+    command = command.lower()
+    with settings['lock']:
+        settings['counts'][command] = settings['counts'].get(command, 0) + 1
+        delay = settings['latency'].get(command, 0.0)
+        if delay and settings['jitter']:
+            delay = max(0.0, delay * (1 + settings['jitter'] * settings['random'].uniform(-1, 1)))
+        failed = settings['random'].random() < settings['errors'].get(command, 0.0)
+    if not settings['quiet']:
+        print (line)
+    if delay:
+        time.sleep(delay)  #standing in for IGV doing the actual work
+    if failed:
+        return 'ERROR: Injected failure on ' + command
+    if command == 'echo':
+        return 'echo'
+    if command == 'genome' or command == 'goto' or command == 'collapse':
+        return 'OK'
+    if command == 'new':
+        state['tracks'] = []
+        return 'OK'
+    if command == 'load':
+        for pattern in settings['failpatterns']:
+            if pattern in argument:
+                return 'ERROR: Could not load ' + argument
+        state['tracks'].append(argument)
+        return 'OK'
+    if command == 'remove':
+        return 'OK'
+    if command == 'snapshotdirectory':
+        directory = unquote(argument)
+        if not os.path.isdir(directory):
+            return 'ERROR: directory ' + directory + ' does not exist'
+        state['directory'] = directory
+        return 'OK'
+    if command == 'snapshot':
+        if not settings['discard']:
+            output = open(os.path.join(state['directory'], unquote(argument)), 'wb')
+            output.write(state['png'])
+            output.close()
+        return 'OK'
+    if command == 'batch':
+        return runbatch(unquote(argument), state, settings)
+    return 'ERROR: Unrecognized command ' + command
+
+def runbatch(scriptfile, state, settings):  #runs each line of a batch script as if it had been sent on its own.  Like IGV, it carries on past errors and only answers once at the end
+    try:
+        script = open(scriptfile)
+    except OSError:
+        return 'ERROR: Could not read batch file ' + scriptfile
+    for line in script:
+        line = line.strip()
+        if not line or line.startswith('#') or line.lower() == 'exit':
+            continue
+        respond(line, state, settings)
+    script.close()
+    return 'OK'
+
+def handleconnection(connection, state, settings):  #answers commands on one connection, one line at a time, until the other end hangs up
+    reader = connection.makefile('rb')
+    try:
+        for rawline in reader:
+            response = respond(rawline.decode('utf-8'), state, settings)
+            connection.sendall(bytes(response + '\n', 'utf-8'))
+    except (ConnectionError, OSError):  #the other end went away in the middle of something
+        pass
+    reader.close()
+    connection.close()
+
+def serve(listener, state, settings):  #accepts connections for one IGV instance, each handled in its own thread, until the listening socket is closed
+    import socket
+    import threading
+    while True:
+        try:
+            connection, address = listener.accept()
+        except OSError:  #the listening socket was closed, so we are done
+            break
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  #answer right away, rather than waiting to bundle answers together
+        worker = threading.Thread(target = handleconnection, args = (connection, state, settings))
+        worker.daemon = True
+        worker.start()
+
+def startservers(ports, settings, host = 'localhost'):  #starts a stand-in IGV instance listening on each port, in the background.  Returns the listening sockets, which can be closed to stop them
+    import socket
+    import threading
+    listeners = []
+    for port in ports:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((host, port))
+        except OSError:
+            quit('Error: Unable to listen on port ' + str(port) + '.  Is IGV (or another copy of this program) already using it?')
+        listener.listen(16)
+        state = {'directory' : '.', 'tracks' : [], 'png' : placeholderpng()}  #each port is its own IGV instance, with its own snapshot directory
+        server = threading.Thread(target = serve, args = (listener, state, settings))
+        server.daemon = True
+        server.start()
+        listeners.append(listener)
+    return listeners
+
+def main():
+    import time
+    args = checkargs()
+    listeners = startservers(args['ports'], args['settings'])
+    print ('Standing in for IGV on port(s) ' + ', '.join([str(port) for port in args['ports']]) + '.  Press control-C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for listener in listeners:
+        listener.close()
+    print ('\nCommands received:')
+    for command in sorted(args['settings']['counts']):
+        print ('\t' + command + '\t' + str(args['settings']['counts'][command]))
+
+if __name__ == '__main__':  #so that the benchmark can use the servers without starting one from the commandline
+    main()
@@ -0,0 +1,111 @@
+'''
+Shared setup for the tests.  autoIGV.py, mockIGV.py, and benchmarkIGV.py live at the top of the repository rather than in a package, so
+the top of the repository is put on the path here for every test to import them from.  Run the tests from the top of the repository with:
+python3 -m pytest tests
+'''
+import os
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import mockIGV
+
+@pytest.fixture
+def mockigv():  #a stand-in IGV listening on a free port, for as long as the test runs.  Gives back its settings (so a test can add latency, errors, or fail patterns and look at the command counts) with the port added
+    settings = mockIGV.newsettings()
+    listeners = mockIGV.startservers([0], settings)  #port 0 lets the system pick one nobody is using
+    settings['port'] = listeners[0].getsockname()[1]
+    yield settings
+    for listener in listeners:
+        listener.close()
+
+@pytest.fixture
+def bams(tmp_path):  #empty stand-in BAM files (with indexes), which is all the stand-in IGV needs.  Call it with the names wanted
+    def make(*names):
+        paths = []
+        for name in names:
+            path = str(tmp_path / name)
+            for filename in (path, path + '.bai'):
+                open(filename, 'w').close()
+            paths.append(path)
+        return paths
+    return make
+
+@pytest.fixture
+def runautoigv(tmp_path):  #runs autoIGV.py as a program with the arguments given, against a stand-in IGV on port, saving under tmp_path/runs.  Gives back the finished process (with its output as text) and the run's own directory
+    import subprocess
+    def run(arguments, port = None, check = True):
+        prefsfile = tmp_path / 'prefs.ini'
+        prefsfile.write_text('Order: host, port number, genome, default directory\nlocalhost\n' + str(port or 60151) + '\nhg19\n' + str(tmp_path / 'default'))  #no newline at the end, or the preferences are taken to be broken
+        (tmp_path / 'runs').mkdir(exist_ok = True)
+        before = set(os.listdir(tmp_path / 'runs'))
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'autoIGV.py')
+        finished = subprocess.run([sys.executable, script, '-p', str(prefsfile), '-d', str(tmp_path / 'runs')] + arguments, stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True, timeout = 120)
+        if check:
+            assert finished.returncode == 0, finished.stdout
+        made = sorted(set(os.listdir(tmp_path / 'runs')) - before)
+        return (finished, str(tmp_path / 'runs' / made[-1]) if made else None)
+    return run
+
+def bgzfblock(data):  #one BGZF block (a gzip member with its size in the header), as BAM files are made of
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff' + struct.pack('<H', 6) + b'BC' + struct.pack('<HH', 2, len(compressed) + 25) + compressed + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+def readbin(start, end):  #the bin of the BAM index a read from start to end belongs in (reg2bin in the SAM specification)
+    end -= 1
+    for shift, offset in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+        if start >> shift == end >> shift:
+            return offset + (start >> shift)
+    return 0
+
+def writebam(path, contigs, reads, perblock = 7):  #writes a small BAM file and its .bai index.  contigs is a list of (name, length), and reads a list of (contig number, start counting from 0, CIGAR as [(operation, length)], sequence, flag) in order, with perblock reads in each compressed block
+    header = b'BAM\x01' + struct.pack('<ii', 0, len(contigs))
+    for name, length in contigs:
+        header += struct.pack('<i', len(name) + 1) + name.encode() + b'\x00' + struct.pack('<i', length)
+    output = bytearray(bgzfblock(header))
+    bins = [{} for contig in contigs]  #bin -> [(virtual start, virtual end)] for each contig
+    linear = [{} for contig in contigs]  #16 kb window -> virtual offset of the first read in it
+    for first in range(0, len(reads), perblock):
+        blockstart = len(output)
+        data = b''
+        for number, (contig, start, cigar, sequence, flag) in enumerate(reads[first:first + perblock]):
+            name = b'read' + str(first + number).encode() + b'\x00'
+            length = sum([size for operation, size in cigar if operation in 'MDN=X'])
+            packedcigar = b''.join([struct.pack('<I', size << 4 | 'MIDNSHP=X'.index(operation)) for operation, size in cigar])
+            packedsequence = bytearray()
+            for position in range(0, len(sequence), 2):
+                pair = sequence[position:position + 2] + '='
+                packedsequence.append('=ACMGRSVTWYHKDBN'.index(pair[0]) << 4 | '=ACMGRSVTWYHKDBN'.index(pair[1]))
+            record = struct.pack('<iiBBHHHiiii', contig, start, len(name), 60, readbin(start, start + length), len(cigar), flag, len(sequence), -1, -1, 0) + name + packedcigar + bytes(packedsequence) + b'\xff' * len(sequence)
+            recordstart = len(data)
+            data += struct.pack('<i', len(record)) + record
+            bins[contig].setdefault(readbin(start, start + length), []).append(((blockstart << 16) | recordstart, (blockstart << 16) | len(data)))
+            for window in range(start >> 14, ((start + length - 1) >> 14) + 1):
+                linear[contig].setdefault(window, (blockstart << 16) | recordstart)
+        output += bgzfblock(data)
+    output += bgzfblock(b'')  #the empty block that marks the end of the file
+    with open(path, 'wb') as bamfile:
+        bamfile.write(output)
+    index = b'BAI\x01' + struct.pack('<i', len(contigs))
+    for contig in range(0, len(contigs)):
+        index += struct.pack('<i', len(bins[contig]))
+        for number in bins[contig]:
+            index += struct.pack('<Ii', number, len(bins[contig][number])) + b''.join([struct.pack('<QQ', *chunk) for chunk in bins[contig][number]])
+        offsets = []
+        for window in range(0, max(linear[contig]) + 1 if linear[contig] else 0):
+            offsets.append(linear[contig].get(window, offsets[-1] if offsets else 0))
+        index += struct.pack('<i', len(offsets)) + b''.join([struct.pack('<Q', offset) for offset in offsets])
+    with open(path + '.bai', 'wb') as indexfile:
+        indexfile.write(index)
+    return path
+
+@pytest.fixture
+def makebam(tmp_path):  #real (if tiny) BAM files with indexes, for the code that reads them itself.  Call it with a file name, the contigs, and the reads (see writebam)
+    def make(name, contigs, reads, perblock = 7):
+        return writebam(str(tmp_path / name), contigs, reads, perblock)
+    return make
@@ -0,0 +1,56 @@
+import gzip
+
+import autoIGV
+
+vcf = '''##fileformat=VCFv4.2
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3
+1\t1000\t.\tA\tC\t50\tPASS\t.\tGT:DP\t0/1:20\t0/0:30\t1|1:5
+chr2\t2000\t.\tG\tT\t50\tPASS\t.\tGT\t./.\t0/0\t0/0
+X\t3000\t.\tT\tA\t50\tPASS\t.\tGT\t0/1\t0/1\t.
+'''
+
+def readall(path, adapter):
+    return [line for linecount, line in autoIGV.readlist(str(path), None, adapter)]
+
+def test_vcf_records_show_the_samples_that_carry_them(tmp_path):
+    samples = tmp_path / 'samples.txt'
+    samples.write_text('#name\tbam\nS1\t/data/s1.bam\nS3\t/data/s3.bam\n')
+    listfile = tmp_path / 'calls.vcf.gz'
+    with gzip.open(str(listfile), 'wt') as handle:
+        handle.write(vcf)
+    adapter = autoIGV.inputadapter(str(listfile), samplesfile = str(samples))
+    assert adapter['format'] == 'vcf'
+    assert readall(listfile, adapter) == ['1:1000\t/data/s1.bam\t/data/s3.bam', 'X:3000\t/data/s1.bam']  #nobody we have carries the second one
+
+def test_vcf_with_the_same_bams_everywhere(tmp_path):
+    listfile = tmp_path / 'calls.vcf'
+    listfile.write_text(vcf)
+    adapter = autoIGV.inputadapter(str(listfile), bams = ['/data/normal.bam'])
+    assert [line.split('\t')[1] for line in readall(listfile, adapter)] == ['/data/normal.bam'] * 3
+
+def test_vcfbams_without_genotypes_shows_every_sample():
+    fields = ['1', '100', '.', 'A', 'C', '.', '.', '.']
+    assert autoIGV.vcfbams(fields, ['S1', 'S2'], {'S1' : '/a.bam', 'S2' : '/b.bam'}) == ['/a.bam', '/b.bam']
+
+def test_bed_regions_become_loci(tmp_path):
+    listfile = tmp_path / 'targets.bed'
+    listfile.write_text('track name=targets\n# a comment\n1\t999\t1000\tsnv\n1\t999\t2000\n2\tnowhere\t5\n')
+    adapter = autoIGV.inputadapter(str(listfile), bams = ['/a.bam', '/b.bam'])
+    assert readall(listfile, adapter) == ['1:1000\t/a.bam\t/b.bam', '1:1000-2000\t/a.bam\t/b.bam', '2\tnowhere\t5\n']  #a bad line is passed along to be reported
+
+def test_contigs_the_genome_does_not_have_are_skipped(tmp_path, capsys):
+    fai = tmp_path / 'genome.fa.fai'
+    fai.write_text('chr1\t1000\t6\t60\t61\nchrX\t1000\t1100\t60\t61\n')
+    listfile = tmp_path / 'targets.txt'
+    listfile.write_text('1:100\t/a.bam\nGL000192.1:5\t/a.bam\nGL000192.1:6\t/a.bam\nchrX:5\t/a.bam\n')
+    adapter = autoIGV.inputadapter(str(listfile), contigsfiles = [str(fai)])
+    assert readall(listfile, adapter) == ['1:100\t/a.bam\n', 'chrX:5\t/a.bam\n']
+    assert capsys.readouterr().out.count('Skipping any targets on GL000192.1') == 1
+
+def test_readcontigs_reads_a_sequence_dictionary(tmp_path):
+    dictionary = tmp_path / 'genome.dict'
+    dictionary.write_text('@HD\tVN:1.6\n@SQ\tSN:chr1\tLN:1000\n@SQ\tSN:MT\tLN:16569\n')
+    assert autoIGV.readcontigs(str(dictionary)) == set(['1', 'MT'])
+
+def test_our_own_format_needs_no_adapter(tmp_path):
+    assert autoIGV.inputadapter(str(tmp_path / 'targets.txt')) is None
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import autoIGV
+
+def test_importing_does_not_start_a_run():
+    assert autoIGV.__name__ == 'autoIGV' and callable(autoIGV.main)  #getting this far at all means main was not run, since it would have quit
+
+def test_a_session_takes_photos(mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    session = autoIGV.opensession(port = mockigv['port'], genome = 'hg19', directory = str(tmp_path / 'shots'))
+    try:
+        images = autoIGV.photograph(session, ['1:1000\t' + one + '\t' + two], mode = 3)
+        autoIGV.gotolocus(session, '2:500')
+        images.append(autoIGV.snapshot(session, 'extra.png'))
+    finally:
+        autoIGV.closesession(session)
+    assert len(images) == 4  #a group photo and one for each file, then the one taken by hand
+    assert all([os.path.isfile(image) and os.path.dirname(image) == str(tmp_path / 'shots') for image in images])
+    assert mockigv['counts']['genome'] == 1 and mockigv['counts']['snapshotdirectory'] == 1
+
+def test_a_file_that_will_not_load_is_skipped(mockigv, bams, tmp_path):
+    good, broken = bams('good.bam', 'broken.bam')
+    mockigv['failpatterns'].append('broken')
+    session = autoIGV.opensession(port = mockigv['port'], directory = str(tmp_path / 'shots'))
+    badbams = set()
+    try:
+        images = autoIGV.photograph(session, ['1:1000\t' + good + '\t' + broken], mode = 2, badbams = badbams)
+        loads = mockigv['counts']['load']
+        autoIGV.photograph(session, ['1:2000\t' + broken], mode = 2, badbams = badbams)
+    finally:
+        autoIGV.closesession(session)
+    assert badbams == set([broken])
+    assert len(images) == 1 and os.path.isfile(images[0])
+    assert mockigv['counts']['load'] == loads  #not tried again once it was known to be bad
+
+def test_commands_igv_cannot_do_raise_instead_of_quitting(mockigv, bams, tmp_path):
+    broken, = bams('broken.bam')
+    mockigv['failpatterns'].append('broken')
+    session = autoIGV.opensession(port = mockigv['port'], directory = str(tmp_path / 'shots'), policy = {'retries' : 0, 'igvcommand' : None, 'onerror' : 'stop'})
+    try:
+        with pytest.raises(autoIGV.IGVError):
+            autoIGV.photograph(session, ['1:1000\t' + broken], mode = 2)
+        mockigv['errors']['goto'] = 1.0
+        with pytest.raises(autoIGV.IGVError):
+            autoIGV.gotolocus(session, '1:100')
+    finally:
+        autoIGV.closesession(session)
+
+def test_runbatch_waits_for_the_script(mockigv, tmp_path):
+    script = tmp_path / 'script.txt'
+    script.write_text('snapshotDirectory ' + str(tmp_path) + '\ngoto 1:100\nsnapshot batch.png\n')
+    session = autoIGV.opensession(port = mockigv['port'])
+    try:
+        autoIGV.runbatch(session, str(script))
+    finally:
+        autoIGV.closesession(session)
+    assert (tmp_path / 'batch.png').is_file()
+
+def test_only_images_that_were_taken_are_given_back(mockigv, bams, tmp_path):
+    good, broken = bams('good.bam', 'broken.bam')
+    mockigv['failpatterns'].append('broken')
+    session = autoIGV.opensession(port = mockigv['port'], directory = str(tmp_path / 'shots'))
+    try:
+        images = autoIGV.photograph(session, ['1:1000\t' + good + '\t' + broken], mode = 3)
+        mockigv['errors']['goto'] = 1.0
+        lost = autoIGV.photograph(session, ['1:2000\t' + good], mode = 3)
+    finally:
+        autoIGV.closesession(session)
+    assert sorted([os.path.basename(image) for image in images]) == ['1c1000all.png', '1c1000good.bam.png']  #nothing for the file that would not load
+    assert all([os.path.isfile(image) for image in images])
+    assert lost == []  #IGV could not go to the locus, so nothing was taken there
+
+def test_bad_arguments_raise_instead_of_quitting(tmp_path):
+    with pytest.raises(ValueError):
+        autoIGV.endpointlist(['a', 'b', 'c'], [1, 2])
+    with pytest.raises(ValueError):
+        autoIGV.inputadapter(str(tmp_path / 'targets.bed'))  #no BAM files to show in the regions
+    with pytest.raises(ValueError):
+        autoIGV.inputadapter(str(tmp_path / 'calls.vcf'), bams = ['/a.bam'], genomecolumn = True)
+
+def test_the_commandline_still_explains_bad_arguments(runautoigv, tmp_path):
+    targets = tmp_path / 'targets.bed'
+    targets.write_text('1\t99\t100\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2'], check = False)
+    assert 'Error: A BED file only lists regions' in finished.stdout
+    assert rundir is None
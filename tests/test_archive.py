@@ -0,0 +1,54 @@
+import os
+import struct
+import tarfile
+import zlib
+
+import autoIGV
+
+def png(width, height, seed):  #a small made up RGB PNG, compressed as lightly as possible so that there is room to squeeze it
+    rows = b''.join([b'\x00' + bytes([(seed * 31 + row * 7 + column) % 256 for column in range(0, width * 3)]) for row in range(0, height)])
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(rows, 0)) + chunk(b'IEND', b'')
+
+def pixels(data):
+    return zlib.decompress(data[8 + 25 + 8:-12 - 4])
+
+def test_recompressing_changes_nothing_in_the_picture():
+    original = png(40, 30, 1)
+    smaller = autoIGV.recompresspng(original)
+    assert len(smaller) < len(original)
+    assert pixels(smaller) == pixels(original)
+    assert autoIGV.recompresspng(b'not a png') == b'not a png'
+
+def test_images_with_the_same_name_in_different_folders_are_both_kept(tmp_path):
+    directory = str(tmp_path)
+    for folder, seed in (('hg19', 1), ('mm10', 2)):
+        os.makedirs(directory + '/' + folder)
+        open(directory + '/' + folder + '/1c1000a.bam.png', 'wb').write(png(10, 10, seed))
+    journal = autoIGV.openjournal(directory, set(), {})
+    archive = autoIGV.openarchive(directory, 1000000)
+    journal['archive'] = archive
+    autoIGV.recordsnapshot(journal, ('snapshot', 'hg19/1c1000a.bam.png', 1, '1:1000', 'a.bam'))
+    autoIGV.recordsnapshot(journal, ('snapshot', 'mm10/1c1000a.bam.png', 2, '1:1000', 'a.bam'))
+    autoIGV.closearchive(archive)
+    journal['file'].close()
+    assert sorted(autoIGV.readarchiveindex(directory)) == ['hg19/1c1000a.bam.png', 'mm10/1c1000a.bam.png']
+    assert not os.path.exists(directory + '/hg19/1c1000a.bam.png')
+    assert len(autoIGV.readjournal(directory)[1]) == 2  #packed images still count as finished
+    extracted = autoIGV.extractimages(directory, '1:1000', str(tmp_path / 'out'))
+    assert sorted(extracted) == ['hg19/1c1000a.bam.png', 'mm10/1c1000a.bam.png']
+    assert pixels(open(str(tmp_path / 'out' / 'mm10' / '1c1000a.bam.png'), 'rb').read()) == pixels(png(10, 10, 2))
+    shard = tarfile.open(directory + '/autoIGVarchive0001.tar')
+    assert sorted(shard.getnames()) == ['hg19/1c1000a.bam.png', 'mm10/1c1000a.bam.png']
+    shard.close()
+
+def test_cached_images_survive_being_archived(mockigv, bams, runautoigv, tmp_path):
+    good, other = bams('good.bam', 'other.bam')
+    listfile = tmp_path / 'list.txt'
+    listfile.write_text('1:1000\t' + good + '\t' + other + '\n2:2000\t' + good + '\n')
+    cachedirectory = str(tmp_path / 'cache')
+    finished, run = runautoigv(['-f', str(listfile), '-m', '3', '--archive', '5', '--cache', cachedirectory, '--checkthreads', '0'], mockigv['port'])
+    cached = [name for folder, subfolders, names in os.walk(cachedirectory) for name in names if name.endswith('.png')]
+    assert len(cached) == 4
+    assert len(autoIGV.readarchiveindex(run)) == 4
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import socket
+import threading
+
+import pytest
+
+import autoIGV
+
+def test_several_commands_in_flight_are_answered_in_order(mockigv):
+    async def run():
+        connection = await autoIGV.asyncopen(host = 'localhost', port = mockigv['port'])
+        futures = [autoIGV.asyncsend(connection, command) for command in ('echo', 'goto chr1:100', 'echo')]
+        await connection['writer'].drain()
+        answers = [await future for future in futures]
+        await autoIGV.asyncclose(connection)
+        return answers
+    assert asyncio.run(run()) == ['echo', 'OK', 'echo']
+    assert mockigv['counts']['echo'] == 3  #one more for opening the connection
+
+def test_commands_owed_an_answer_fail_when_igv_goes_away():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(('localhost', 0))
+    listener.listen(1)
+    def hangup():  #reads one command and hangs up without answering
+        connection, address = listener.accept()
+        connection.recv(100)
+        connection.close()
+    threading.Thread(target = hangup, daemon = True).start()
+    async def run():
+        connection = await autoIGV.asyncopen(socket.create_connection(listener.getsockname()))
+        with pytest.raises(autoIGV.IGVError):
+            await autoIGV.asynccommand(connection, 'goto chr1:100')
+        with pytest.raises(autoIGV.IGVError):  #and anything sent after that fails right away
+            await autoIGV.asyncresponse(autoIGV.asyncsend(connection, 'echo'))
+        await autoIGV.asyncclose(connection)
+    asyncio.run(run())
+    listener.close()
+
+def test_a_pipelined_run_takes_the_same_images(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text(''.join(['1:' + str(position) + '\t' + one + '\t' + two + '\n' for position in (1000, 2000, 3000)]))
+    finished, plain = runautoigv(['-f', str(targets), '-m', '3', '-d', str(tmp_path / 'plain')], port = mockigv['port'])
+    finished, pipelined = runautoigv(['-f', str(targets), '-m', '3', '--pipeline', '4', '-d', str(tmp_path / 'pipelined')], port = mockigv['port'])
+    images = sorted(os.listdir(str(tmp_path / 'plain' / os.listdir(str(tmp_path / 'plain'))[0])))
+    assert len([name for name in images if name.endswith('.png')]) == 9
+    assert sorted(os.listdir(str(tmp_path / 'pipelined' / os.listdir(str(tmp_path / 'pipelined'))[0]))) == images
@@ -0,0 +1,31 @@
+import os
+
+import autoIGV
+
+def test_batchtext():
+    assert autoIGV.batchtext(('goto', '1:1000', 1, '1:1000', None)) == 'goto chr1:1000'
+    assert autoIGV.batchtext(('snapshot', 'a b.png', 1, '1:1000', 'all')) == 'snapshot "a b.png"'
+    assert autoIGV.batchtext(('remove', '/data/s1.bam', 1, '1:1000', None)) == 'remove "s1.bam Coverage"\nremove "s1.bam"'
+    assert autoIGV.batchtext(('new', None, 1, '1:1000', None)) == 'new'
+
+def test_writebatch_then_verifybatch(tmp_path, capsys):
+    steps = [('new', None, 1, '1:1000', 's.bam'), ('load', '/data/s.bam', 1, '1:1000', 's.bam'), ('goto', '1:1000', 1, '1:1000', 's.bam'), ('snapshot', 'one.png', 1, '1:1000', 's.bam'), ('goto', '1:2000', 2, '1:2000', 's.bam'), ('snapshot', 'two.png', 2, '1:2000', 's.bam')]
+    scriptfile = str(tmp_path / 'batch.txt')
+    assert autoIGV.writebatch(iter(steps), scriptfile, 'hg19', str(tmp_path), True) == len(steps)
+    lines = open(scriptfile).read().splitlines()
+    assert lines[:2] == ['genome hg19', 'snapshotDirectory "' + str(tmp_path) + '"']
+    assert lines[-1] == 'exit'
+    (tmp_path / 'one.png').write_bytes(b'png')
+    (tmp_path / 'two.png').write_bytes(b'')  #IGV stopped partway through writing it
+    assert not autoIGV.verifybatch(scriptfile)
+    assert 'Missing image two.png' in capsys.readouterr().out
+    (tmp_path / 'two.png').write_bytes(b'png')
+    assert autoIGV.verifybatch(scriptfile)
+
+def test_a_submitted_run(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + one + '\t' + two + '\n2:2000\t' + one + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '3', '-c', 'submit'], port = mockigv['port'])
+    assert mockigv['counts']['batch'] == 1
+    assert sorted([name for name in os.listdir(rundir) if name.endswith('.png')]) == ['1c1000all.png', '1c1000one.bam.png', '1c1000two.bam.png', '2c2000one.bam.png']
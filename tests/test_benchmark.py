@@ -0,0 +1,44 @@
+import socket
+
+import pytest
+
+import benchmarkIGV
+import mockIGV
+
+def freeport():
+    probe = socket.socket()
+    probe.bind(('localhost', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+def test_parsecount():
+    assert benchmarkIGV.parsecount('1000') == 1000
+    assert benchmarkIGV.parsecount('10k') == 10000
+    assert benchmarkIGV.parsecount('1.5M') == 1500000
+    with pytest.raises(ValueError):
+        benchmarkIGV.parsecount('lots')
+
+def test_makelist_is_the_same_for_the_same_seed(tmp_path):
+    bams = benchmarkIGV.makebams(str(tmp_path / 'bams'), 5)
+    benchmarkIGV.makelist(str(tmp_path / 'a.txt'), 50, bams, 3, 7)
+    benchmarkIGV.makelist(str(tmp_path / 'b.txt'), 50, bams, 3, 7)
+    lines = (tmp_path / 'a.txt').read_text().splitlines()
+    assert lines == (tmp_path / 'b.txt').read_text().splitlines()
+    assert len(lines) == 50
+    assert all([1 <= len(line.split('\t')) - 1 <= 3 for line in lines])
+
+def test_the_mock_answers_like_igv():
+    settings = mockIGV.newsettings(failpatterns = ['broken'])
+    state = {'directory' : '.', 'tracks' : [], 'png' : mockIGV.placeholderpng()}
+    assert mockIGV.respond('echo', state, settings) == 'echo'
+    assert mockIGV.respond('load /data/broken.bam', state, settings) != 'OK'
+    assert mockIGV.respond('goto chr1:100', state, settings) == 'OK'
+    assert settings['counts'] == {'echo' : 1, 'load' : 1, 'goto' : 1}
+
+def test_a_small_benchmark(tmp_path):
+    args = {'sizes' : [30], 'workflows' : ['serial', 'pipeline'], 'mode' : '2', 'bams' : 4, 'perline' : 2, 'ports' : [freeport()], 'latency' : [], 'discard' : True, 'seed' : 1, 'workdir' : str(tmp_path), 'json' : None}
+    results = benchmarkIGV.benchmark(args)
+    assert [result['workflow'] for result in results] == ['serial', 'pipeline']
+    assert [result['exit_code'] for result in results] == [0, 0]
+    assert results[0]['snapshots'] == results[1]['snapshots'] > 0
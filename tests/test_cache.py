@@ -0,0 +1,61 @@
+import os
+import time
+
+import autoIGV
+import mockIGV
+
+def singlechunk(bam, locus, linecount = 1):
+    return [('new', None, linecount, locus, bam), ('load', bam, linecount, locus, bam), ('collapse', None, linecount, locus, bam), ('goto', locus, linecount, locus, bam), ('snapshot', str(linecount) + '.png', linecount, locus, bam)]
+
+def test_cachekey_changes_with_anything_that_changes_the_image(bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    cache = autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19')
+    key = autoIGV.cachekey(cache, '1:100', [one], True, 'single')
+    assert key == autoIGV.cachekey(cache, '1:100', [one], True, 'single')
+    others = [autoIGV.cachekey(cache, '1:101', [one], True, 'single'), autoIGV.cachekey(cache, '1:100', [two], True, 'single'), autoIGV.cachekey(cache, '1:100', [one], False, 'single'),
+              autoIGV.cachekey(cache, '1:100', [one], True, 'group'), autoIGV.cachekey(cache, '1:100', [one], True, 'single', 'mm10'), autoIGV.cachekey(cache, '1:100', [one, two], True, 'single')]
+    assert key not in others and len(set(others)) == len(others)
+    assert autoIGV.cachekey(cache, '1:100', [str(tmp_path / 'missing.bam')], True, 'single') is None
+
+def test_a_redone_bam_file_misses_the_cache(bams, tmp_path):
+    one, = bams('one.bam')
+    first = autoIGV.cachekey(autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19'), '1:100', [one], True, 'single')
+    open(one, 'w').write('redone')
+    assert autoIGV.cachekey(autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19'), '1:100', [one], True, 'single') != first
+
+def test_stored_images_are_found_next_time(bams, tmp_path):
+    one, = bams('one.bam')
+    run = tmp_path / 'run'
+    run.mkdir()
+    cache = autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19')
+    chunk = singlechunk(one, '1:100')
+    assert autoIGV.cachelookup(chunk, cache, str(run)) == chunk
+    (run / '1.png').write_bytes(mockIGV.placeholderpng())
+    autoIGV.storeimage(cache, str(run), '1.png')
+    assert cache['stored'] == 1
+    again = tmp_path / 'again'
+    again.mkdir()
+    cache = autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19')
+    assert list(autoIGV.cachedchunks([chunk], cache, str(again))) == []
+    assert (again / '1.png').read_bytes() == mockIGV.placeholderpng()
+    assert cache['hits'] == 1
+
+def test_images_after_a_failed_load_are_not_stored(bams, tmp_path):
+    one, = bams('one.bam')
+    cache = autoIGV.opencache(str(tmp_path / 'cache'), 10 ** 6, 'hg19')
+    autoIGV.cachelookup(singlechunk(one, '1:100'), cache, str(tmp_path))
+    (tmp_path / '1.png').write_bytes(mockIGV.placeholderpng())
+    autoIGV.storeimage(cache, str(tmp_path), '1.png', set([one]))
+    assert cache['stored'] == 0
+
+def test_the_least_recently_used_images_go_first(tmp_path):
+    cache = autoIGV.opencache(str(tmp_path / 'cache'), 250, 'hg19')
+    for number, name in enumerate(('aaold', 'bbnew', 'ccnewest')):
+        os.makedirs(str(tmp_path / 'cache' / name[:2]))
+        path = str(tmp_path / 'cache' / name[:2] / (name + '.png'))
+        open(path, 'wb').write(b'x' * 100)
+        os.utime(path, (time.time() - 100 + number, time.time() - 100 + number))
+    with cache['lock']:
+        autoIGV.evictcache(cache)
+    assert sorted([name for folder, subfolders, names in os.walk(str(tmp_path / 'cache')) for name in names]) == ['bbnew.png', 'ccnewest.png']
+    assert cache['size'] == 200
@@ -0,0 +1,30 @@
+import autoIGV
+
+def test_clusterloci_groups_nearby_loci():
+    loci = [(1, '1:1000'), (2, '2:1000'), (3, '1:1200'), (4, '1:5000'), (5, '1:1000')]
+    assert autoIGV.clusterloci(loci, 500) == [[(1, '1:1000'), (5, '1:1000'), (3, '1:1200')], [(4, '1:5000')], [(2, '2:1000')]]
+    assert autoIGV.clusterloci(loci) == [[(1, '1:1000'), (5, '1:1000')], [(3, '1:1200')], [(4, '1:5000')], [(2, '2:1000')]]  #with no window, only the same locus
+
+def test_compilecluster_shows_every_locus(tmp_path):
+    manifest = autoIGV.openmanifest(str(tmp_path))
+    steps = autoIGV.compilecluster([(1, '1:1000'), (3, '1:1200')], ['/a.bam', '/b.bam'], True, False, False, manifest)
+    manifest['file'].close()
+    assert steps[0][:2] == ('goto', '1:1000 1:1200')
+    assert [step[1] for step in steps if step[0] == 'load'] == ['/a.bam', '/b.bam']
+    rows = (tmp_path / 'autoIGVmanifest.txt').read_text().splitlines()
+    assert rows == ['#line\tlocus\tbam\timage\tpanel', '1\t1:1000\tall\t' + steps[-1][1] + '\t1', '3\t1:1200\tall\t' + steps[-1][1] + '\t2']
+
+def test_merged_clusters_are_one_region():
+    view, region = autoIGV.clusterview([(1, '1:1000'), (2, '1:1200')], True)
+    assert region == '1:1000-1200' and view == '1:980-1220'
+
+def test_a_resumed_manifest_keeps_what_was_there(tmp_path):
+    manifest = autoIGV.openmanifest(str(tmp_path))
+    autoIGV.compilecluster([(1, '1:1000')], ['/a.bam'], True, False, False, manifest)
+    manifest['file'].close()
+    manifest = autoIGV.openmanifest(str(tmp_path))  #as --resume does, compiling the whole list again
+    autoIGV.compilecluster([(1, '1:1000')], ['/a.bam'], True, False, False, manifest)
+    autoIGV.compilecluster([(2, '2:1000')], ['/a.bam'], True, False, False, manifest)
+    manifest['file'].close()
+    rows = (tmp_path / 'autoIGVmanifest.txt').read_text().splitlines()
+    assert [row.split('\t')[0] for row in rows] == ['#line', '1', '2']
@@ -0,0 +1,65 @@
+import json
+import queue
+import socket
+import threading
+
+import autoIGV
+
+def newdaemon(directory, workers = 1):  #what rundaemon sets up, without the listener
+    return {'directory' : str(directory), 'genome' : 'hg19', 'mode' : 2, 'nocollapse' : False, 'reusetracks' : False, 'lock' : threading.Lock(), 'jobs' : 0, 'finished' : 0, 'workers' : workers, 'stopped' : None}
+
+def test_lines_must_be_a_list(tmp_path):
+    daemon = newdaemon(tmp_path)
+    jobs = queue.Queue()
+    answer = autoIGV.jobrequest(json.dumps({'lines' : '1:100\t/x.bam'}), daemon, jobs)
+    assert 'error' in answer
+    assert jobs.empty()
+
+def test_status(tmp_path):
+    answer = autoIGV.jobrequest('{"status": true}', newdaemon(tmp_path), queue.Queue())
+    assert answer['finished'] == 0 and answer['waiting'] == 0
+
+def test_a_failed_job_reconnects_without_retries(mockigv, bams, tmp_path):
+    good, = bams('good.bam')
+    daemon = newdaemon(tmp_path / 'daemon')
+    session = autoIGV.opensession('localhost', mockigv['port'], 'hg19', daemon['directory'], {'retries' : 0, 'igvcommand' : None, 'onerror' : 'skip'})
+    jobs = queue.Queue()
+    worker = threading.Thread(target = autoIGV.jobworker, args = (session, '', jobs, daemon))
+    worker.daemon = True
+    worker.start()
+    session['igv'].shutdown(socket.SHUT_RDWR)  #IGV went away between jobs
+    failed = autoIGV.jobrequest(json.dumps({'lines' : ['1:1000\t' + good]}), daemon, jobs)
+    assert 'error' in failed
+    answer = autoIGV.jobrequest(json.dumps({'lines' : ['1:1000\t' + good]}), daemon, jobs)
+    assert [image.rsplit('/', 1)[-1] for image in answer['images']] == ['1c1000good.bam.png']
+    assert mockigv['counts']['echo'] == 2
+    assert daemon['finished'] == 2
+
+def test_losing_the_last_instance_stops_the_daemon(tmp_path):
+    daemon = newdaemon(tmp_path, workers = 2)
+    jobs = queue.Queue()
+    waiting = {'lines' : ['1:1000\t/x.bam'], 'mode' : 2, 'nocollapse' : False, 'done' : threading.Event(), 'result' : None}
+    jobs.put(waiting)
+    session = {'endpoint' : ('localhost', 60151)}
+    autoIGV.dropworker(session, '', jobs, daemon)
+    assert not daemon['stopped'] and not waiting['done'].is_set()  #one instance is still taking jobs
+    autoIGV.dropworker(session, '', jobs, daemon)
+    assert daemon['stopped']
+    assert waiting['done'].is_set() and waiting['result'] == {'error' : daemon['stopped']}
+    assert autoIGV.jobrequest(json.dumps({'lines' : ['1:1000\t/x.bam']}), daemon, jobs) == {'error' : daemon['stopped']}
+
+def test_a_job_that_breaks_does_not_end_the_worker(mockigv, bams, tmp_path):
+    good, = bams('good.bam')
+    daemon = newdaemon(tmp_path / 'daemon')
+    session = autoIGV.opensession('localhost', mockigv['port'], 'hg19', daemon['directory'])
+    jobs = queue.Queue()
+    worker = threading.Thread(target = autoIGV.jobworker, args = (session, '', jobs, daemon))
+    worker.daemon = True
+    worker.start()
+    broken = {'lines' : None, 'mode' : 2, 'nocollapse' : False, 'done' : threading.Event(), 'result' : None}  #a payload jobrequest would never make
+    jobs.put(broken)
+    assert broken['done'].wait(10)
+    assert broken['result']['error'].startswith('TypeError')
+    answer = autoIGV.jobrequest(json.dumps({'lines' : ['1:1000\t' + good]}), daemon, jobs)
+    assert len(answer['images']) == 1
+    assert worker.is_alive() and daemon['finished'] == 2
@@ -0,0 +1,49 @@
+import os
+
+import autoIGV
+
+def test_vcf_and_bed_files_read_without_a_contig_list(tmp_path):  #the genome column's contig lookup once left VCF and BED lines with no contigs to check against at all
+    bed = tmp_path / 'targets.bed'
+    bed.write_text('1\t99\t100\n')
+    adapter = autoIGV.inputadapter(str(bed), bams = ['/a.bam'])
+    assert autoIGV.adaptline('1\t99\t100\n', adapter, {}) == '1:100\t/a.bam'
+
+def test_linegenome():
+    assert autoIGV.linegenome('mm10\t1:100\t/a.bam\n', 'hg19') == 'mm10'
+    assert autoIGV.linegenome('\t1:100\t/a.bam\n', 'hg19') == 'hg19'  #left blank for the run's own
+    assert autoIGV.linegenome('# a comment\n', 'hg19') is None
+    assert autoIGV.linegenome('\n', 'hg19') is None
+
+def test_listgenomes_puts_the_runs_own_genome_first(tmp_path):
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('mm10\t1:100\t/a.bam\n# a comment\ndm6\t2L:5\t/b.bam\n\t1:200\t/a.bam\nmm10\t2:300\t/a.bam\n')
+    assert autoIGV.listgenomes(str(targets), 'hg19') == ['hg19', 'mm10', 'dm6']
+    assert autoIGV.listgenomes(str(targets), 'hg38') == ['hg38', 'mm10', 'dm6']
+    targets.write_text('mm10\t1:100\t/a.bam\n')
+    assert autoIGV.listgenomes(str(targets), 'hg19') == ['mm10']  #not put in at all when nothing uses it
+
+def test_genomefolder():
+    assert autoIGV.genomefolder('hg19') == 'hg19'
+    assert autoIGV.genomefolder('/refs/mouse.fa.gz') == 'mouse'
+    assert autoIGV.genomefolder('C:\\refs\\fly.genome') == 'fly'
+    assert autoIGV.genomefolder('/refs/.json') == 'genome'
+
+def test_compilegenomes_takes_one_genome_at_a_time(bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('mm10\t1:100\t' + one + '\n\t1:200\t' + two + '\nmm10\t2:300\t' + two + '\n')
+    adapter = autoIGV.inputadapter(str(targets), genomecolumn = True)
+    adapter['genome'] = 'hg19'
+    genomes = {'file' : str(targets), 'position' : None, 'adapter' : adapter, 'order' : autoIGV.listgenomes(str(targets), 'hg19'), 'folders' : {'hg19' : 'hg19', 'mm10' : 'mm10'}}
+    chunks = list(autoIGV.compilerun(None, genomes, False, True, False, set()))
+    assert [(steps[0][1], steps[1][2]) for steps in chunks] == [('hg19', 2), ('mm10', 1), ('mm10', 3)]  #each chunk starts by setting its genome
+    snapshots = [argument for steps in chunks for command, argument, linecount, locus, bam in steps if command == 'snapshot']
+    assert [snapshot.split('/')[0] for snapshot in snapshots] == ['hg19', 'mm10', 'mm10']
+
+def test_a_run_with_a_genome_column(runautoigv, mockigv, bams, tmp_path):
+    one, = bams('one.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('mm10\t1:100\t' + one + '\n\t1:200\t' + one + '\nmm10\t2:300\t' + one + '\n\t1:400\t' + one + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2', '--genomecolumn'], port = mockigv['port'])
+    assert mockigv['counts']['genome'] == 2  #hg19 to start with, then mm10 once, rather than switching back and forth
+    assert len(os.listdir(rundir + '/hg19')) == 2 and len(os.listdir(rundir + '/mm10')) == 2
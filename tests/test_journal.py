@@ -0,0 +1,38 @@
+import os
+
+import autoIGV
+import mockIGV
+
+def test_the_journal_remembers_finished_images(tmp_path):
+    directory = str(tmp_path)
+    journal = autoIGV.openjournal(directory, set(), {'file' : '/data/targets.txt', 'mode' : 3})
+    group = ('snapshot', 'group.png', 1, '1:1000', 'all')
+    single = ('snapshot', 'single.png', 1, '1:1000', '/data/a.bam')
+    lost = ('snapshot', 'lost.png', 2, '1:2000', '/data/a.bam')
+    for step in (group, single, lost):
+        autoIGV.recordsnapshot(journal, step)
+    journal['file'].write('3\t1:3000\t/data/a.bam')  #cut off as the run died
+    journal['file'].close()
+    (tmp_path / 'group.png').write_bytes(mockIGV.placeholderpng())
+    (tmp_path / 'single.png').write_bytes(mockIGV.placeholderpng())
+    (tmp_path / 'lost.png').write_bytes(b'')  #left empty by a crash
+    settings, done = autoIGV.readjournal(directory)
+    assert settings == {'file' : '/data/targets.txt', 'mode' : '3'}
+    assert done == set([autoIGV.journalkey(group), autoIGV.journalkey(single)])
+    assert autoIGV.journalkey(group)[3] == 'group' and autoIGV.journalkey(single)[3] == 'single'
+
+def test_a_new_journal_in_the_same_directory_keeps_its_settings(tmp_path):
+    autoIGV.openjournal(str(tmp_path), set(), {'mode' : 2})['file'].close()
+    autoIGV.openjournal(str(tmp_path), set(), {'mode' : 3})['file'].close()  #as --resume opens it again
+    assert autoIGV.readjournal(str(tmp_path))[0] == {'mode' : '2'}
+
+def test_resuming_retakes_only_what_is_missing(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + one + '\n1:2000\t' + two + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2'], port = mockigv['port'])
+    assert mockigv['counts']['snapshot'] == 2
+    os.remove(os.path.join(rundir, '1c2000two.bam.png'))
+    runautoigv(['--resume', rundir], port = mockigv['port'])
+    assert mockigv['counts']['snapshot'] == 3
+    assert os.path.isfile(os.path.join(rundir, '1c2000two.bam.png'))
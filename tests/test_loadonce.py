@@ -0,0 +1,27 @@
+import os
+
+import autoIGV
+
+def test_each_bam_is_loaded_once_in_locus_order():
+    singles = [(1, '2:500', '/a.bam'), (2, '1:900', '/b.bam'), (3, '1:100', '/a.bam'), (4, '1:100', '/a.bam'), (5, '10:5', '/a.bam')]
+    chunks = autoIGV.compilesingles(singles, False)
+    assert len(chunks) == 2
+    first = chunks[0]
+    assert [step[0] for step in first[:3]] == ['new', 'load', 'collapse']
+    assert [step[1] for step in first if step[0] == 'load'] == ['/a.bam']
+    assert [step[1] for step in first if step[0] == 'goto'] == ['1:100', '2:500', '10:5']  #chromosome order, and the same locus only once
+    assert [step[2] for step in first if step[0] == 'snapshot'] == [3, 1, 5]
+    assert [step[1] for step in chunks[1] if step[0] == 'load'] == ['/b.bam']
+
+def test_nocollapse_leaves_out_collapse():
+    chunks = autoIGV.compilesingles([(1, '1:100', '/a.bam')], True)
+    assert 'collapse' not in [step[0] for step in chunks[0]]
+
+def test_a_loadonce_run(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text(''.join(['1:' + str(position) + '\t' + one + '\t' + two + '\n' for position in (3000, 1000, 2000)]))
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2', '-l'], port = mockigv['port'])
+    assert mockigv['counts']['load'] == 2
+    assert mockigv['counts']['snapshot'] == 6
+    assert len([name for name in os.listdir(rundir) if name.endswith('.png')]) == 6
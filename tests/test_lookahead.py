@@ -0,0 +1,43 @@
+import gzip
+
+import autoIGV
+
+def test_readlist_numbers_every_line(tmp_path):
+    listfile = tmp_path / 'targets.txt.gz'
+    with gzip.open(str(listfile), 'wt') as handle:
+        handle.write('1:100\t/a.bam\n\n2:200\t/b.bam\n')
+    position = {}
+    lines = autoIGV.readlist(str(listfile), position)
+    assert next(lines) == (1, '1:100\t/a.bam\n')
+    assert list(lines) == [(2, '\n'), (3, '2:200\t/b.bam\n')]
+    assert position['bytesread'] == position['totalbytes']
+
+def test_choosemode_gives_back_every_line(bams):
+    one, two = bams('one.bam', 'two.bam')
+    lines = [(1, '1:100\t' + one), (2, '1:200\t' + one), (3, '1:300\t' + one + '\t' + two)]
+    multi, checkedall, again = autoIGV.choosemode(iter(lines), set(), 2)
+    assert not multi and not checkedall
+    assert list(again) == lines
+    multi, checkedall, again = autoIGV.choosemode(iter(lines), set(), 10)
+    assert multi and checkedall
+
+def test_negative_lookahead_is_refused(runautoigv, bams):
+    one, = bams('one.bam')
+    finished, rundir = runautoigv(['-f', one, '--lookahead', '-1'], check = False)
+    assert 'The lookahead must be zero or more lines.' in finished.stdout
+    assert rundir is None
+
+def test_a_group_line_past_the_lookahead_is_warned_about(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:100\t' + one + '\n1:200\t' + one + '\n1:300\t' + one + '\t' + two + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '--lookahead', '2'], port = mockigv['port'])
+    assert 'WARNING: None of the first 2 lines have multiple BAM files' in finished.stdout
+
+def test_the_given_mode_is_used_past_the_lookahead(runautoigv, mockigv, bams, tmp_path):
+    one, two = bams('one.bam', 'two.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:100\t' + one + '\n1:200\t' + one + '\n1:300\t' + one + '\t' + two + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '--lookahead', '2', '-m', '1'], port = mockigv['port'])
+    assert 'WARNING' not in finished.stdout
+    assert 'Imaging mode 1 set in arguments.' in finished.stdout
@@ -0,0 +1,49 @@
+import json
+import time
+
+import autoIGV
+
+def recorded():  #metrics with a few commands already timed
+    metrics = autoIGV.newmetrics()
+    now = time.time()
+    autoIGV.recordtime(metrics, 'goto', now - 0.002)
+    autoIGV.recordtime(metrics, 'goto', now - 0.3)
+    autoIGV.recordtime(metrics, 'load', now - 1.5, '/data/"odd" name.bam')
+    autoIGV.recordtime(metrics, 'snapshot', now - 0.04)
+    return metrics
+
+def test_recordtime_adds_up_each_command():
+    metrics = recorded()
+    assert metrics['commands']['goto']['count'] == 2
+    assert 0.3 <= metrics['commands']['goto']['max'] < 1
+    assert sum(metrics['commands']['goto']['buckets']) == 2
+    assert metrics['loads']['/data/"odd" name.bam']['count'] == 1
+    assert metrics['snapshots'] == 1
+    autoIGV.recordtime(None, 'goto', time.time())  #nothing to do when we are not keeping track
+
+def test_json_metrics_read_back(tmp_path):
+    filename = autoIGV.writemetrics(recorded(), str(tmp_path), 'json')
+    summary = json.load(open(filename))
+    assert summary['commands']['goto']['buckets']['+Inf'] == 2
+    assert summary['commands']['goto']['buckets']['0.005'] == 1
+    timings = autoIGV.readtimings([str(tmp_path)])
+    assert timings['commands']['goto'][0] == 2
+    assert timings['loads']['/data/"odd" name.bam'][0] == 1
+
+def test_prometheus_metrics_read_back(tmp_path):
+    filename = autoIGV.writemetrics(recorded(), str(tmp_path), 'prometheus')
+    text = open(filename).read()
+    assert 'autoigv_command_seconds_bucket{command="goto",le="+Inf"} 2' in text
+    assert 'autoigv_snapshots_total 1' in text
+    timings = autoIGV.readtimings([filename])
+    assert timings['commands']['goto'][0] == 2
+    assert abs(timings['loads']['/data/"odd" name.bam'][1] - 1.5) < 0.1  #the escaped name comes back as it was
+
+def test_a_run_writes_its_metrics(runautoigv, mockigv, bams, tmp_path):
+    one, = bams('one.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + one + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2', '--metrics', 'json'], port = mockigv['port'])
+    summary = json.load(open(rundir + '/autoIGVmetrics.json'))
+    assert summary['snapshots'] == 1
+    assert summary['loads'][one]['count'] == 1
@@ -0,0 +1,12 @@
+import autoIGV
+
+def test_the_last_file_on_a_line_counts(bams):
+    one, two = bams('one.bam', 'two.bam')
+    assert autoIGV.multibamlist(['1:100\t' + one + '\t' + two + '\n'], set())  #lines come from the file with their endings still on
+    assert autoIGV.multibamlist(['1:100\t' + one + '\t' + two + '\r\n'], set())
+    assert not autoIGV.multibamlist(['1:100\t' + one + '\n', '1:200\t' + two + '\n'], set())
+
+def test_bad_files_and_loci_do_not_count(bams):
+    one, two = bams('one.bam', 'two.bam')
+    assert not autoIGV.multibamlist(['1:100\t' + one + '\t' + two + '\n'], set([two]))
+    assert not autoIGV.multibamlist(['nowhere\t' + one + '\t' + two + '\n'], set())
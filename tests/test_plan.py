@@ -0,0 +1,38 @@
+import re
+
+import autoIGV
+
+def test_planrun_counts_commands_loads_and_images():
+    steps = [('goto', '1:100', 1, '1:100', None), ('tracks', ('/a.bam', '/b.bam'), 1, '1:100', None), ('snapshot', 'g.png', 1, '1:100', 'all'),
+             ('goto', '1:200', 2, '1:200', None), ('tracks', ('/a.bam',), 2, '1:200', None), ('snapshot', 'h.png', 2, '1:200', 'all'),
+             ('new', None, 2, '1:200', '/c.bam'), ('load', '/c.bam', 2, '1:200', '/c.bam'), ('snapshot', 's.png', 2, '1:200', '/c.bam')]
+    plan = autoIGV.planrun(steps, autoIGV.newplan())
+    assert plan['loads'] == {'/a.bam' : 1, '/b.bam' : 1, '/c.bam' : 1}  #the second tracks step only removes one
+    assert plan['commands']['remove'] == 1
+    assert plan['images'] == {'group' : 2, 'single' : 1}
+    assert plan['imaged'] == set([1, 2])
+
+def test_estimateseconds_uses_each_files_own_loads():
+    plan = {'commands' : {'load' : 3, 'goto' : 10, 'echo' : 1}, 'loads' : {'/slow.bam' : 1, '/other.bam' : 2}}
+    timings = {'commands' : {'load' : [4, 4.0], 'goto' : [5, 0.5]}, 'loads' : {'/slow.bam' : [1, 30.0]}, 'files' : ['x']}
+    seconds, missing = autoIGV.estimateseconds(plan, timings)
+    assert abs(seconds - (30.0 + 2 * 1.0 + 10 * 0.1)) < 1e-9
+    assert missing == ['echo']
+
+def test_describeseconds():
+    assert autoIGV.describeseconds(12.34) == '12.3 seconds'
+    assert autoIGV.describeseconds(125) == '2 min 5 s'
+    assert autoIGV.describeseconds(7380) == '2 h 3 min'
+
+def test_the_plan_matches_the_run(runautoigv, mockigv, bams, tmp_path):
+    one, two, three = bams('one.bam', 'two.bam', 'three.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + one + '\t' + two + '\n1:2000\t' + one + '\t' + three + '\n2:500\t' + three + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '3', '-t', '--plan'], port = mockigv['port'])
+    assert not mockigv['counts']  #nothing was sent to IGV
+    assert rundir is None  #and nothing was made
+    planned = dict(re.findall(r'^\t(\w+) +(\d+)$', finished.stdout, re.MULTILINE))
+    assert int(planned['snapshot']) == 7  #a group and two singles on each of the first two lines, and one single on the last
+    runautoigv(['-f', str(targets), '-m', '3', '-t'], port = mockigv['port'])
+    for command in ('load', 'snapshot', 'goto', 'remove', 'new'):
+        assert int(planned.get(command, 0)) == mockigv['counts'].get(command, 0), command
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+import autoIGV
+import mockIGV
+
+@pytest.fixture
+def twoigvs():  #two stand-in IGV instances sharing one set of counts
+    settings = mockIGV.newsettings()
+    listeners = mockIGV.startservers([0, 0], settings)
+    settings['ports'] = [listener.getsockname()[1] for listener in listeners]
+    yield settings
+    for listener in listeners:
+        listener.close()
+
+def test_endpointlist_pairs_hosts_and_ports():
+    assert autoIGV.endpointlist(['a', 'b'], [1, 2]) == [('a', 1), ('b', 2)]
+    assert autoIGV.endpointlist(['a'], [1, 2]) == [('a', 1), ('a', 2)]
+    assert autoIGV.endpointlist(['a', 'b'], [1]) == [('a', 1), ('b', 1)]
+
+def test_leftover_worker_directories_are_merged(tmp_path):
+    for worker in ('worker1', 'worker2'):
+        (tmp_path / worker).mkdir()
+        (tmp_path / worker / (worker + '.png')).write_bytes(b'')
+    (tmp_path / 'workers').mkdir()  #not one of ours
+    autoIGV.mergeworkerdirs(str(tmp_path), autoIGV.leftoverworkerdirs(str(tmp_path)))
+    assert sorted(os.listdir(str(tmp_path))) == ['worker1.png', 'worker2.png', 'workers']
+
+def test_a_run_is_shared_between_instances(runautoigv, twoigvs, bams, tmp_path):
+    files = bams(*['sample' + str(number) + '.bam' for number in range(0, 6)])
+    targets = tmp_path / 'targets.txt'
+    targets.write_text(''.join(['1:' + str(1000 * (number + 1)) + '\t' + bam + '\n' for number, bam in enumerate(files)]))
+    ports = [str(port) for port in twoigvs['ports']]
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2', '-r', ports[0], '-r', ports[1]], port = ports[0])
+    assert 'Sharing the run between 2 IGV instances.' in finished.stdout
+    assert twoigvs['counts']['echo'] == 2  #each instance was connected to
+    images = sorted([name for name in os.listdir(rundir) if name.endswith('.png')])
+    assert len(images) == 6
+    assert not autoIGV.leftoverworkerdirs(rundir)
@@ -0,0 +1,26 @@
+import autoIGV
+
+def test_checkbam(tmp_path):
+    indexed = tmp_path / 'indexed.bam'
+    indexed.write_bytes(b'')
+    (tmp_path / 'indexed.bam.bai').write_bytes(b'')
+    samename = tmp_path / 'samename.bam'
+    samename.write_bytes(b'')
+    (tmp_path / 'samename.bai').write_bytes(b'')
+    unindexed = tmp_path / 'unindexed.bam'
+    unindexed.write_bytes(b'')
+    assert autoIGV.checkbam(str(indexed)) == ''
+    assert autoIGV.checkbam(str(samename)) == ''
+    assert autoIGV.checkbam(str(unindexed)) == autoIGV.noindex
+    assert autoIGV.checkbam(str(tmp_path / 'missing.bam')) == 'missing'
+    assert autoIGV.checkbam(str(tmp_path / 'reads.cram')) == 'not a BAM file'
+
+def test_an_unindexed_bam_is_only_a_warning(tmp_path, capsys):
+    good = tmp_path / 'good.bam'
+    good.write_bytes(b'')
+    checked = autoIGV.preflight([str(good), str(tmp_path / 'missing.bam')], 4)
+    assert checked == {str(good) : autoIGV.noindex, str(tmp_path / 'missing.bam') : 'missing'}
+    assert autoIGV.reportbams(checked) == set([str(tmp_path / 'missing.bam')])
+    assert 'WARNING: 1 of 2 BAM files have no .bai or .csi index' in capsys.readouterr().out
+    assert autoIGV.bamfile(str(good), checked)
+    assert not autoIGV.bamfile(str(tmp_path / 'missing.bam'), checked)
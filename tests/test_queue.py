@@ -0,0 +1,118 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import autoIGV
+
+def chunk(line):
+    return [('goto', '1:' + str(line), line, '1:' + str(line), None), ('tracks', ('a.bam', 'b.bam'), line, '1:' + str(line), None), ('snapshot', '1c' + str(line) + 'all.png', line, '1:' + str(line), 'all')]
+
+def status(queuefile, task):
+    queue = autoIGV.openqueue(queuefile)
+    answer = queue.execute('SELECT status, attempts FROM tasks WHERE id = ?', (task,)).fetchone()
+    queue.close()
+    return answer
+
+def test_tasks_come_back_as_they_went_in(tmp_path):
+    queuefile = str(tmp_path / 'queue.db')
+    assert autoIGV.enqueuetasks(queuefile, [chunk(1), chunk(2)], {'genome' : 'hg19', 'directory' : str(tmp_path)}) == 2
+    assert autoIGV.queuesettings(queuefile)['genome'] == 'hg19'
+    queue = autoIGV.openqueue(queuefile)
+    task, steps = autoIGV.leasetask(queue, 'worker', 60)
+    assert steps == chunk(1)  #the tracks step gets its tuple back
+    autoIGV.finishtask(queue, task, 'worker', True)
+    assert autoIGV.leasetask(queue, 'worker', 60)[1] == chunk(2)
+    assert autoIGV.leasetask(queue, 'worker', 60) is None
+    assert autoIGV.queuecounts(queue) == {'done' : 1, 'leased' : 1}
+    queue.close()
+
+def test_a_task_handed_back_too_often_is_given_up_on(tmp_path):
+    queuefile = str(tmp_path / 'queue.db')
+    autoIGV.enqueuetasks(queuefile, [chunk(1)], {'genome' : 'hg19'})
+    queue = autoIGV.openqueue(queuefile)
+    for attempt in range(0, 3):
+        task, steps = autoIGV.leasetask(queue, 'worker', 60)
+        autoIGV.finishtask(queue, task, 'worker', False)
+    assert status(queuefile, task) == ('failed', 3)
+    assert autoIGV.leasetask(queue, 'worker', 60) is None
+    queue.close()
+
+def test_an_expired_lease_goes_to_someone_else(tmp_path):
+    queuefile = str(tmp_path / 'queue.db')
+    autoIGV.enqueuetasks(queuefile, [chunk(1)], {'genome' : 'hg19'})
+    queue = autoIGV.openqueue(queuefile)
+    task, steps = autoIGV.leasetask(queue, 'lost', 0.01)
+    time.sleep(0.05)
+    assert autoIGV.leasetask(queue, 'other', 60)[0] == task
+    autoIGV.finishtask(queue, task, 'lost', True)  #too late: it is not ours any more
+    assert status(queuefile, task)[0] == 'leased'
+    queue.close()
+
+def test_workers_can_take_tasks_while_the_list_is_still_being_queued(tmp_path):
+    queuefile = str(tmp_path / 'queue.db')
+    seen = []
+    def chunks():
+        for line in range(1, 8):
+            if line == 6:  #by now the first batch is in, so a worker can get at it straight away
+                other = sqlite3.connect(queuefile, timeout = 0.5)
+                seen.append(other.execute('SELECT COUNT(*) FROM tasks').fetchone()[0])
+                other.execute('BEGIN IMMEDIATE')
+                other.execute('COMMIT')
+                other.close()
+            yield chunk(line)
+    assert autoIGV.enqueuetasks(queuefile, chunks(), {'genome' : 'hg19'}, batch = 5) == 7
+    assert seen == [5]
+
+def test_renewlease_keeps_going_when_the_database_is_busy(tmp_path):
+    queuefile = str(tmp_path / 'queue.db')
+    autoIGV.enqueuetasks(queuefile, [chunk(1)], {'genome' : 'hg19'})
+    queue = autoIGV.openqueue(queuefile)
+    task, steps = autoIGV.leasetask(queue, 'worker', 0.3)
+    blocker = sqlite3.connect(queuefile, isolation_level = None)
+    blocker.execute('BEGIN EXCLUSIVE')
+    stop = threading.Event()
+    original = autoIGV.openqueue
+    renewer = threading.Thread(target = autoIGV.renewlease, args = (queuefile, task, 'worker', 0.3, stop))
+    autoIGV.openqueue = lambda queuefile: sqlite3.connect(queuefile, timeout = 0.01, isolation_level = None)  #so that a locked database is noticed right away
+    try:
+        renewer.start()
+        time.sleep(0.25)  #a couple of renewals fail while the database is locked
+        blocker.execute('COMMIT')
+        time.sleep(0.25)
+        assert renewer.is_alive()
+        lease = queue.execute('SELECT leaseuntil FROM tasks WHERE id = ?', (task,)).fetchone()[0]
+        assert lease > time.time()
+    finally:
+        stop.set()
+        renewer.join()
+        autoIGV.openqueue = original
+        blocker.close()
+        queue.close()
+
+def test_one_bad_task_does_not_stop_the_worker(tmp_path, monkeypatch):
+    queuefile = str(tmp_path / 'queue.db')
+    autoIGV.enqueuetasks(queuefile, [chunk(1), chunk(2)], {'genome' : 'hg19'})
+    photographed = []
+    def supervise(steps, igv, position, badbams, askcontinue, label, session):
+        if steps[-1][2] == 1:
+            raise autoIGV.IGVError('IGV would not take this one')
+        photographed.append(steps[-1][2])
+    monkeypatch.setattr(autoIGV, 'supervise', supervise)
+    monkeypatch.setattr(autoIGV, 'reconnect', lambda session, label: True)
+    session = autoIGV.newsession(socket.socket(), ('localhost', 0), 'hg19', str(tmp_path))
+    failures = []
+    autoIGV.queueworker(session, '', queuefile, 'worker', 60, {}, set(), failures)
+    assert photographed == [2]
+    assert failures == []
+    assert status(queuefile, 1) == ('failed', 3)
+
+def test_a_clustered_run_can_be_queued(runautoigv, mockigv, bams, tmp_path):
+    bam, = bams('sample.bam')
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + bam + '\n1:1050\t' + bam + '\n')
+    queuefile = str(tmp_path / 'queue.db')
+    finished, rundir = runautoigv(['-f', str(targets), '-m', '2', '--cluster', '100', '--enqueue', queuefile], port = mockigv['port'])
+    assert '1 tasks queued' in finished.stdout
+    assert os.path.isfile(rundir + '/autoIGVmanifest.txt')  #closed along with the queue rather than left to crash the coordinator
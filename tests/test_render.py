@@ -0,0 +1,65 @@
+import pytest
+
+import autoIGV
+
+numpy = pytest.importorskip('numpy')
+
+contigs = [('chr1', 100000)]
+
+def samplereads():
+    reads = [(0, start, [('M', 20)], 'A' * 20, 0) for start in range(100, 105)]  #five overlapping reads, each needing a row of its own
+    reads.append((0, 200, [('M', 20)], 'C' * 20, 0))  #fits back in the first row
+    reads.append((0, 300, [('M', 5), ('D', 3), ('M', 5)], 'G' * 10, 0))
+    reads.append((0, 320, [('M', 5), ('I', 2), ('M', 5)], 'T' * 12, 0))
+    return reads
+
+def test_processcounts():
+    assert autoIGV.processcounts(8, False) == (8, 4)
+    assert autoIGV.processcounts(8, True) == (6, 2)  #render and review together share the CPUs
+    assert autoIGV.processcounts(8, True, renderprocesses = 7) == (7, 1)
+    assert autoIGV.processcounts(8, True, reviewprocesses = 4) == (4, 4)
+    assert autoIGV.processcounts(1, True) == (1, 1)
+    assert autoIGV.processcounts(8, True, 3, 3) == (3, 3)
+
+def test_pileup_stacks_reads_into_rows(makebam):
+    bam = makebam('reads.bam', contigs, samplereads())
+    pile = autoIGV.pileup(bam, '1', 90, 340, 3)
+    assert pile['rows'] == 3
+    assert len(pile['blocks']) == 3 + 1 + 2 + 2  #two of the five overlapping reads are past the last row
+    rows, positions, codes = pile['bases']
+    assert (positions == 20).sum() == 5  #every read still counts towards coverage
+    assert (rows[positions == 20] == -1).sum() == 2
+    assert set(codes[positions == 110].tolist()) == set([1])  #the read at 200 is all C
+    assert pile['gaps'].tolist() == [[0, 215, 218]]
+    assert pile['insertions'].tolist() == [[0, 235]]
+
+def test_pileup_needs_an_index(tmp_path):
+    bam = tmp_path / 'noindex.bam'
+    bam.write_bytes(b'')
+    assert autoIGV.pileup(str(bam), '1', 0, 100, 10) is None
+
+def test_renderimage_draws_every_track_and_panel(makebam, tmp_path):
+    bam = makebam('reads.bam', contigs, samplereads())
+    settings = autoIGV.rendersettings(width = 400)
+    filename = str(tmp_path / 'image.png')
+    assert autoIGV.renderimage('1:110 1:305', [bam, bam], filename, settings) is None
+    image = autoIGV.readpng(filename)
+    assert image.shape[1] == 400
+    assert image.shape[0] > 2 * settings['coverageheight']
+    assert (image == settings['colors']['separator']).all(axis = 2).any()
+    assert autoIGV.renderimage('1:110', [str(tmp_path / 'missing.bam')], filename, settings).startswith('no index')
+
+def test_rendertasks_follow_the_loaded_tracks():
+    steps = [('goto', '1:100', 1, '1:100', None), ('new', None, 1, '1:100', None), ('load', '/a.bam', 1, '1:100', '/a.bam'), ('load', '/b.bam', 1, '1:100', '/b.bam'), ('snapshot', 'x.png', 1, '1:100', 'all')]
+    tasks = list(autoIGV.rendertasks([steps], '/out'))
+    assert tasks == [('1:100', ['/a.bam', '/b.bam'], '/out/x.png', steps[-1], True)]
+
+def test_a_locus_near_the_start_of_a_contig_is_still_drawn(makebam, tmp_path):
+    reads = [(0, start, [('M', 20)], 'A' * 20, 0) for start in range(0, 40, 10)] + [(0, 20000, [('M', 20)], 'C' * 20, 0)]  #reads in two 16 kb windows of the index
+    bam = makebam('reads.bam', contigs, reads)
+    assert len(autoIGV.pileup(bam, '1', -41, 60, 10)['bases'][0]) == len(autoIGV.pileup(bam, '1', 0, 60, 10)['bases'][0]) == 80
+    settings = autoIGV.rendersettings(width = 200)
+    filename = str(tmp_path / 'image.png')
+    assert autoIGV.renderimage('1:10', [bam], filename, settings) is None
+    image = autoIGV.readpng(filename)
+    assert not (image[:settings['coverageheight']] == settings['colors']['background']).all()  #the coverage of the reads at the start is there
@@ -0,0 +1,43 @@
+import autoIGV
+
+def steps(line, locus, bams, stackshot, singleshot):  #compiles one line the way the run does, with bam files that are taken to be good
+    checked = {bam : '' for bam in bams}  #an empty reason means nothing is wrong with the file
+    return autoIGV.compileline([locus] + bams, line, stackshot, singleshot, False, set(), checked = checked)[0]
+
+def snapshots(chunk):
+    return [step[1] for step in chunk if step[0] == 'snapshot']
+
+def test_nothing_done_leaves_the_chunk_alone():
+    chunk = steps(1, '1:1000', ['a.bam', 'b.bam'], True, True)
+    assert autoIGV.skipfinished(chunk, set()) == chunk
+
+def test_everything_done_leaves_nothing():
+    chunk = steps(1, '1:1000', ['a.bam', 'b.bam'], True, True)
+    done = {autoIGV.journalkey(step) for step in chunk if step[0] == 'snapshot'}
+    assert autoIGV.skipfinished(chunk, done) == []
+
+def test_single_photos_after_a_finished_one_keep_their_goto():  #mode 2: the first single photo is done, but the second one still has to be taken at this line's locus
+    chunk = steps(1, '1:1000', ['a.bam', 'b.bam'], False, True)
+    done = {('1', '1:1000', 'a.bam', 'single')}
+    remaining = autoIGV.skipfinished(chunk, done)
+    assert snapshots(remaining) == ['1c1000b.bam.png']
+    assert remaining[0] == ('goto', '1:1000', 1, '1:1000', None)
+    assert [step[0] for step in remaining] == ['goto', 'new', 'load', 'collapse', 'snapshot']
+
+def test_every_remaining_photo_comes_after_a_goto_to_its_own_locus():
+    chunk = steps(1, '1:1000', ['a.bam', 'b.bam'], False, True) + steps(2, '2:500', ['a.bam', 'b.bam', 'c.bam'], True, True)
+    done = {('1', '1:1000', 'a.bam', 'single'), ('1', '1:1000', 'b.bam', 'single'), ('2', '2:500', 'a.bam', 'single')}
+    remaining = autoIGV.skipfinished(chunk, done)
+    locus = None
+    for step in remaining:
+        if step[0] == 'goto':
+            locus = step[1]
+        elif step[0] == 'snapshot':
+            assert locus == step[3]
+    assert '1:1000' not in [step[1] for step in remaining if step[0] == 'goto']  #nothing is left on line 1, so its goto goes too
+
+def test_unfinishedchunks_drops_finished_chunks():
+    first = steps(1, '1:1000', ['a.bam'], False, True)
+    second = steps(2, '1:2000', ['a.bam'], False, True)
+    done = {('1', '1:1000', 'a.bam', 'single')}
+    assert list(autoIGV.unfinishedchunks([first, second], done)) == [second]
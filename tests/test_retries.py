@@ -0,0 +1,30 @@
+import socket
+
+import pytest
+
+import autoIGV
+
+def test_choosing_to_stop_is_not_retried(mockigv, bams, tmp_path):
+    mockigv['failpatterns'].append('broken')
+    good, broken = bams('good.bam', 'broken.bam')
+    session = autoIGV.opensession('localhost', mockigv['port'], 'hg19', str(tmp_path), {'retries' : 2, 'igvcommand' : None, 'onerror' : 'stop'})
+    with pytest.raises(autoIGV.IGVStopped):
+        autoIGV.photograph(session, ['1:1000\t' + broken + '\t' + good], 2)
+    assert mockigv['counts']['echo'] == 1  #never reconnected
+    autoIGV.closesession(session)
+
+def test_stopping_is_still_an_igverror():
+    assert issubclass(autoIGV.IGVStopped, autoIGV.IGVError)
+
+def test_a_lost_connection_is_retried(mockigv, bams, tmp_path):
+    good, = bams('good.bam')
+    session = autoIGV.opensession('localhost', mockigv['port'], 'hg19', str(tmp_path), {'retries' : 1, 'igvcommand' : None, 'onerror' : 'skip'})
+    session['igv'].shutdown(socket.SHUT_RDWR)  #as if IGV had gone away since the last job
+    images = autoIGV.photograph(session, ['1:1000\t' + good], 2)
+    assert [image.rsplit('/', 1)[-1] for image in images] == ['1c1000good.bam.png']
+    assert mockigv['counts']['echo'] == 2
+    autoIGV.closesession(session)
+
+def test_commandtimeout_grows_with_each_retry():
+    assert autoIGV.commandtimeout(None, 'goto', attempt = 1) == 2 * autoIGV.commandtimeout(None, 'goto')
+    assert autoIGV.commandtimeout(None, 'goto', attempt = 10) == 600
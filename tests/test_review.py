@@ -0,0 +1,112 @@
+import json
+import os
+import struct
+import zlib
+
+import pytest
+
+import autoIGV
+
+numpy = pytest.importorskip('numpy')
+
+def chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def filtered(image, channels, colortype):  #encodes an image the way IGV's PNG writer might, with a different filter on each row
+    height, stride = image.shape[0], image.shape[1] * channels
+    rows = image.reshape(height, stride).astype(int)
+    def paeth(left, up, upperleft):
+        estimate = left + up - upperleft
+        distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upperleft))
+        if distances[0] <= distances[1] and distances[0] <= distances[2]:
+            return left
+        return up if distances[1] <= distances[2] else upperleft
+    raw = b''
+    previous = [0] * stride
+    for number in range(0, height):
+        kind = number % 5
+        row = rows[number].tolist()
+        output = []
+        for byte in range(0, stride):
+            left = row[byte - channels] if byte >= channels else 0
+            upperleft = previous[byte - channels] if byte >= channels else 0
+            predicted = [0, left, previous[byte], (left + previous[byte]) // 2, paeth(left, previous[byte], upperleft)][kind]
+            output.append((row[byte] - predicted) % 256)
+        raw += bytes([kind] + output)
+        previous = row
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', image.shape[1], height, 8, colortype, 0, 0, 0)) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
+
+@pytest.mark.parametrize('channels, colortype', [(3, 2), (4, 6), (1, 0)])
+def test_readpng_undoes_every_filter(tmp_path, channels, colortype):
+    image = numpy.random.default_rng(channels).integers(0, 256, (23, 37, channels), dtype = numpy.uint8)
+    filename = str(tmp_path / 'filtered.png')
+    open(filename, 'wb').write(filtered(image, channels, colortype))
+    expected = image[:, :, :3] if channels >= 3 else numpy.repeat(image, 3, axis = 2)
+    assert (autoIGV.readpng(filename) == expected).all()
+
+def test_writepng_and_readpng_round_trip(tmp_path):
+    image = numpy.random.default_rng(1).integers(0, 256, (17, 29, 3), dtype = numpy.uint8)
+    filename = str(tmp_path / 'round.png')
+    autoIGV.writepng(filename, image)
+    assert autoIGV.goodimage(filename)
+    assert not os.path.exists(filename + '.partial')
+    assert (autoIGV.readpng(filename) == image).all()
+
+def test_a_png_without_a_header_is_a_valueerror(tmp_path):
+    filename = str(tmp_path / 'headless.png')
+    open(filename, 'wb').write(b'\x89PNG\r\n\x1a\n' + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + chunk(b'IEND', b''))
+    with pytest.raises(ValueError):
+        autoIGV.readpng(filename)
+    assert autoIGV.makethumbnail(filename, str(tmp_path / 'thumbnail.png'), 250) == (None, 'no IHDR chunk')
+
+def test_shrinkimage_averages_blocks():
+    image = numpy.zeros((4, 8, 3), dtype = numpy.uint8)
+    image[:, ::2] = 200
+    shrunk = autoIGV.shrinkimage(image, 4)
+    assert shrunk.shape == (2, 4, 3)
+    assert (shrunk == 100).all()
+
+def test_makesheet_puts_the_group_photo_on_top(tmp_path):
+    pictures = []
+    for number, size in enumerate([(10, 40), (8, 12), (8, 12)]):
+        filename = str(tmp_path / (str(number) + '.png'))
+        autoIGV.writepng(filename, numpy.full(size + (3,), number * 50, dtype = numpy.uint8))
+        pictures.append(filename)
+    sheet = str(tmp_path / 'sheet.png')
+    assert autoIGV.makesheet(pictures, sheet, gap = 4) is None
+    image = autoIGV.readpng(sheet)
+    assert image.shape == (4 + 10 + 4 + 8 + 4, 4 + 40 + 4, 3)
+    assert (image[18:26, 20:32] == 100).all()  #the second single photo, beside the first under the group photo
+
+def review(directory, archive = None):
+    for name, shade in (('1c1000all.png', 10), ('1c1000a.bam.png', 20), ('2c500a.bam.png', 30)):
+        autoIGV.writepng(directory + '/' + name, numpy.full((30, 60, 3), shade, dtype = numpy.uint8))
+    journal = autoIGV.openjournal(directory, set(), {})
+    journal['review'] = autoIGV.openreview(directory, 1, archive, width = 20)
+    journal['archive'] = archive
+    autoIGV.recordsnapshot(journal, ('snapshot', '1c1000a.bam.png', 1, '1:1000', '/data/a.bam'))
+    autoIGV.recordsnapshot(journal, ('snapshot', '1c1000all.png', 1, '1:1000', 'all'))
+    autoIGV.recordsnapshot(journal, ('snapshot', '2c500a.bam.png', 2, '2:500', '/data/a.bam'))
+    autoIGV.closereview(journal['review'])
+    journal['file'].close()
+    return journal['review']
+
+def test_the_review_index_lists_every_locus_and_sample(tmp_path):
+    finished = review(str(tmp_path))
+    assert finished['error'] is None
+    index = json.load(open(str(tmp_path / 'autoIGVreview' / 'review.json')))
+    assert index['loci']['1:1000']['images'] == ['1c1000all.png', '1c1000a.bam.png']  #group photo first
+    assert index['loci']['1:1000']['sheet'] == 'sheets/1c1000.png'
+    assert index['samples'] == {'a' : ['1:1000', '2:500']}
+    assert autoIGV.readpng(str(tmp_path / 'autoIGVreview' / 'thumbnails' / '1c1000all.png')).shape == (10, 20, 3)
+    assert os.path.isfile(str(tmp_path / 'autoIGVreview' / 'page0001.html'))
+
+def test_a_broken_review_still_hands_images_to_the_packer(tmp_path, monkeypatch):
+    def broken(*arguments):
+        raise RuntimeError('something unexpected')
+    monkeypatch.setattr(autoIGV, 'reviewimage', broken)
+    archive = autoIGV.openarchive(str(tmp_path), 1000000)
+    finished = review(str(tmp_path), archive)
+    autoIGV.closearchive(archive)
+    assert finished['error'] == 'something unexpected'
+    assert sorted(autoIGV.readarchiveindex(str(tmp_path))) == ['1c1000a.bam.png', '1c1000all.png', '2c500a.bam.png']
@@ -0,0 +1,54 @@
+import threading
+
+import autoIGV
+
+def groupchunk(linecount, locus, bams):  #a group photo chunk as compilerun makes them with track reuse
+    return [('goto', locus, linecount, locus, 'all'), ('tracks', tuple(bams), linecount, locus, 'all'), ('snapshot', str(linecount) + '.png', linecount, locus, 'all')]
+
+def newstage(tmp_path):
+    return autoIGV.openstage(str(tmp_path / 'stage'), 1000, 2, 'samtools')
+
+def fakeslicer(calls):  #stands in for slicebam, naming each slice after the call that made it
+    lock = threading.Lock()
+    def slicebam(stage, bam, loci):
+        with lock:
+            calls.append((bam, list(loci)))
+            return '/stage/' + str(len(calls)) + '/' + bam.rsplit('/', 1)[-1]
+    return slicebam
+
+def test_chunkregions():
+    regions = autoIGV.chunkregions(groupchunk(1, '1:100 2:200', ['/a.bam', '/b.bam']))
+    assert regions == {'/a.bam' : ['1:100', '2:200'], '/b.bam' : ['1:100', '2:200']}
+
+def test_restage_only_swaps_what_is_loaded():
+    steps = groupchunk(1, '1:100', ['/a.bam', '/b.bam']) + [('load', '/c.bam', 1, '1:100', '/c.bam')]
+    staged = autoIGV.restage(steps, {'/a.bam' : '/stage/a.bam', '/b.bam' : None, '/c.bam' : '/stage/c.bam'})
+    assert staged[1][1] == ('/stage/a.bam', '/b.bam')
+    assert staged[3] == ('load', '/stage/c.bam', 1, '1:100', '/c.bam')
+    assert staged[2] == steps[2]
+
+def test_a_run_of_chunks_shares_its_slices(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(autoIGV, 'slicebam', fakeslicer(calls))
+    chunks = [groupchunk(1, '1:100', ['/a.bam']), groupchunk(2, '1:200', ['/a.bam']), groupchunk(3, '1:300', ['/b.bam'])]
+    staged = list(autoIGV.stagedchunks(chunks, newstage(tmp_path)))
+    assert staged[0][1][1] == staged[1][1][1]  #the same slice, so the tracks can stay loaded
+    assert staged[2][1][1] != staged[0][1][1]
+    assert sorted(calls) == [('/a.bam', ['1:100', '1:200']), ('/b.bam', ['1:300'])]
+
+def test_runs_are_capped(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(autoIGV, 'slicebam', fakeslicer(calls))
+    chunks = [groupchunk(count, '1:' + str(count * 100), ['/a.bam']) for count in range(1, 6)]
+    staged = list(autoIGV.stagedchunks(chunks, newstage(tmp_path), runlimit = 2))
+    assert len(staged) == 5
+    assert sorted([len(loci) for bam, loci in calls]) == [1, 2, 2]
+
+def test_stopping_early_shuts_down_the_threads(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(autoIGV, 'slicebam', fakeslicer(calls))
+    before = threading.active_count()
+    staged = autoIGV.stagedchunks([groupchunk(count, '1:' + str(count * 100), ['/' + str(count) + '.bam']) for count in range(1, 20)], newstage(tmp_path))
+    next(staged)
+    staged.close()
+    assert threading.active_count() == before
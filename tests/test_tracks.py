@@ -0,0 +1,31 @@
+import autoIGV
+
+def groupline(line, locus, bams):  #compiles one line's group photo the way --groupbytracks does
+    checked = {bam : '' for bam in bams}
+    return autoIGV.compileline([locus] + bams, line, True, False, False, set(), reusetracks = True, checked = checked)[0]
+
+def test_no_chunks_gives_no_chunks():
+    assert autoIGV.groupchunksbytracks([]) == []
+
+def test_lines_with_the_same_tracks_end_up_together():
+    chunks = [groupline(1, '1:100', ['a.bam', 'b.bam']), groupline(2, '1:200', ['c.bam']), groupline(3, '1:300', ['a.bam', 'b.bam'])]
+    grouped = autoIGV.groupchunksbytracks(chunks)
+    assert len(grouped) == 2
+    assert [step[2] for step in grouped[0] if step[0] == 'snapshot'] == [1, 3]
+
+def test_a_shared_set_of_tracks_is_still_split_up_for_a_pool():
+    chunks = [groupline(line, '1:' + str(line * 100), ['a.bam', 'b.bam']) for line in range(1, 121)]
+    grouped = autoIGV.groupchunksbytracks(chunks, 50)
+    assert [len([step for step in steps if step[0] == 'snapshot']) for steps in grouped] == [50, 50, 20]
+    assert [step for steps in grouped for step in steps] == [step for steps in chunks for step in steps]  #nothing lost or reordered
+
+def test_trackchanges_only_touches_what_differs():
+    assert autoIGV.trackchanges(['a.bam', 'b.bam'], ('a.bam', 'b.bam')) == []
+    changes = autoIGV.trackchanges(['a.bam', 'b.bam'], ('a.bam', 'c.bam'))
+    assert ('load', 'c.bam') in changes
+    assert not [change for change in changes if change[1] == 'a.bam']
+
+def test_trackchanges_from_nothing_loaded_only_loads():
+    assert autoIGV.trackchanges([], ('a.bam', 'b.bam')) == [('load', 'a.bam'), ('load', 'b.bam')]  #known to be empty, so there is nothing to clear
+    assert autoIGV.trackchanges(None, ('a.bam',)) == [('new', None), ('load', 'a.bam')]  #unknown, so start over to be sure
+    assert autoIGV.trackchanges(['x.bam'], ('a.bam',)) == [('new', None), ('load', 'a.bam')]
@@ -0,0 +1,81 @@
+import autoIGV
+
+contigs = [('chr1', 1000000), ('chr2', 1000000)]
+
+def samplereads(count, alts):  #count reads over 1:1000, alts of them with a C there, one far away, and count reads on chr2 of which every other one is a duplicate
+    reads = []
+    for number in range(0, count):
+        start = 950 + number % 30
+        sequence = ['A'] * 100
+        if number < alts:
+            sequence[999 - start] = 'C'
+        cigar = [('M', 100)]
+        if number == count - 1 and count > 5:
+            cigar = [('M', 20), ('D', 5), ('M', 80)]  #a deletion away from the locus
+        reads.append((0, start, cigar, ''.join(sequence), 0))
+    reads.append((0, 5000, [('M', 100)], 'A' * 100, 0))
+    for number in range(0, count):
+        reads.append((1, 200000 + number, [('M', 50)], 'G' * 50, 0x400 if number % 2 else 0))
+    return sorted(reads, key = lambda read: (read[0], read[1]))
+
+def singlechunk(bam, locus, linecount = 1):
+    return [('new', None, linecount, locus, bam), ('load', bam, linecount, locus, bam), ('goto', locus, linecount, locus, bam), ('snapshot', str(linecount) + bam.rsplit('/', 1)[-1] + '.png', linecount, locus, bam)]
+
+def test_locuscoverage_counts_depth_and_alt(makebam):
+    deep = makebam('deep.bam', contigs, samplereads(40, 10))
+    triage = autoIGV.opentriage(1, 1)
+    assert autoIGV.locuscoverage(triage, deep, '1:1000') == (40, 10)
+    assert autoIGV.locuscoverage(triage, deep, 'chr1:1000') == (40, 10)
+    assert autoIGV.locuscoverage(triage, deep, '1:900-1100') == (40, None)  #a range counts every read overlapping it
+    assert autoIGV.locuscoverage(triage, deep, '2:200030') == (15, 0)  #duplicates are not counted
+    assert autoIGV.locuscoverage(triage, deep, '1:500000') == (0, 0)
+    assert autoIGV.locuscoverage(triage, deep, '3:100') == (0, 0)  #a contig the file does not have
+
+def test_countreads_across_blocks(makebam):
+    deep = makebam('deep.bam', contigs, samplereads(40, 10), perblock = 3)
+    index, references = autoIGV.bamindex(autoIGV.opentriage(), deep)
+    assert autoIGV.countreads(deep, index, references['chr1'], 999, 1000) == (40, 10)
+
+def test_no_index_is_never_left_out(tmp_path):
+    bam = tmp_path / 'noindex.bam'
+    bam.write_bytes(b'')
+    assert autoIGV.locuscoverage(autoIGV.opentriage(5), str(bam), '1:1000') is None
+
+def test_low_coverage_is_skipped_or_put_off(makebam):
+    deep = makebam('deep.bam', contigs, samplereads(40, 10))
+    low = makebam('low.bam', contigs, samplereads(3, 0))
+    chunks = [singlechunk(low, '1:1000', 1), singlechunk(deep, '1:1000', 2)]
+    triage = autoIGV.opentriage(10, 5, 'skip')
+    assert list(autoIGV.triagedchunks(iter(chunks), triage)) == [chunks[1]]
+    assert triage['skipped'] == 1 and triage['dropped'] == 1
+    triage = autoIGV.opentriage(10, 5, 'last')
+    taken = list(autoIGV.triagedchunks(iter(chunks), triage))
+    assert taken[0] == chunks[1]
+    assert [step[0] for step in taken[1]] == ['goto', 'new', 'load', 'snapshot'] and taken[1][-1] == chunks[0][-1]
+    assert triage['last'] == 1
+
+def test_triage_reads_ahead_lazily(makebam):
+    deep = makebam('deep.bam', contigs, samplereads(40, 10))
+    handed = []
+    def chunks():
+        for linecount in range(1, 100):
+            handed.append(linecount)
+            yield singlechunk(deep, '1:1000', linecount)
+    triaged = autoIGV.triagedchunks(chunks(), autoIGV.opentriage(10, 0, threads = 2))
+    next(triaged)
+    assert len(handed) <= 5  #only a few chunks ahead, so triage overlaps the photos instead of coming before all of them
+    triaged.close()
+
+def test_put_off_chunks_start_with_the_last_genome():
+    deferred = [[('genome', 'hg19', 1, '1:1', None), ('snapshot', 'a.png', 1, '1:1', 'x')], [('genome', 'hg19', 2, '1:2', None), ('snapshot', 'b.png', 2, '1:2', 'x')], [('genome', 'mm10', 3, '1:3', None), ('snapshot', 'c.png', 3, '1:3', 'x')]]
+    assert autoIGV.deferredorder(deferred) == [deferred[2], deferred[0], deferred[1]]
+    assert autoIGV.deferredorder(deferred[:2]) == deferred[:2]
+
+def test_a_triaged_run(runautoigv, mockigv, makebam, tmp_path):
+    deep = makebam('deep.bam', contigs, samplereads(40, 10))
+    low = makebam('low.bam', contigs, samplereads(3, 0))
+    targets = tmp_path / 'targets.txt'
+    targets.write_text('1:1000\t' + low + '\n1:1000\t' + deep + '\n')
+    finished, rundir = runautoigv(['-f', str(targets), '--mindepth', '10', '-m', '2'], port = mockigv['port'])
+    assert '1 photos skipped and 0 left until last' in finished.stdout
+    assert mockigv['counts']['snapshot'] == 1